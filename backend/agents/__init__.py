@@ -0,0 +1,27 @@
+import os
+
+
+def _load_env_file() -> None:
+    """Load the nearest .env above this package, importing python-dotenv only when there is one.
+
+    Runs before any agent module reads its configuration. Containers that get their settings
+    from the platform have no .env and skip the import entirely.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(directory, ".env")
+        if os.path.isfile(candidate):
+            break
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+    try:
+        from dotenv import load_dotenv
+    except ImportError:  # pragma: no cover
+        return
+    load_dotenv(candidate)
+
+
+_load_env_file()
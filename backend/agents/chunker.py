@@ -0,0 +1,73 @@
+import os
+import re
+from collections import deque
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+# Chunks are windows of this many sentences; consecutive windows on a page share SOP_CHUNK_OVERLAP sentences.
+# The defaults (one sentence, no overlap) keep the granularity retrieval has always used.
+SOP_CHUNK_SENTENCES = int(os.getenv("SOP_CHUNK_SENTENCES", "1"))
+SOP_CHUNK_OVERLAP = int(os.getenv("SOP_CHUNK_OVERLAP", "0"))
+
+# Paragraph breaks, or whitespace after sentence-ending punctuation.
+_SEPARATOR = re.compile(r"\n\s*\n|(?<=[.!?])\s+")
+
+
+class Chunk(NamedTuple):
+    text: str
+    page: int  # 1-based page number
+    start: int  # character offsets into that page's extracted text; text == page_text[start:end]
+    end: int
+
+
+def sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of each non-blank sentence or paragraph fragment, with surrounding whitespace trimmed."""
+    position = 0
+    for separator in _SEPARATOR.finditer(text):
+        span = _trim(text, position, separator.start())
+        if span is not None:
+            yield span
+        position = separator.end()
+    span = _trim(text, position, len(text))
+    if span is not None:
+        yield span
+
+
+def _trim(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+    fragment = text[start:end]
+    stripped = fragment.strip()
+    if not stripped:
+        return None
+    start += len(fragment) - len(fragment.lstrip())
+    return start, start + len(stripped)
+
+
+def iter_page_chunks(
+    pages: Iterable[str],
+    sentences: Optional[int] = None,
+    overlap: Optional[int] = None,
+) -> Iterator[Chunk]:
+    """Yield chunks page by page, so only the current page and one window are held at a time.
+
+    Windows never cross a page boundary, which keeps every citation on a single page.
+    """
+    size = max(1, SOP_CHUNK_SENTENCES if sentences is None else sentences)
+    stride = size - min(max(0, SOP_CHUNK_OVERLAP if overlap is None else overlap), size - 1)
+
+    for page_number, page_text in enumerate(pages, start=1):
+        window: "deque[Tuple[int, int]]" = deque(maxlen=size)
+        pending = 0  # sentences added since the last emitted window
+        for span in sentence_spans(page_text):
+            window.append(span)
+            pending += 1
+            if len(window) == size and pending >= stride:
+                yield _window_chunk(page_text, page_number, window)
+                pending = 0
+        # A short page, or sentences left after the last full window (plus the usual overlap).
+        if pending and (len(window) < size or pending < stride):
+            tail = min(len(window), pending + size - stride)
+            yield _window_chunk(page_text, page_number, list(window)[-tail:])
+
+
+def _window_chunk(page_text: str, page_number: int, window: Sequence[Tuple[int, int]]) -> Chunk:
+    start, end = window[0][0], window[-1][1]
+    return Chunk(page_text[start:end], page_number, start, end)
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from agents.metrics import record_llm_call
+
+# Default end-to-end latency budget per agent request; 0 means no budget (wait for the LLM as before).
+AGENT_LATENCY_BUDGET_SECONDS = float(os.getenv("AGENT_LATENCY_BUDGET_SECONDS", "0"))
+
+# Absolute time.monotonic() deadline of the request being served, if it has a budget.
+_deadline: ContextVar[Optional[float]] = ContextVar("agent_deadline", default=None)
+
+
+def start_request_budget(budget_seconds: Optional[float] = None) -> Token:
+    """Start the budget clock for the current request; falls back to AGENT_LATENCY_BUDGET_SECONDS."""
+    budget = AGENT_LATENCY_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+    return _deadline.set(time.monotonic() + budget if budget > 0 else None)
+
+
+def end_request_budget(token: Token) -> None:
+    _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+async def _run_fallback(fallback: Callable[[], Any], offload: bool) -> Any:
+    return await asyncio.to_thread(fallback) if offload else fallback()
+
+
+async def race_llm_with_fallback(
+    llm_call: Awaitable[Optional[Any]],
+    fallback: Callable[[], Any],
+    agent: str,
+    offload: bool = False,
+) -> Tuple[str, Any]:
+    """Return ("gemini", llm_result), or ("deterministic", fallback_result) if the LLM failed.
+
+    Without a request budget the LLM is awaited first and the fallback only runs if it fails.
+    With one, the fallback starts straight away (in a thread when ``offload``) and wins if the
+    LLM has not produced a usable result by the deadline; the LLM call is then cancelled and the
+    source is "deadline", since a longer budget might have got an LLM answer.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        result = await llm_call
+        if result:
+            return "gemini", result
+        return "deterministic", await _run_fallback(fallback, offload)
+
+    llm_task = asyncio.ensure_future(llm_call)
+    fallback_task = asyncio.ensure_future(_run_fallback(fallback, offload))
+    done, _ = await asyncio.wait({llm_task}, timeout=max(deadline - time.monotonic(), 0.0))
+    if llm_task in done:
+        if not llm_task.cancelled() and llm_task.exception() is None and llm_task.result():
+            fallback_task.cancel()
+            return "gemini", llm_task.result()
+        return "deterministic", await fallback_task
+
+    llm_task.cancel()
+    record_llm_call(agent, "deadline_exceeded")
+    return "deadline", await fallback_task
@@ -0,0 +1,110 @@
+import array
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CachedDocument:
+    """Parsed SOP document: its chunks, where each chunk came from, and the retrieval index over them."""
+
+    def __init__(
+        self,
+        doc_id: str,
+        characters: int,
+        chunks: List[str],
+        index: Any,
+        size_bytes: int,
+        locations: Optional[Sequence[int]] = None,
+    ):
+        self.doc_id = doc_id
+        self.characters = characters
+        self.chunks = chunks
+        # Flat (page, start, end) triples, one per chunk, as recorded by agents.chunker.
+        self.locations = locations if locations is not None else array.array("I")
+        self.index = index
+        self.size_bytes = size_bytes
+
+    def location(self, chunk_id: int) -> Optional[Tuple[int, int, int]]:
+        """(page, start, end) of a chunk, or None if the document was built without locations."""
+        position = 3 * chunk_id
+        if position + 3 > len(self.locations):
+            return None
+        return tuple(self.locations[position:position + 3])
+
+
+class DocumentCache:
+    """Thread-safe LRU cache bounded by entry count and approximate byte size."""
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedDocument]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, doc_id: str) -> Optional[CachedDocument]:
+        with self._lock:
+            document = self._entries.get(doc_id)
+            if document is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(doc_id)
+            self.hits += 1
+            return document
+
+    def put(self, document: CachedDocument) -> None:
+        with self._lock:
+            previous = self._entries.pop(document.doc_id, None)
+            if previous is not None:
+                self._bytes -= previous.size_bytes
+
+            # A single document larger than the whole budget is served but never retained.
+            if document.size_bytes > self.max_bytes:
+                return
+
+            self._entries[document.doc_id] = document
+            self._bytes += document.size_bytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size_bytes
+
+    def discard(self, doc_id: str) -> bool:
+        with self._lock:
+            document = self._entries.pop(doc_id, None)
+            if document is None:
+                return False
+            self._bytes -= document.size_bytes
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -1,15 +1,29 @@
+import asyncio
+import calendar
 import io
+import mimetypes
+import os
 import re
-from datetime import datetime
-from typing import Any, Dict, List, Optional
-
-from agents.llm_client import generate_json
-
-try:
-    from pypdf import PdfReader
-except ImportError:  # pragma: no cover
-    PdfReader = None
+import threading
+import time
+import zipfile
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
+from agents.deadline import race_llm_with_fallback
+from agents.doc_cache import content_hash
+from agents.llm_client import MODEL_NAME, generate_json, generate_json_async
+from agents.metrics import record_response, stage
+from agents.pdf_extract import extract_text
+from agents.result_cache import SQLiteResultCache
+from agents.uploads import (
+    SpooledUpload,
+    UploadData,
+    spool_stream,
+    upload_bytes,
+    upload_digest,
+    upload_head,
+    upload_source,
+)
 
 CURRENCY_MAP = {
     "$": "USD",
@@ -18,6 +32,32 @@ CURRENCY_MAP = {
     "₹": "INR",
 }
 
+INVOICE_CACHE_PATH = os.getenv("INVOICE_CACHE_PATH", "invoice_cache.db")
+INVOICE_CACHE_TTL_SECONDS = float(os.getenv("INVOICE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Deterministic results may only exist because Gemini was down; expire them sooner so they get upgraded.
+INVOICE_CACHE_FALLBACK_TTL_SECONDS = float(os.getenv("INVOICE_CACHE_FALLBACK_TTL_SECONDS", "3600"))
+INVOICE_CACHE_MAX_ENTRIES = int(os.getenv("INVOICE_CACHE_MAX_ENTRIES", "10000"))
+
+INVOICE_BATCH_CONCURRENCY = int(os.getenv("INVOICE_BATCH_CONCURRENCY", "4"))
+INVOICE_ARCHIVE_MAX_FILES = int(os.getenv("INVOICE_ARCHIVE_MAX_FILES", "500"))
+# Total uncompressed size; members are only unpacked (and spooled) once a batch worker picks them up.
+INVOICE_ARCHIVE_MAX_BYTES = int(os.getenv("INVOICE_ARCHIVE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+_INVOICE_NUMBER_RE = re.compile(r"invoice\s*(?:number|no|#)?\s*[:#-]?\s*([A-Z0-9-]+)", re.IGNORECASE)
+_DATE_RE = re.compile(r"\b(\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b")
+_YEAR_FIRST_DATE_RE = re.compile(r"(\d{4})([-/])(\d{1,2})\2(\d{1,2})")
+_YEAR_LAST_DATE_RE = re.compile(r"(\d{1,2})([-/])(\d{1,2})\2(\d{4})")
+_TOTAL_RE = re.compile(
+    r"(?:total\s*(?:due|amount)?|amount\s*due)\s*[:$€£₹]*\s*([0-9][0-9,]*\.?[0-9]{0,2})", re.IGNORECASE
+)
+_TAX_RE = re.compile(r"(?:tax|vat|gst)\s*[:$€£₹]*\s*([0-9][0-9,]*\.?[0-9]{0,2})", re.IGNORECASE)
+_CURRENCY_RE = re.compile(r"(USD|EUR|GBP|INR|AUD|CAD)\b|[$€£₹]", re.IGNORECASE)
+_CURRENCY_HINTS = ("$", "€", "£", "₹", "usd", "eur", "gbp", "inr", "aud", "cad")
+_AMOUNT_RE = re.compile(r"[0-9][0-9,]*\.?[0-9]{0,2}")
+
+_invoice_caches: Dict[str, SQLiteResultCache] = {}
+_invoice_caches_lock = threading.Lock()
+
 
 def _safe_float(value: str) -> Optional[float]:
     cleaned = value.replace(",", "").strip()
@@ -27,13 +67,10 @@ def _safe_float(value: str) -> Optional[float]:
         return None
 
 
-def _extract_text_from_pdf_bytes(file_data: bytes) -> str:
-    if PdfReader is None:
-        return ""
-
+def _extract_text_from_pdf_bytes(file_data: Union[bytes, str]) -> str:
     try:
-        reader = PdfReader(io.BytesIO(file_data))
-        return "\n".join((page.extract_text() or "") for page in reader.pages)
+        with stage("invoice", "pdf_extract"):
+            return extract_text(file_data)
     except Exception:
         return ""
 
@@ -50,69 +87,142 @@ def _normalize_invoice_result(data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def _normalize_date(raw_date: str) -> Optional[str]:
+    """Parse the formats YYYY-MM-DD, YYYY/MM/DD, MM/DD/YYYY, DD/MM/YYYY (and dashed) without strptime."""
+    match = _YEAR_FIRST_DATE_RE.fullmatch(raw_date)
+    if match:
+        candidates = [(int(match.group(1)), int(match.group(3)), int(match.group(4)))]
+    else:
+        match = _YEAR_LAST_DATE_RE.fullmatch(raw_date)
+        if not match:
+            return None
+        first, second, year = int(match.group(1)), int(match.group(3)), int(match.group(4))
+        # Month-first wins when both readings are valid, matching the old strptime format order.
+        candidates = [(year, first, second), (year, second, first)]
+
+    for year, month, day in candidates:
+        if year >= 1 and 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]:
+            return f"{year:04d}-{month:02d}-{day:02d}"
+    return None
+
+
+def _match_line_item(line: str) -> Optional[Dict[str, Any]]:
+    # Equivalent to ^([A-Za-z].*?)\s{2,}(amount)$ but without regex backtracking: the amount is the
+    # last whitespace-separated token and must follow a gap of at least two whitespace characters.
+    head_and_amount = line.rsplit(None, 1)
+    if len(head_and_amount) != 2:
+        return None
+
+    head, raw_amount = head_and_amount
+    first = head[0]
+    if not (first.isascii() and first.isalpha()) or len(line) - len(head) - len(raw_amount) < 2:
+        return None
+    if not _AMOUNT_RE.fullmatch(raw_amount):
+        return None
+
+    amount = _safe_float(raw_amount)
+    if amount is None:
+        return None
+    return {"description": head.strip(), "amount": amount}
+
+
+# How many lines a match of each pattern can cover. The lines are stripped and non-empty, so every
+# \s* run crosses at most one line break: the invoice-number and total patterns have three such runs
+# (label, qualifier, separator, value each on their own line), the tax pattern two.
+_INVOICE_NUMBER_LINES = 4
+_TOTAL_LINES = 4
+_TAX_LINES = 3
+
+
+def _search_line(pattern: re.Pattern, lines: List[str], position: int, span: int) -> Optional[re.Match]:
+    # Labels and values may be split across lines ("Invoice" / "No:" / "INV-77"), so search the next
+    # span lines together, which gives the same match as searching the whole text. Only matches that
+    # start on the current line are accepted; later ones are found on a later pass.
+    line = lines[position]
+    match = pattern.search("\n".join(lines[position:position + span]))
+    if match and match.start() < len(line):
+        return match
+    return None
+
+
 def _extract_invoice_fields(text: str) -> Dict[str, Any]:
+    """Collect invoice fields in a single pass over the text's non-empty lines.
+
+    Each field takes its first match in document order; once found, its pattern is no longer tried,
+    so after the header only the line-item pattern runs.
+    """
     invoice_number = None
     date = None
-    vendor_name = None
+    date_seen = False
     total_amount = None
+    total_seen = False
     tax_amount = 0.0
-    currency = "USD"
+    tax_seen = False
+    currency = None
+    line_items: List[Dict[str, Any]] = []
 
-    inv_match = re.search(r"invoice\s*(?:number|no|#)?\s*[:#-]?\s*([A-Z0-9-]+)", text, re.IGNORECASE)
-    if inv_match:
-        invoice_number = inv_match.group(1)
+    lines = [line for line in (raw.strip() for raw in text.splitlines()) if line]
+    vendor_name = lines[0][:120] if lines else None
+    header_pending = True
 
-    date_match = re.search(r"\b(\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b", text)
-    if date_match:
-        raw_date = date_match.group(1)
-        for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y"):
-            try:
-                date = datetime.strptime(raw_date, fmt).strftime("%Y-%m-%d")
-                break
-            except ValueError:
-                continue
-
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    if lines:
-        vendor_name = lines[0][:120]
-
-    total_match = re.search(r"(?:total\s*(?:due|amount)?|amount\s*due)\s*[:$€£₹]*\s*([0-9][0-9,]*\.?[0-9]{0,2})", text, re.IGNORECASE)
-    if total_match:
-        total_amount = _safe_float(total_match.group(1))
-
-    tax_match = re.search(r"(?:tax|vat|gst)\s*[:$€£₹]*\s*([0-9][0-9,]*\.?[0-9]{0,2})", text, re.IGNORECASE)
-    if tax_match:
-        parsed_tax = _safe_float(tax_match.group(1))
-        if parsed_tax is not None:
-            tax_amount = parsed_tax
-
-    currency_match = re.search(r"(USD|EUR|GBP|INR|AUD|CAD)\b|[$€£₹]", text, re.IGNORECASE)
-    if currency_match:
-        symbol_or_code = currency_match.group(0)
-        currency = CURRENCY_MAP.get(symbol_or_code, symbol_or_code.upper())
+    for position, line in enumerate(lines):
+        # Cheap substring checks on the lowered line gate every regex, and each field stops being
+        # checked once found, so most line-item rows only pay for a few `in` tests.
+        if header_pending:
+            lowered = line.lower()
 
-    line_items: List[Dict[str, Any]] = []
-    item_pattern = re.compile(r"^([A-Za-z].*?)\s{2,}([0-9][0-9,]*\.?[0-9]{0,2})$")
-    for line in lines:
-        match = item_pattern.match(line)
-        if match:
-            amount = _safe_float(match.group(2))
-            if amount is not None:
-                line_items.append({"description": match.group(1).strip(), "amount": amount})
+            if invoice_number is None and "invoice" in lowered:
+                match = _search_line(_INVOICE_NUMBER_RE, lines, position, _INVOICE_NUMBER_LINES)
+                if match:
+                    invoice_number = match.group(1)
+
+            if not date_seen and ("/" in line or "-" in line):
+                match = _DATE_RE.search(line)
+                if match:
+                    date_seen = True
+                    date = _normalize_date(match.group(1))
+
+            if not total_seen and ("total" in lowered or "amount" in lowered):
+                match = _search_line(_TOTAL_RE, lines, position, _TOTAL_LINES)
+                if match:
+                    total_seen = True
+                    total_amount = _safe_float(match.group(1))
+
+            if not tax_seen and ("tax" in lowered or "vat" in lowered or "gst" in lowered):
+                match = _search_line(_TAX_RE, lines, position, _TAX_LINES)
+                if match:
+                    tax_seen = True
+                    parsed_tax = _safe_float(match.group(1))
+                    if parsed_tax is not None:
+                        tax_amount = parsed_tax
+
+            if currency is None and any(hint in lowered for hint in _CURRENCY_HINTS):
+                match = _CURRENCY_RE.search(line)
+                if match:
+                    symbol_or_code = match.group(0)
+                    currency = CURRENCY_MAP.get(symbol_or_code, symbol_or_code.upper())
+
+            header_pending = not (
+                invoice_number is not None and date_seen and total_seen and tax_seen and currency is not None
+            )
+
+        if line[-1].isdigit() or line[-1] in ".,":
+            item = _match_line_item(line)
+            if item:
+                line_items.append(item)
 
     return {
         "invoice_number": invoice_number,
         "date": date,
         "vendor_name": vendor_name,
         "total_amount": total_amount,
-        "currency": currency,
+        "currency": currency or "USD",
         "tax_amount": tax_amount,
         "line_items": line_items,
     }
 
 
-def _llm_extract_invoice(file_data: bytes, mime_type: str) -> Optional[Dict[str, Any]]:
-    prompt = """
+INVOICE_PROMPT = """
 You are an invoice extraction engine.
 Extract and return strict JSON with fields:
 invoice_number (string|null),
@@ -125,25 +235,63 @@ line_items (array of {description:string, amount:number}).
 If not visible, return null (or [] for line_items, 0 for tax_amount).
 Return only JSON.
 """
-    payload = {"mime_type": mime_type, "data": file_data}
-    extracted = generate_json(prompt, payload)
+
+# Changes whenever the prompt or model changes, so stale extractions are never served.
+INVOICE_PROMPT_VERSION = content_hash(f"{MODEL_NAME}\n{INVOICE_PROMPT}".encode())[:16]
+
+
+def get_invoice_cache() -> SQLiteResultCache:
+    path = os.path.abspath(INVOICE_CACHE_PATH)
+    cache = _invoice_caches.get(path)
+    if cache is not None:
+        return cache
+
+    with _invoice_caches_lock:
+        cache = _invoice_caches.get(path)
+        if cache is None:
+            cache = SQLiteResultCache(path, INVOICE_CACHE_TTL_SECONDS, INVOICE_CACHE_MAX_ENTRIES)
+            _invoice_caches[path] = cache
+    return cache
+
+
+def _invoice_cache_key(file_data: UploadData, mime_type: str) -> str:
+    return f"{INVOICE_PROMPT_VERSION}:{mime_type}:{upload_digest(file_data)}"
+
+
+def _cache_invoice_result(key: str, result: Dict[str, Any], started: float) -> None:
+    ttl = INVOICE_CACHE_TTL_SECONDS if result.get("source") == "gemini" else INVOICE_CACHE_FALLBACK_TTL_SECONDS
+    get_invoice_cache().set(key, result, ttl_seconds=ttl, compute_seconds=time.perf_counter() - started)
+
+
+def _llm_extract_invoice(file_data: UploadData, mime_type: str) -> Optional[Dict[str, Any]]:
+    # Inline request data must be bytes, so a spooled upload is read back only here, for the LLM.
+    payload = {"mime_type": mime_type, "data": upload_bytes(file_data)}
+    extracted = generate_json(INVOICE_PROMPT, payload, agent="invoice")
     if not extracted:
         return None
     return _normalize_invoice_result(extracted)
 
 
-def process_invoice(file_data: bytes, mime_type: str):
-    llm_result = _llm_extract_invoice(file_data, mime_type)
-    if llm_result:
-        llm_result["source"] = "gemini"
-        return llm_result
+async def _llm_extract_invoice_async(file_data: UploadData, mime_type: str) -> Optional[Dict[str, Any]]:
+    if isinstance(file_data, SpooledUpload):
+        data = await asyncio.to_thread(file_data.read_bytes)
+    else:
+        data = file_data
+    payload = {"mime_type": mime_type, "data": data}
+    extracted = await generate_json_async(INVOICE_PROMPT, payload, agent="invoice")
+    if not extracted:
+        return None
+    return _normalize_invoice_result(extracted)
 
+
+def _deterministic_invoice(file_data: UploadData, mime_type: str) -> Dict[str, Any]:
     text = ""
-    if mime_type == "application/pdf" or file_data[:4] == b"%PDF":
-        text = _extract_text_from_pdf_bytes(file_data)
+    if mime_type == "application/pdf" or upload_head(file_data, 4) == b"%PDF":
+        text = _extract_text_from_pdf_bytes(upload_source(file_data))
 
     if text:
-        fallback = _extract_invoice_fields(text)
+        with stage("invoice", "fallback_parse"):
+            fallback = _extract_invoice_fields(text)
         fallback["source"] = "deterministic"
         return fallback
 
@@ -158,3 +306,140 @@ def process_invoice(file_data: bytes, mime_type: str):
         "source": "deterministic",
         "warning": "Could not extract machine-readable text from file and Gemini was unavailable or returned invalid output.",
     }
+
+
+def _process_invoice_uncached(file_data: UploadData, mime_type: str):
+    llm_result = _llm_extract_invoice(file_data, mime_type)
+    if llm_result:
+        llm_result["source"] = "gemini"
+        return llm_result
+
+    return _deterministic_invoice(file_data, mime_type)
+
+
+def process_invoice(file_data: UploadData, mime_type: str):
+    key = _invoice_cache_key(file_data, mime_type)
+    cached = get_invoice_cache().get(key)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    result = _process_invoice_uncached(file_data, mime_type)
+    record_response("invoice", result.get("source"))
+    _cache_invoice_result(key, result, started)
+    return result
+
+
+async def process_invoice_async(file_data: UploadData, mime_type: str):
+    """Extract invoice fields from raw bytes or a SpooledUpload (read from its temp file, not copied)."""
+    key = _invoice_cache_key(file_data, mime_type)
+    cached = await asyncio.to_thread(get_invoice_cache().get, key)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    # PDF text extraction is CPU-bound; the fallback runs in a thread to keep it off the event loop.
+    source, result = await race_llm_with_fallback(
+        _llm_extract_invoice_async(file_data, mime_type),
+        lambda: _deterministic_invoice(file_data, mime_type),
+        "invoice",
+        offload=True,
+    )
+    if source == "gemini":
+        result["source"] = "gemini"
+
+    record_response("invoice", result.get("source"))
+    # A fallback that only won because this request's budget ran out says nothing about whether
+    # Gemini is available; caching it would hand every later upload of the file the fallback too.
+    if source != "deadline":
+        await asyncio.to_thread(_cache_invoice_result, key, result, started)
+    return result
+
+
+def _is_zip(filename: str, data: UploadData) -> bool:
+    return filename.lower().endswith(".zip") or upload_head(data, 4) == b"PK\x03\x04"
+
+
+def _open_archive(filename: str, data: UploadData) -> zipfile.ZipFile:
+    try:
+        source = upload_source(data)
+        return zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except zipfile.BadZipFile as exc:
+        raise ValueError(f"{filename}: not a valid zip archive") from exc
+
+
+class ArchiveMember:
+    """A file inside an uploaded zip archive, unpacked only when open() is called."""
+
+    def __init__(self, archive_name: str, archive: UploadData, member: str):
+        self.archive_name = archive_name
+        self.archive = archive
+        self.member = member
+
+    def open(self) -> SpooledUpload:
+        """Unpack the member into a SpooledUpload (blocking); the caller closes it."""
+        with _open_archive(self.archive_name, self.archive) as archive, archive.open(self.member) as stream:
+            return spool_stream(stream, filename=self.member)
+
+
+InvoiceEntry = Tuple[str, Union[UploadData, ArchiveMember], str]
+
+
+def expand_invoice_uploads(uploads: List[Tuple[str, UploadData, str]]) -> List[InvoiceEntry]:
+    """Flatten uploaded files and zip archives into (filename, data, mime_type) entries.
+
+    Only the archive directories are read here; each member is an ArchiveMember that the batch
+    worker unpacks when it gets to it, so at most INVOICE_BATCH_CONCURRENCY members are unpacked
+    at a time. Raises ValueError when an archive is unreadable or exceeds the file-count / size limits.
+    """
+    files: List[InvoiceEntry] = []
+    for filename, data, mime_type in uploads:
+        if not _is_zip(filename, data):
+            files.append((filename, data, mime_type))
+            continue
+
+        with _open_archive(filename, data) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            members = [info for info in members if not os.path.basename(info.filename).startswith(".")]
+            if len(members) > INVOICE_ARCHIVE_MAX_FILES:
+                raise ValueError(f"{filename}: more than {INVOICE_ARCHIVE_MAX_FILES} files in archive")
+            if sum(info.file_size for info in members) > INVOICE_ARCHIVE_MAX_BYTES:
+                raise ValueError(f"{filename}: archive expands beyond {INVOICE_ARCHIVE_MAX_BYTES} bytes")
+
+            for info in members:
+                guessed, _ = mimetypes.guess_type(info.filename)
+                member = ArchiveMember(filename, data, info.filename)
+                files.append((info.filename, member, guessed or "application/octet-stream"))
+    return files
+
+
+async def process_invoice_batch_async(
+    files: List[InvoiceEntry], concurrency: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run process_invoice_async over files with bounded concurrency, yielding each result as it finishes.
+
+    A failing file yields {"index", "filename", "error"} and does not affect the others.
+    """
+    limit = asyncio.Semaphore(concurrency or INVOICE_BATCH_CONCURRENCY)
+
+    async def run(index: int, filename: str, data: Union[UploadData, ArchiveMember], mime_type: str) -> Dict[str, Any]:
+        async with limit:
+            unpacked = None
+            try:
+                if isinstance(data, ArchiveMember):
+                    data = unpacked = await asyncio.to_thread(data.open)
+                result = await process_invoice_async(data, mime_type)
+                return {"index": index, "filename": filename, "result": result}
+            except Exception as exc:
+                return {"index": index, "filename": filename, "error": str(exc)}
+            finally:
+                if unpacked is not None:
+                    unpacked.close()
+
+    tasks = [asyncio.ensure_future(run(index, *entry)) for index, entry in enumerate(files)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
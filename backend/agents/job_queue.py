@@ -0,0 +1,181 @@
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from agents.metrics import observe_stage, record_job
+
+# Final-turn lead scoring runs on this many worker threads; 0 scores inline in the request as before.
+LEAD_SCORING_WORKERS = int(os.getenv("LEAD_SCORING_WORKERS", "2"))
+LEAD_SCORING_QUEUE_MAX = int(os.getenv("LEAD_SCORING_QUEUE_MAX", "1000"))
+LEAD_SCORING_MAX_ATTEMPTS = int(os.getenv("LEAD_SCORING_MAX_ATTEMPTS", "3"))
+# Delay before the first retry; doubles on every further attempt.
+LEAD_SCORING_RETRY_BACKOFF_SECONDS = float(os.getenv("LEAD_SCORING_RETRY_BACKOFF_SECONDS", "0.5"))
+
+# Idle workers re-check for shutdown this often, in case another worker took their wake-up.
+_IDLE_POLL_SECONDS = 1.0
+
+Job = Callable[[], Any]
+FailureHandler = Callable[[BaseException], None]
+
+
+class BackgroundJobQueue:
+    """In-process job queue served by a fixed number of daemon threads, with retry and exponential backoff.
+
+    Workers start on the first submit. Jobs are lost if the process dies before they run, so each
+    job should leave a record (such as a pending lead) that shows it has not finished.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        max_pending: int,
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 0.5,
+    ):
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._unfinished = 0
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _ensure_workers(self) -> None:
+        # Called with self._lock held.
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, args=(self._stop,), name=f"{self.name}-worker-{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job: Job, on_failure: Optional[FailureHandler] = None) -> bool:
+        """Queue a job; returns False (without running it) when the queue is disabled or full."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            # Workers start even when the job is rejected, so a queue left full by shutdown() drains.
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait((job, on_failure, time.perf_counter()))
+            except queue.Full:
+                self.rejected += 1
+                record_job(self.name, "rejected")
+                return False
+            self._unfinished += 1
+        return True
+
+    def _work(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                item = self._queue.get(timeout=_IDLE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is None:
+                # A shutdown wake-up; it may belong to an older set of workers, so re-check our own flag.
+                continue
+            job, on_failure, queued_at = item
+            observe_stage(self.name, "queue_wait", time.perf_counter() - queued_at)
+            try:
+                self._run(job, on_failure)
+            finally:
+                with self._idle:
+                    self._unfinished -= 1
+                    if not self._unfinished:
+                        self._idle.notify_all()
+
+    def _run(self, job: Job, on_failure: Optional[FailureHandler]) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                job()
+            except Exception as exc:
+                if attempt < self.max_attempts:
+                    with self._lock:
+                        self.retried += 1
+                    record_job(self.name, "retry")
+                    time.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+                    continue
+                with self._lock:
+                    self.failed += 1
+                record_job(self.name, "failed")
+                if on_failure is not None:
+                    try:
+                        on_failure(exc)
+                    except Exception:
+                        pass
+                return
+            with self._lock:
+                self.completed += 1
+            record_job(self.name, "success")
+            return
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted job has finished; returns False if the timeout passed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """Let queued jobs finish, then stop the workers; submit() restarts them if called again.
+
+        If the timeout passes first, each worker stops after its current job and the jobs still
+        queued wait for the next submit().
+        """
+        drained = self.join(timeout)
+        with self._lock:
+            threads, self._threads = self._threads, []
+            stop, self._stop = self._stop, threading.Event()
+        stop.set()
+        for _ in threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                # Busy workers see the stop flag when their job ends; idle ones at the next poll.
+                break
+        for thread in threads:
+            thread.join(timeout)
+        return drained
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running_workers": sum(thread.is_alive() for thread in self._threads),
+                "pending": self._unfinished,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retried": self.retried,
+                "rejected": self.rejected,
+            }
+
+
+LEAD_SCORING_QUEUE = BackgroundJobQueue(
+    "lead_scoring",
+    LEAD_SCORING_WORKERS,
+    LEAD_SCORING_QUEUE_MAX,
+    LEAD_SCORING_MAX_ATTEMPTS,
+    LEAD_SCORING_RETRY_BACKOFF_SECONDS,
+)
@@ -0,0 +1,373 @@
+import base64
+import heapq
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents.sqlite_utils import ThreadLocalConnections
+
+LEADS_BACKEND = os.getenv("LEADS_BACKEND", "sqlite")
+LEADS_DB_PATH = os.getenv("LEADS_DB_PATH", "leads.db")
+LEADS_JSON_PATH = os.getenv("LEADS_JSON_PATH", "leads_db.json")
+
+# Values of a lead's "scoring_status" field; leads stored before background scoring count as scored.
+SCORING_PENDING = "pending"
+SCORING_DONE = "scored"
+SCORING_FAILED = "failed"
+
+
+def _score_of(lead: Dict[str, Any]) -> int:
+    try:
+        return int(float(lead.get("lead_score") or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def encode_cursor(score: int, position: int) -> str:
+    return base64.urlsafe_b64encode(f"{score}:{position}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        score, position = raw.split(":")
+        return int(score), int(position)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+LeadPage = Tuple[List[Dict[str, Any]], Optional[str]]
+
+
+class LeadRepository(ABC):
+    """Storage interface for captured leads."""
+
+    @abstractmethod
+    def add(self, lead: Dict[str, Any]) -> int:
+        """Store a lead and return its id."""
+
+    @abstractmethod
+    def get(self, lead_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update(self, lead_id: int, lead: Dict[str, Any]) -> bool:
+        """Replace a stored lead; returns False if there is no lead with that id."""
+
+    @abstractmethod
+    def list_leads(
+        self,
+        status: Optional[str] = None,
+        min_score: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Leads ordered by lead_score (highest first), oldest first on ties."""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def query_leads(
+        self,
+        status: Optional[str] = None,
+        min_score: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> LeadPage:
+        """One page of leads in list_leads order plus the cursor for the next page (None on the last page).
+
+        ``since`` is inclusive and ``until`` exclusive, compared against the ISO captured_at timestamps.
+        """
+
+    @abstractmethod
+    def revision(self) -> str:
+        """Changes whenever any lead is added, updated or removed; used for HTTP ETags."""
+
+
+class SQLiteLeadRepository(LeadRepository):
+    """SQLite-backed store; safe for several processes writing the same file."""
+
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lead_score INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    captured_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_score ON leads (lead_score DESC, id);
+CREATE INDEX IF NOT EXISTS idx_leads_status ON leads (status, lead_score DESC);
+CREATE INDEX IF NOT EXISTS idx_leads_captured_at ON leads (captured_at);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lead_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO lead_revision (id, revision) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS leads_revision_insert AFTER INSERT ON leads
+BEGIN UPDATE lead_revision SET revision = revision + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS leads_revision_update AFTER UPDATE ON leads
+BEGIN UPDATE lead_revision SET revision = revision + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS leads_revision_delete AFTER DELETE ON leads
+BEGIN UPDATE lead_revision SET revision = revision + 1 WHERE id = 1; END;
+"""
+
+    def __init__(self, path: str, legacy_json_path: Optional[str] = None):
+        self.path = os.path.abspath(path)
+        self._connections = ThreadLocalConnections(self.path)
+        self._connect().executescript(self.SCHEMA)
+        if legacy_json_path:
+            self.migrate_json(legacy_json_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    @staticmethod
+    def _row(lead: Dict[str, Any]):
+        return (_score_of(lead), lead.get("status"), lead.get("captured_at"), json.dumps(lead))
+
+    def add(self, lead: Dict[str, Any]) -> int:
+        cursor = self._connect().execute(
+            "INSERT INTO leads (lead_score, status, captured_at, data) VALUES (?, ?, ?, ?)",
+            self._row(lead),
+        )
+        return cursor.lastrowid
+
+    def get(self, lead_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT data FROM leads WHERE id = ?", (lead_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, lead_id: int, lead: Dict[str, Any]) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE leads SET lead_score = ?, status = ?, captured_at = ?, data = ? WHERE id = ?",
+            self._row(lead) + (lead_id,),
+        )
+        return cursor.rowcount > 0
+
+    def list_leads(
+        self,
+        status: Optional[str] = None,
+        min_score: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.query_leads(status=status, min_score=min_score, limit=limit)[0]
+
+    def query_leads(
+        self,
+        status: Optional[str] = None,
+        min_score: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> LeadPage:
+        clauses = []
+        params: List[Any] = []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if min_score is not None:
+            clauses.append("lead_score >= ?")
+            params.append(min_score)
+        if since is not None:
+            clauses.append("captured_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("captured_at < ?")
+            params.append(until)
+        if cursor is not None:
+            # Keyset pagination: resume strictly after the last (score, id) returned.
+            score, last_id = decode_cursor(cursor)
+            clauses.append("(lead_score < ? OR (lead_score = ? AND id > ?))")
+            params.extend([score, score, last_id])
+
+        query = "SELECT id, lead_score, data FROM leads"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        # The score indexes already hold rows in this order, so LIMIT stops early instead of sorting everything.
+        query += " ORDER BY lead_score DESC, id ASC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        rows = self._connect().execute(query, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        return [json.loads(data) for _, _, data in rows], next_cursor
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def revision(self) -> str:
+        return str(self._connect().execute("SELECT revision FROM lead_revision WHERE id = 1").fetchone()[0])
+
+    def migrate_json(self, json_path: str) -> int:
+        """Import a legacy leads_db.json once; returns the number of leads imported."""
+        if not os.path.exists(json_path):
+            return 0
+
+        name = f"json:{os.path.abspath(json_path)}"
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent workers cannot both migrate.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                conn.execute("COMMIT")
+                return 0
+
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    leads = json.load(f)
+            except json.JSONDecodeError:
+                leads = []
+            leads = [lead for lead in leads if isinstance(lead, dict)]
+
+            conn.executemany(
+                "INSERT INTO leads (lead_score, status, captured_at, data) VALUES (?, ?, ?, ?)",
+                [self._row(lead) for lead in leads],
+            )
+            conn.execute(
+                "INSERT INTO migrations (name, applied_at) VALUES (?, ?)",
+                (name, datetime.utcnow().isoformat() + "Z"),
+            )
+            conn.execute("COMMIT")
+            return len(leads)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class JsonLeadRepository(LeadRepository):
+    """Legacy single-file store, kept for local development. Writes are atomic but O(n)."""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _save(self, leads: List[Dict[str, Any]]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(leads, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def add(self, lead: Dict[str, Any]) -> int:
+        # Ids are 1-based positions in the file; leads are never removed, so they stay stable.
+        with self._lock:
+            leads = self._load()
+            leads.append(lead)
+            self._save(leads)
+            return len(leads)
+
+    def get(self, lead_id: int) -> Optional[Dict[str, Any]]:
+        leads = self._load()
+        return leads[lead_id - 1] if 1 <= lead_id <= len(leads) else None
+
+    def update(self, lead_id: int, lead: Dict[str, Any]) -> bool:
+        with self._lock:
+            leads = self._load()
+            if not 1 <= lead_id <= len(leads):
+                return False
+            leads[lead_id - 1] = lead
+            self._save(leads)
+            return True
+
+    def list_leads(
+        self,
+        status: Optional[str] = None,
+        min_score: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.query_leads(status=status, min_score=min_score, limit=limit)[0]
+
+    def query_leads(
+        self,
+        status: Optional[str] = None,
+        min_score: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> LeadPage:
+        after = decode_cursor(cursor) if cursor is not None else None
+        candidates = []
+        # Position in the file plays the role of the SQLite id: oldest first on equal scores.
+        for position, lead in enumerate(self._load()):
+            if status is not None and lead.get("status") != status:
+                continue
+            score = _score_of(lead)
+            if min_score is not None and score < min_score:
+                continue
+            captured_at = lead.get("captured_at") or ""
+            if (since is not None and captured_at < since) or (until is not None and captured_at >= until):
+                continue
+            if after is not None and (-score, position) <= (-after[0], after[1]):
+                continue
+            candidates.append((-score, position, lead))
+
+        if limit is None:
+            return [lead for _, _, lead in sorted(candidates, key=lambda item: item[:2])], None
+
+        top = heapq.nsmallest(limit + 1, candidates, key=lambda item: item[:2])
+        next_cursor = None
+        if len(top) > limit:
+            top = top[:limit]
+            next_cursor = encode_cursor(-top[-1][0], top[-1][1])
+        return [lead for _, _, lead in top], next_cursor
+
+    def count(self) -> int:
+        return len(self._load())
+
+    def revision(self) -> str:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return "0"
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+_repositories: Dict[str, LeadRepository] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_lead_repository() -> LeadRepository:
+    """Repository for the configured backend. Relative paths resolve against the current directory."""
+    if LEADS_BACKEND == "json":
+        key = "json:" + os.path.abspath(LEADS_JSON_PATH)
+    else:
+        key = "sqlite:" + os.path.abspath(LEADS_DB_PATH)
+
+    repository = _repositories.get(key)
+    if repository is not None:
+        return repository
+
+    with _repositories_lock:
+        repository = _repositories.get(key)
+        if repository is None:
+            if LEADS_BACKEND == "json":
+                repository = JsonLeadRepository(LEADS_JSON_PATH)
+            else:
+                repository = SQLiteLeadRepository(LEADS_DB_PATH, legacy_json_path=LEADS_JSON_PATH)
+            _repositories[key] = repository
+    return repository
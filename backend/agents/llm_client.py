@@ -1,50 +1,387 @@
+import asyncio
+import copy
+import hashlib
 import json
 import os
-from typing import Any, Dict, Optional
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-try:
-    from dotenv import load_dotenv
-except ImportError:  # pragma: no cover
-    def load_dotenv(*args, **kwargs):
-        return False
+from agents.metrics import LLM_CIRCUIT_STATE, observe_stage, record_llm_call, stage
+from agents.result_cache import MemoryResultCache, SQLiteResultCache, TieredResultCache
 
-try:
-    import google.generativeai as genai
-except ImportError:  # pragma: no cover
-    genai = None
+# google.generativeai pulls in protobuf/grpc and dominates cold start, so it is imported on first use.
+# (.env loading happens in agents/__init__.py, before any module reads its settings.)
+_NOT_LOADED = object()
+genai: Any = _NOT_LOADED
+_genai_lock = threading.Lock()
 
 
-load_dotenv()
+def _genai():
+    """The google.generativeai module, or None if it is not installed."""
+    global genai
+    if genai is _NOT_LOADED:
+        with _genai_lock:
+            if genai is _NOT_LOADED:
+                try:
+                    import google.generativeai as module
+                except ImportError:  # pragma: no cover
+                    module = None
+                genai = module
+    return genai
+
 
 MODEL_NAME = "gemini-3-flash-preview"
 
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_AGENT_CONCURRENCY = int(os.getenv("LLM_AGENT_CONCURRENCY", "8"))
+
+# Semaphores bind to the event loop they are first awaited on, so keep one set per loop.
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+# Circuit breaker: once enough recent calls fail, skip Gemini entirely for a cool-down period.
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_BREAKER_HALF_OPEN_PROBES = int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1"))
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker shared by every LLM helper in this process.
+
+    closed: calls go through and outcomes are tracked over a sliding time window.
+    open: calls are refused until the cool-down has passed.
+    half_open: a few probe calls go through; one success closes the circuit, one failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window_seconds: float = LLM_BREAKER_WINDOW_SECONDS,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        failure_rate: float = LLM_BREAKER_FAILURE_RATE,
+        cooldown_seconds: float = LLM_BREAKER_COOLDOWN_SECONDS,
+        half_open_probes: int = LLM_BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._outcomes: "deque[Tuple[float, bool]]" = deque()
+            self._opened_at = 0.0
+            self._probes = 0
+            self.times_opened = 0
+            self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        LLM_CIRCUIT_STATE.set(state)
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        self._opened_at = now
+        self._probes = 0
+        self._outcomes.clear()
+        self.times_opened += 1
+        self._set_state(self.OPEN)
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.cooldown_seconds:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._outcomes.clear()
+                self._probes = 0
+                self._set_state(self.CLOSED)
+                return
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            if self.state == self.OPEN:
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def record_abandoned(self) -> None:
+        """The call was cancelled before it produced a verdict; just free its probe slot."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            retry_in = self._opened_at + self.cooldown_seconds - now if self.state == self.OPEN else 0.0
+            return {
+                "state": self.state,
+                "window_calls": len(self._outcomes),
+                "window_failures": failures,
+                "failure_rate_threshold": self.failure_rate,
+                "times_opened": self.times_opened,
+                "retry_in_seconds": round(max(retry_in, 0.0), 3),
+            }
+
+
+CIRCUIT_BREAKER = CircuitBreaker()
+
+
+def circuit_breaker_state() -> Dict[str, Any]:
+    return CIRCUIT_BREAKER.snapshot()
+
+
+# Opt-in response cache keyed by model, generation config, prompt and payload. Successful replies are
+# kept in an in-process LRU and (unless LLM_CACHE_PATH is empty) a SQLite file shared by workers.
+# LLM_CACHE_TTL_<AGENT> overrides the TTL per agent; 0 turns caching off for that agent.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "50000"))
+# Replies larger than this (as JSON) are not cached.
+LLM_CACHE_MAX_ENTRY_BYTES = int(os.getenv("LLM_CACHE_MAX_ENTRY_BYTES", str(256 * 1024)))
+
+_llm_caches: Dict[str, TieredResultCache] = {}
+_llm_caches_lock = threading.Lock()
+
+
+def get_llm_cache() -> TieredResultCache:
+    key = os.path.abspath(LLM_CACHE_PATH) if LLM_CACHE_PATH else ""
+    cache = _llm_caches.get(key)
+    if cache is not None:
+        return cache
+
+    with _llm_caches_lock:
+        cache = _llm_caches.get(key)
+        if cache is None:
+            disk = None
+            if LLM_CACHE_PATH:
+                disk = SQLiteResultCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_DISK_MAX_ENTRIES)
+            cache = TieredResultCache(MemoryResultCache(LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES), disk)
+            _llm_caches[key] = cache
+    return cache
+
+
+def _cache_ttl(agent: str) -> float:
+    if not LLM_CACHE_ENABLED:
+        return 0.0
+    override = os.getenv(f"LLM_CACHE_TTL_{agent.upper()}")
+    return float(override) if override else LLM_CACHE_TTL_SECONDS
+
+
+def _hash_part(digest, part: Any) -> None:
+    # Type-tagged and length-prefixed, so different structures can never hash alike.
+    if isinstance(part, (bytes, bytearray, memoryview)):
+        data, tag = bytes(part), b"b"
+    elif isinstance(part, str):
+        data, tag = part.encode("utf-8"), b"s"
+    elif isinstance(part, dict):
+        digest.update(b"d%d:" % len(part))
+        for name in sorted(part, key=str):
+            _hash_part(digest, str(name))
+            _hash_part(digest, part[name])
+        return
+    elif isinstance(part, (list, tuple)):
+        digest.update(b"l%d:" % len(part))
+        for item in part:
+            _hash_part(digest, item)
+        return
+    else:
+        data, tag = json.dumps(part, sort_keys=True, default=str).encode("utf-8"), b"j"
+    digest.update(tag + b"%d:" % len(data))
+    digest.update(data)
+
+
+def llm_cache_key(model_name: str, generation_config: Optional[Dict[str, Any]], contents: Any) -> str:
+    digest = hashlib.sha256()
+    _hash_part(digest, [model_name, dict(generation_config or {}), contents])
+    return digest.hexdigest()
+
+
+def _cache_lookup(agent: str, key: str) -> Optional[Any]:
+    cached = get_llm_cache().get(key)
+    if cached is None:
+        return None
+    record_llm_call(agent, "cache_hit")
+    # Callers may mutate what they get back (e.g. clamping a score), so the cache never shares objects with them.
+    return copy.deepcopy(cached)
+
+
+def _cache_store(agent: str, key: str, value: Any, compute_seconds: float) -> None:
+    if len(json.dumps(value)) > LLM_CACHE_MAX_ENTRY_BYTES:
+        return
+    get_llm_cache().set(key, copy.deepcopy(value), ttl_seconds=_cache_ttl(agent), compute_seconds=compute_seconds)
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    if not LLM_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_llm_cache().stats()}
+
+
+JSON_GENERATION_CONFIG = {"temperature": 0.2, "response_mime_type": "application/json"}
+TEXT_GENERATION_CONFIG = {"temperature": 0.2}
+
+_UNSET = object()
+_cached_api_key: Any = _UNSET
+_configured_api_key: Optional[str] = None
+_model_registry: Dict[Tuple[str, Tuple[Tuple[str, Any], ...], str], Any] = {}
+_registry_lock = threading.Lock()
+
 
 def _api_key() -> Optional[str]:
-    return os.getenv("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY_2")
+    global _cached_api_key
+    if _cached_api_key is _UNSET:
+        _cached_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY_2")
+    return _cached_api_key
 
 
 def llm_available() -> bool:
-    return genai is not None and bool(_api_key())
+    # Check the key first so deployments without one never import the SDK.
+    return bool(_api_key()) and _genai() is not None
 
 
-def _model(response_json: bool = False):
+def get_model(model_name: str = MODEL_NAME, generation_config: Optional[Dict[str, Any]] = None):
+    """Return a shared GenerativeModel for (model, config, API key), creating it on first use."""
     if not llm_available():
         return None
 
-    genai.configure(api_key=_api_key())
-    if response_json:
-        return genai.GenerativeModel(
-            MODEL_NAME,
-            generation_config={
-                "temperature": 0.2,
-                "response_mime_type": "application/json",
-            },
-        )
+    api_key = _api_key()
+    config = dict(generation_config or {})
+    key = (model_name, tuple(sorted(config.items())), api_key)
+    model = _model_registry.get(key)
+    if model is not None:
+        return model
+
+    global _configured_api_key
+    with _registry_lock:
+        model = _model_registry.get(key)
+        if model is None:
+            # genai.configure sets process-wide client state, so only redo it when the key changes.
+            if _configured_api_key != api_key:
+                _genai().configure(api_key=api_key)
+                _configured_api_key = api_key
+            model = _genai().GenerativeModel(model_name, generation_config=config)
+            _model_registry[key] = model
+    return model
+
+
+def invalidate_models() -> None:
+    """Drop cached models and re-read the API key on next use (e.g. after key rotation)."""
+    global _cached_api_key, _configured_api_key
+    with _registry_lock:
+        _model_registry.clear()
+        _cached_api_key = _UNSET
+        _configured_api_key = None
+
+
+def _model(response_json: bool = False):
+    return get_model(MODEL_NAME, JSON_GENERATION_CONFIG if response_json else TEXT_GENERATION_CONFIG)
+
+
+def _agent_limit(agent: str) -> int:
+    override = os.getenv(f"LLM_CONCURRENCY_{agent.upper()}")
+    return int(override) if override else LLM_AGENT_CONCURRENCY
+
+
+def _semaphores(agent: str) -> Tuple[asyncio.Semaphore, asyncio.Semaphore]:
+    loop = asyncio.get_running_loop()
+    limiters = _limiters.get(loop)
+    if limiters is None:
+        limiters = {"*": asyncio.Semaphore(LLM_MAX_CONCURRENCY)}
+        _limiters[loop] = limiters
+    if agent not in limiters:
+        limiters[agent] = asyncio.Semaphore(_agent_limit(agent))
+    return limiters["*"], limiters[agent]
+
+
+def set_concurrency_limits(global_limit: Optional[int] = None, agent_limit: Optional[int] = None) -> None:
+    """Change the limits; takes effect for semaphores created after the call."""
+    global LLM_MAX_CONCURRENCY, LLM_AGENT_CONCURRENCY
+    if global_limit is not None:
+        LLM_MAX_CONCURRENCY = global_limit
+    if agent_limit is not None:
+        LLM_AGENT_CONCURRENCY = agent_limit
+    _limiters.clear()
+
+
+class _QueueTimeout(Exception):
+    """The timeout ran out while waiting for a concurrency slot, so the model was never called."""
+
+
+async def _acquire_slots(agent: str, deadline: float) -> List[asyncio.Semaphore]:
+    loop = asyncio.get_running_loop()
+    acquired: List[asyncio.Semaphore] = []
+    try:
+        for semaphore in _semaphores(agent):
+            await asyncio.wait_for(semaphore.acquire(), max(deadline - loop.time(), 0))
+            acquired.append(semaphore)
+    except asyncio.TimeoutError:
+        for semaphore in acquired:
+            semaphore.release()
+        raise _QueueTimeout() from None
+    except BaseException:
+        for semaphore in acquired:
+            semaphore.release()
+        raise
+    return acquired
+
 
-    return genai.GenerativeModel(
-        MODEL_NAME,
-        generation_config={"temperature": 0.2},
-    )
+async def _generate_async(model, contents: Any, agent: str, timeout: Optional[float]):
+    # The timeout covers time spent queued on the semaphores as well as the call itself.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (LLM_TIMEOUT_SECONDS if timeout is None else timeout)
+    acquired = await _acquire_slots(agent, deadline)
+    try:
+        if hasattr(model, "generate_content_async"):
+            call = model.generate_content_async(contents)
+        else:
+            call = asyncio.to_thread(model.generate_content, contents)
+        return await asyncio.wait_for(call, max(deadline - loop.time(), 0))
+    finally:
+        for semaphore in acquired:
+            semaphore.release()
 
 
 def _strip_fences(text: str) -> str:
@@ -58,30 +395,274 @@ def _strip_fences(text: str) -> str:
     return cleaned.strip()
 
 
-def generate_json(prompt: str, payload: Any = None) -> Optional[Dict[str, Any]]:
-    model = _model(response_json=True)
-    if model is None:
+def _failure_outcome(exc: BaseException) -> str:
+    return "timeout" if isinstance(exc, asyncio.TimeoutError) else "error"
+
+
+def _invoke(model, contents: Any, agent: str):
+    """One blocking model call through the circuit breaker; None (already counted) if refused or failed."""
+    if not CIRCUIT_BREAKER.allow_request():
+        record_llm_call(agent, "circuit_open")
+        return None
+    try:
+        with stage(agent, "llm"):
+            response = model.generate_content(contents)
+    except Exception as exc:
+        CIRCUIT_BREAKER.record_failure()
+        record_llm_call(agent, _failure_outcome(exc))
+        return None
+    except BaseException:
+        CIRCUIT_BREAKER.record_abandoned()
+        raise
+    CIRCUIT_BREAKER.record_success()
+    return response
+
+
+async def _invoke_async(model, contents: Any, agent: str, timeout: Optional[float]):
+    if not CIRCUIT_BREAKER.allow_request():
+        record_llm_call(agent, "circuit_open")
+        return None
+    try:
+        with stage(agent, "llm"):
+            response = await _generate_async(model, contents, agent, timeout)
+    except _QueueTimeout:
+        # Our own backlog, not the service, ran out the clock; it says nothing about the LLM's health.
+        CIRCUIT_BREAKER.record_abandoned()
+        record_llm_call(agent, "queue_timeout")
+        return None
+    except Exception as exc:
+        CIRCUIT_BREAKER.record_failure()
+        record_llm_call(agent, _failure_outcome(exc))
+        return None
+    except BaseException:
+        CIRCUIT_BREAKER.record_abandoned()
+        raise
+    CIRCUIT_BREAKER.record_success()
+    return response
+
+
+def _parse_json_response(response, agent: str) -> Optional[Dict[str, Any]]:
+    # A reply that is not valid JSON means the model misbehaved, not that the service is down.
+    try:
+        result = json.loads(_strip_fences(response.text))
+    except Exception:
+        record_llm_call(agent, "invalid")
         return None
+    record_llm_call(agent, "success")
+    return result
+
+
+def _response_text(response, agent: str) -> Optional[str]:
+    try:
+        text = (response.text or "").strip()
+    except Exception:
+        text = ""
+    record_llm_call(agent, "success" if text else "empty")
+    return text or None
+
 
+def _json_parts(prompt: str, payload: Any) -> List[Any]:
     parts = [prompt]
     if payload is not None:
         parts.append(payload)
+    return parts
 
-    try:
-        response = model.generate_content(parts)
-        return json.loads(_strip_fences(response.text))
-    except Exception:
+
+def generate_json(prompt: str, payload: Any = None, agent: str = "default") -> Optional[Dict[str, Any]]:
+    model = _model(response_json=True)
+    if model is None:
+        record_llm_call(agent, "unavailable")
         return None
 
+    parts = _json_parts(prompt, payload)
+    use_cache = _cache_ttl(agent) > 0
+    if use_cache:
+        key = llm_cache_key(MODEL_NAME, JSON_GENERATION_CONFIG, parts)
+        cached = _cache_lookup(agent, key)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    response = _invoke(model, parts, agent)
+    result = None if response is None else _parse_json_response(response, agent)
+    if use_cache and result is not None:
+        _cache_store(agent, key, result, time.perf_counter() - started)
+    return result
 
-def generate_text(prompt: str) -> Optional[str]:
+
+def generate_text(prompt: str, agent: str = "default") -> Optional[str]:
     model = _model(response_json=False)
     if model is None:
+        record_llm_call(agent, "unavailable")
         return None
 
-    try:
-        response = model.generate_content(prompt)
-        text = (response.text or "").strip()
-        return text or None
-    except Exception:
+    use_cache = _cache_ttl(agent) > 0
+    if use_cache:
+        key = llm_cache_key(MODEL_NAME, TEXT_GENERATION_CONFIG, prompt)
+        cached = _cache_lookup(agent, key)
+        if cached is not None:
+            return cached["text"]
+
+    started = time.perf_counter()
+    response = _invoke(model, prompt, agent)
+    text = None if response is None else _response_text(response, agent)
+    if use_cache and text:
+        _cache_store(agent, key, {"text": text}, time.perf_counter() - started)
+    return text
+
+
+async def generate_json_async(
+    prompt: str,
+    payload: Any = None,
+    agent: str = "default",
+    timeout: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    model = _model(response_json=True)
+    if model is None:
+        record_llm_call(agent, "unavailable")
+        return None
+
+    parts = _json_parts(prompt, payload)
+    use_cache = _cache_ttl(agent) > 0
+    if use_cache:
+        key = llm_cache_key(MODEL_NAME, JSON_GENERATION_CONFIG, parts)
+        cached = await asyncio.to_thread(_cache_lookup, agent, key)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    response = await _invoke_async(model, parts, agent, timeout)
+    result = None if response is None else _parse_json_response(response, agent)
+    if use_cache and result is not None:
+        await asyncio.to_thread(_cache_store, agent, key, result, time.perf_counter() - started)
+    return result
+
+
+async def generate_text_async(
+    prompt: str,
+    agent: str = "default",
+    timeout: Optional[float] = None,
+) -> Optional[str]:
+    model = _model(response_json=False)
+    if model is None:
+        record_llm_call(agent, "unavailable")
         return None
+
+    use_cache = _cache_ttl(agent) > 0
+    if use_cache:
+        key = llm_cache_key(MODEL_NAME, TEXT_GENERATION_CONFIG, prompt)
+        cached = await asyncio.to_thread(_cache_lookup, agent, key)
+        if cached is not None:
+            return cached["text"]
+
+    started = time.perf_counter()
+    response = await _invoke_async(model, prompt, agent, timeout)
+    text = None if response is None else _response_text(response, agent)
+    if use_cache and text:
+        await asyncio.to_thread(_cache_store, agent, key, {"text": text}, time.perf_counter() - started)
+    return text
+
+
+class LLMStreamInterrupted(Exception):
+    """A stream failed or timed out after some text had already been yielded.
+
+    The partial text must not be treated as a complete reply.
+    """
+
+    def __init__(self, partial_text: str, outcome: str):
+        super().__init__(f"LLM stream interrupted ({outcome}) after {len(partial_text)} characters")
+        self.partial_text = partial_text
+        self.outcome = outcome
+
+
+async def _stream_chunks(model, prompt: str) -> AsyncIterator[str]:
+    if hasattr(model, "generate_content_async"):
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+        return
+
+    # Sync SDK: pull each chunk from the blocking iterator in a worker thread.
+    done = object()
+    iterator = await asyncio.to_thread(lambda: iter(model.generate_content(prompt, stream=True)))
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, done)
+        if chunk is done:
+            return
+        yield chunk.text
+
+
+async def stream_text_async(
+    prompt: str,
+    agent: str = "default",
+    timeout: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Yield text chunks as the model produces them; yields nothing if the LLM is unavailable or fails.
+
+    A failure or timeout after some text was yielded raises LLMStreamInterrupted, so callers can
+    tell a dropped stream from a finished one. The timeout bounds the whole stream, including
+    time queued on the concurrency limits.
+    """
+    model = _model(response_json=False)
+    if model is None:
+        record_llm_call(agent, "unavailable")
+        return
+
+    # A cached reply is replayed as one chunk; a completed stream is cached just like generate_text.
+    # Cache reads and writes may hit SQLite, so they run in a worker thread like the invoice cache.
+    use_cache = _cache_ttl(agent) > 0
+    if use_cache:
+        key = llm_cache_key(MODEL_NAME, TEXT_GENERATION_CONFIG, prompt)
+        cached = await asyncio.to_thread(_cache_lookup, agent, key)
+        if cached is not None:
+            yield cached["text"]
+            return
+
+    if not CIRCUIT_BREAKER.allow_request():
+        record_llm_call(agent, "circuit_open")
+        return
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + (LLM_TIMEOUT_SECONDS if timeout is None else timeout)
+    acquired = []
+    chunks = _stream_chunks(model, prompt)
+    produced: List[str] = []
+    verdict: Optional[bool] = None
+    try:
+        acquired = await _acquire_slots(agent, deadline)
+        while True:
+            try:
+                text = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+            except StopAsyncIteration:
+                verdict = True
+                record_llm_call(agent, "success" if produced else "empty")
+                if use_cache and produced:
+                    reply = {"text": "".join(produced).strip()}
+                    await asyncio.to_thread(_cache_store, agent, key, reply, loop.time() - started)
+                return
+            if text:
+                produced.append(text)
+                yield text
+    except _QueueTimeout:
+        record_llm_call(agent, "queue_timeout")
+        return
+    except Exception as exc:
+        verdict = False
+        outcome = _failure_outcome(exc)
+        record_llm_call(agent, outcome)
+        if produced:
+            raise LLMStreamInterrupted("".join(produced), outcome) from exc
+        return
+    finally:
+        observe_stage(agent, "llm_stream", loop.time() - started)
+        # A stream the consumer closed early still proves the service is up if it produced text.
+        if verdict or (verdict is None and produced):
+            CIRCUIT_BREAKER.record_success()
+        elif verdict is False:
+            CIRCUIT_BREAKER.record_failure()
+        else:
+            CIRCUIT_BREAKER.record_abandoned()
+        for semaphore in acquired:
+            semaphore.release()
+        await chunks.aclose()
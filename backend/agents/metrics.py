@@ -0,0 +1,262 @@
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# With metrics off, every recording helper returns immediately and /metrics is not served.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Single unlabelled value; string states are exposed as one 0/1 series per state."""
+
+    def __init__(self, name: str, documentation: str, states: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.states = tuple(states)
+        self._value: object = 0
+
+    def set(self, value) -> None:
+        self._value = value
+
+    def clear(self) -> None:
+        # Gauges describe current state, so there is nothing to reset between scrapes or tests.
+        pass
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if self.states:
+            for state in self.states:
+                lines.append(f'{self.name}{{state="{state}"}} {1 if self._value == state else 0}')
+        else:
+            lines.append(f"{self.name} {_format_value(self._value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last slot is +Inf), sum].
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[labels] = series
+            series[0][slot] += 1
+            series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                label_text = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(total[0])}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, states: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, documentation, states)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def clear(self) -> None:
+        for metric in self._metrics:
+            metric.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_duration_seconds",
+    "Time spent in each processing stage (upload read, pdf extraction, retrieval, llm, fallback).",
+    ("agent", "stage"),
+)
+LLM_CALLS = REGISTRY.counter(
+    "llm_calls_total",
+    "Gemini calls by outcome (success, empty, invalid, error, timeout, queue_timeout, unavailable, circuit_open,"
+    " cache_hit).",
+    ("agent", "outcome"),
+)
+AGENT_RESPONSES = REGISTRY.counter(
+    "agent_responses_total",
+    "Agent results by source; source=\"deterministic\" counts fallbacks.",
+    ("agent", "source"),
+)
+LLM_CIRCUIT_STATE = REGISTRY.gauge(
+    "llm_circuit_breaker_state",
+    "Current state of the Gemini circuit breaker.",
+    ("closed", "open", "half_open"),
+)
+REQUEST_BYTES = REGISTRY.histogram(
+    "agent_request_size_bytes",
+    "Size of uploaded files and request payloads.",
+    ("agent",),
+    SIZE_BUCKETS,
+)
+BACKGROUND_JOBS = REGISTRY.counter(
+    "background_jobs_total",
+    "Background job attempts by outcome (success, retry, failed, rejected).",
+    ("queue", "outcome"),
+)
+
+
+class _StageTimer:
+    __slots__ = ("agent", "stage", "started")
+
+    def __init__(self, agent: str, stage: str):
+        self.agent = agent
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.agent, self.stage)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(agent: str, name: str):
+    """Context manager that records the block's wall time under (agent, stage)."""
+    return _StageTimer(agent, name) if METRICS_ENABLED else _NULL_TIMER
+
+
+def observe_stage(agent: str, name: str, seconds: float) -> None:
+    """For stages that cannot be wrapped in a with-block, such as a stream consumed elsewhere."""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, agent, name)
+
+
+def record_llm_call(agent: str, outcome: str) -> None:
+    if METRICS_ENABLED:
+        LLM_CALLS.inc(agent, outcome)
+
+
+def record_response(agent: str, source: Optional[str]) -> None:
+    if METRICS_ENABLED:
+        AGENT_RESPONSES.inc(agent, source or "unknown")
+
+
+def observe_request_size(agent: str, size_bytes: int) -> None:
+    if METRICS_ENABLED:
+        REQUEST_BYTES.observe(size_bytes, agent)
+
+
+def record_job(queue: str, outcome: str) -> None:
+    if METRICS_ENABLED:
+        BACKGROUND_JOBS.inc(queue, outcome)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,196 @@
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+
+# pypdf is imported on first use to keep it off the cold-start path.
+_NOT_LOADED = object()
+PdfReader: Any = _NOT_LOADED
+
+
+def _pdf_reader_class():
+    global PdfReader
+    if PdfReader is _NOT_LOADED:
+        try:
+            from pypdf import PdfReader as reader_class
+        except ImportError:  # pragma: no cover
+            reader_class = None
+        PdfReader = reader_class
+    return PdfReader
+
+
+PdfSource = Union[bytes, str, os.PathLike]
+
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "2000"))
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", "60"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Below this many pages, process start-up and re-parsing cost more than they save.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+# Pages per pool task. At most two tasks per worker are in flight, which bounds how many extracted
+# pages wait in memory for a slow consumer of iter_pages.
+PDF_BATCH_PAGES = int(os.getenv("PDF_BATCH_PAGES", "16"))
+# Forking a process that already runs worker threads and holds SQLite connections can deadlock
+# the child on a lock some other thread held, so pool workers start fresh interpreters instead.
+PDF_POOL_START_METHOD = os.getenv("PDF_POOL_START_METHOD", "spawn")
+
+
+class PdfExtractionError(Exception):
+    pass
+
+
+class PdfExtractionTimeout(PdfExtractionError):
+    pass
+
+
+def _open_reader(source: PdfSource):
+    reader_class = _pdf_reader_class()
+    if reader_class is None:
+        raise PdfExtractionError("pypdf is not installed")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return reader_class(io.BytesIO(source))
+    return reader_class(source)
+
+
+def _extract_page_range(source: PdfSource, start: int, stop: int) -> List[str]:
+    reader = _open_reader(source)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Requests currently extracting on each pool, including retired pools that are no longer handed out.
+_pool_users: Dict[ProcessPoolExecutor, int] = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(PDF_POOL_START_METHOD)
+            )
+        return _pool
+
+
+def _acquire_pool() -> ProcessPoolExecutor:
+    pool = _get_pool()
+    with _pool_lock:
+        _pool_users[pool] = _pool_users.get(pool, 0) + 1
+    return pool
+
+
+def _release_pool(pool: ProcessPoolExecutor, retire: bool = False) -> None:
+    """Stop using a pool; ``retire`` stops handing it to new requests (it broke or has abandoned work).
+
+    A future that is already running cannot be cancelled, so a retired pool's workers are terminated,
+    but only once no other request is still extracting on it.
+    """
+    global _pool
+    with _pool_lock:
+        if retire and _pool is pool:
+            _pool = None
+        users = _pool_users.pop(pool) - 1
+        if users:
+            _pool_users[pool] = users
+        if users or _pool is pool:
+            return
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _iter_serial(reader, start: int, page_count: int, deadline: float) -> Iterator[str]:
+    for index in range(start, page_count):
+        if time.monotonic() > deadline:
+            raise PdfExtractionTimeout(f"PDF extraction exceeded time limit after {index} pages")
+        yield reader.pages[index].extract_text() or ""
+
+
+def _iter_parallel(source: PdfSource, page_count: int, deadline: float) -> Iterator[str]:
+    workers = max(1, PDF_WORKERS)
+    batch = max(1, min(PDF_BATCH_PAGES, -(-page_count // (workers * 2))))
+    starts = iter(range(0, page_count, batch))
+    pool = _acquire_pool()
+    pending: Deque[Future] = deque()
+    retire = False
+    try:
+        for start in islice(starts, workers * 2):
+            pending.append(pool.submit(_extract_page_range, source, start, min(start + batch, page_count)))
+        while pending:
+            try:
+                pages = pending[0].result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                retire = not all(future.cancel() for future in pending)
+                raise PdfExtractionTimeout(f"PDF extraction exceeded time limit ({page_count} pages)") from None
+            pending.popleft()
+            for start in islice(starts, 1):
+                pending.append(pool.submit(_extract_page_range, source, start, min(start + batch, page_count)))
+            yield from pages
+    except (OSError, BrokenProcessPool):
+        retire = True
+        raise
+    finally:
+        # A failed batch or a consumer that stops early leaves queued batches that nobody will read.
+        for future in pending:
+            future.cancel()
+        _release_pool(pool, retire)
+
+
+def _iter_with_fallback(source: PdfSource, reader, page_count: int, deadline: float) -> Iterator[str]:
+    produced = 0
+    try:
+        for page in _iter_parallel(source, page_count, deadline):
+            yield page
+            produced += 1
+    except (OSError, BrokenProcessPool):
+        # No usable process pool (e.g. restricted sandbox or a crashed worker); finish in this thread.
+        yield from _iter_serial(reader, produced, page_count, deadline)
+
+
+def iter_pages(source: PdfSource, max_pages: Optional[int] = None, timeout: Optional[float] = None) -> Iterator[str]:
+    """Text of each page (up to ``max_pages``), extracted as the caller consumes it.
+
+    Large documents are extracted a few batches ahead in a process pool, so only those batches are
+    held in memory. The PDF is opened before this returns, so an unreadable file fails here; a bad
+    page or the time limit (which includes the caller's time between pages) raises while iterating.
+    Errors are PdfExtractionError (or PdfExtractionTimeout); pypdf errors propagate as-is.
+    """
+    deadline = time.monotonic() + (PDF_TIMEOUT_SECONDS if timeout is None else timeout)
+    reader = _open_reader(source)
+    page_count = min(len(reader.pages), PDF_MAX_PAGES if max_pages is None else max_pages)
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+        return _iter_serial(reader, 0, page_count, deadline)
+    return _iter_with_fallback(source, reader, page_count, deadline)
+
+
+def extract_pages(source: PdfSource, max_pages: Optional[int] = None, timeout: Optional[float] = None) -> List[str]:
+    """Text of each page (up to ``max_pages``), extracted in a process pool for large documents.
+
+    Raises PdfExtractionError (or PdfExtractionTimeout) on failure; pypdf errors propagate as-is.
+    """
+    return list(iter_pages(source, max_pages=max_pages, timeout=timeout))
+
+
+def extract_text(source: PdfSource, max_pages: Optional[int] = None, timeout: Optional[float] = None) -> str:
+    return "\n".join(extract_pages(source, max_pages=max_pages, timeout=timeout))
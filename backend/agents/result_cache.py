@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from agents.sqlite_utils import ThreadLocalConnections
+
+
+class _CacheCounters:
+    """Per-process hit/miss accounting shared by the cache backends."""
+
+    def _reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.hits_by_source: Dict[str, int] = {}
+
+    def _record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def _record_hit(self, value: Any, compute_seconds: float) -> None:
+        source = value.get("source", "unknown") if isinstance(value, dict) else "unknown"
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += compute_seconds
+            self.hits_by_source[source] = self.hits_by_source.get(source, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        entries = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "hits_by_source": dict(self.hits_by_source),
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+class MemoryResultCache(_CacheCounters):
+    """In-process LRU cache with per-entry TTL; same interface as SQLiteResultCache."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self._record_miss()
+            return None
+        self._record_hit(entry[0], entry[2])
+        return entry[0]
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None, compute_seconds: float = 0.0) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl, compute_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._reset_counters()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteResultCache(_CacheCounters):
+    """Persistent JSON result cache with per-entry TTL and least-recently-used eviction.
+
+    Backed by SQLite in WAL mode, so several worker processes can share one file.
+    Hit/miss counters are per process.
+    """
+
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    compute_seconds REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_results_accessed_at ON results (accessed_at);
+"""
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = os.path.abspath(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._connections = ThreadLocalConnections(self.path)
+        self._lock = threading.Lock()
+        self._connect().executescript(self.SCHEMA)
+        self._reset_counters()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at, compute_seconds FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            if row is not None:
+                conn.execute("DELETE FROM results WHERE key = ? AND expires_at <= ?", (key, now))
+            self._record_miss()
+            return None
+
+        conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        value = json.loads(row[0])
+        self._record_hit(value, row[2])
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None, compute_seconds: float = 0.0) -> None:
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at, accessed_at, compute_seconds) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now, compute_seconds),
+        )
+        conn.execute(
+            "DELETE FROM results WHERE key IN "
+            "(SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        return self._connect().execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM results")
+        with self._lock:
+            self._reset_counters()
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+class TieredResultCache:
+    """Memory tier in front of an optional persistent tier; disk hits are promoted to memory."""
+
+    def __init__(self, memory: MemoryResultCache, disk: Optional[SQLiteResultCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None, compute_seconds: float = 0.0) -> None:
+        self.memory.set(key, value, ttl_seconds=ttl_seconds, compute_seconds=compute_seconds)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl_seconds=ttl_seconds, compute_seconds=compute_seconds)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def __len__(self) -> int:
+        return len(self.disk) if self.disk is not None else len(self.memory)
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self.memory.stats()
+        disk = self.disk.stats() if self.disk is not None else None
+        # Every lookup reaches memory; only memory misses reach disk.
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + (disk["hits"] if disk else 0)
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": memory,
+            "disk": disk,
+        }
@@ -0,0 +1,58 @@
+import heapq
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+
+def bm25_idf(doc_count: int, doc_freq: int) -> float:
+    return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+class BM25Index:
+    """Inverted index over pre-tokenized chunks with Okapi BM25 scoring."""
+
+    def __init__(self, tokenized_chunks: Iterable[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+
+        for chunk_id, tokens in enumerate(tokenized_chunks):
+            self.doc_lengths.append(len(tokens))
+            for token, freq in Counter(tokens).items():
+                self.postings.setdefault(token, []).append((chunk_id, freq))
+
+        self.doc_count = len(self.doc_lengths)
+        self.avg_length = (sum(self.doc_lengths) / self.doc_count) if self.doc_count else 0.0
+        self.idf = {token: self._idf(len(postings)) for token, postings in self.postings.items()}
+
+    def _idf(self, doc_freq: int) -> float:
+        return bm25_idf(self.doc_count, doc_freq)
+
+    def doc_freq(self, token: str) -> int:
+        return len(self.postings.get(token, ()))
+
+    def search(self, query_tokens: List[str], limit: int = 3) -> List[Tuple[float, int]]:
+        """Return up to ``limit`` (score, chunk_id) pairs, best first; ties keep document order."""
+        if not query_tokens or not self.doc_count or limit <= 0:
+            return []
+
+        scores: Dict[int, float] = {}
+        avg_length = self.avg_length or 1.0
+        for token, query_freq in Counter(query_tokens).items():
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = self.idf[token] * query_freq
+            for chunk_id, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(score, chunk_id) for chunk_id, score in top]
+
+    def size_bytes(self) -> int:
+        """Rough memory footprint used for cache accounting."""
+        token_bytes = sum(len(token) for token in self.postings)
+        posting_bytes = 16 * sum(len(postings) for postings in self.postings.values())
+        return token_bytes + posting_bytes + 8 * self.doc_count
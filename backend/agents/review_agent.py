@@ -1,7 +1,31 @@
+import asyncio
+import csv
+import io
+import os
 import re
-from typing import Dict, Optional
+import threading
+import unicodedata
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from agents.llm_client import generate_json
+from agents.deadline import race_llm_with_fallback
+from agents.doc_cache import content_hash
+from agents.llm_client import generate_json, generate_json_async
+from agents.metrics import record_response
+from agents.result_cache import MemoryResultCache, SQLiteResultCache, TieredResultCache
+
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "20"))
+# Batches of one bulk request that may call the LLM at once. Keep it at or below the review agent's LLM
+# concurrency limit: batches queued behind that limit spend their timeout waiting and fall back.
+REVIEW_BULK_CONCURRENCY = int(os.getenv("REVIEW_BULK_CONCURRENCY", "4"))
+
+REVIEW_CACHE_TTL_SECONDS = float(os.getenv("REVIEW_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+REVIEW_CACHE_MAX_ENTRIES = int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", "5000"))
+# Set a path to add an on-disk tier that survives restarts and is shared between workers.
+REVIEW_CACHE_PATH = os.getenv("REVIEW_CACHE_PATH", "")
+REVIEW_CACHE_DISK_MAX_ENTRIES = int(os.getenv("REVIEW_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+_review_caches: Dict[str, TieredResultCache] = {}
+_review_caches_lock = threading.Lock()
 
 POSITIVE_WORDS = {
     "great", "excellent", "amazing", "friendly", "best", "love", "perfect", "quick", "awesome", "delicious",
@@ -23,8 +47,44 @@ def _sentiment(review_text: str) -> str:
     return "Neutral"
 
 
-def _llm_review_response(review_text: str, business_name: str) -> Optional[Dict[str, str]]:
-    prompt = f"""
+def get_review_cache() -> TieredResultCache:
+    key = os.path.abspath(REVIEW_CACHE_PATH) if REVIEW_CACHE_PATH else ""
+    cache = _review_caches.get(key)
+    if cache is not None:
+        return cache
+
+    with _review_caches_lock:
+        cache = _review_caches.get(key)
+        if cache is None:
+            disk = None
+            if REVIEW_CACHE_PATH:
+                disk = SQLiteResultCache(REVIEW_CACHE_PATH, REVIEW_CACHE_TTL_SECONDS, REVIEW_CACHE_DISK_MAX_ENTRIES)
+            cache = TieredResultCache(MemoryResultCache(REVIEW_CACHE_TTL_SECONDS, REVIEW_CACHE_MAX_ENTRIES), disk)
+            _review_caches[key] = cache
+    return cache
+
+
+def _drop_punctuation(match: re.Match) -> str:
+    char = match.group()
+    return " " if unicodedata.category(char).startswith("P") else char
+
+
+def _normalize_review(review_text: str) -> str:
+    # "Great service!!" and "great   service" should share one cached reply. Emoji and other
+    # symbols are kept: "😍👍" and "😡😡😡" must not collapse to the same key.
+    return " ".join(re.sub(r"[^\w\s]", _drop_punctuation, review_text.lower()).split())
+
+
+def _review_cache_key(review_text: str, business_name: str) -> Optional[str]:
+    """None when nothing but punctuation is left (such reviews are never cached)."""
+    normalized = _normalize_review(review_text)
+    if not normalized:
+        return None
+    return content_hash(f"{business_name.strip()}\n{normalized}".encode())
+
+
+def _review_prompt(review_text: str, business_name: str) -> str:
+    return f"""
 You are a customer support response writer for {business_name}.
 Return strict JSON with keys:
 - sentiment: one of Positive, Negative, Neutral
@@ -36,7 +96,9 @@ Rules:
 Customer review:
 {review_text}
 """
-    data = generate_json(prompt)
+
+
+def _validate_review_response(data: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
     if not data:
         return None
 
@@ -47,12 +109,35 @@ Customer review:
     return None
 
 
-def generate_review_response(review_text: str, business_name: str = "Our Company") -> Dict[str, str]:
-    llm_result = _llm_review_response(review_text, business_name)
-    if llm_result:
-        llm_result["source"] = "gemini"
-        return llm_result
+def _llm_review_response(review_text: str, business_name: str) -> Optional[Dict[str, str]]:
+    cache = get_review_cache()
+    key = _review_cache_key(review_text, business_name)
+    cached = cache.get(key) if key is not None else None
+    if cached is not None:
+        return dict(cached)
+
+    result = _validate_review_response(generate_json(_review_prompt(review_text, business_name), agent="review"))
+    if result and key is not None:
+        cache.set(key, dict(result))
+    return result
+
 
+async def _llm_review_response_async(review_text: str, business_name: str) -> Optional[Dict[str, str]]:
+    # With REVIEW_CACHE_PATH set the cache reads and writes SQLite, so it runs in a worker thread.
+    cache = get_review_cache()
+    key = _review_cache_key(review_text, business_name)
+    cached = await asyncio.to_thread(cache.get, key) if key is not None else None
+    if cached is not None:
+        return dict(cached)
+
+    data = await generate_json_async(_review_prompt(review_text, business_name), agent="review")
+    result = _validate_review_response(data)
+    if result and key is not None:
+        await asyncio.to_thread(cache.set, key, dict(result))
+    return result
+
+
+def _deterministic_review_response(review_text: str, business_name: str) -> Dict[str, str]:
     sentiment = _sentiment(review_text)
     support_email = f"support@{business_name.lower().replace(' ', '')}.com"
 
@@ -75,3 +160,140 @@ def generate_review_response(review_text: str, business_name: str = "Our Company
         )
 
     return {"response": response, "sentiment": sentiment, "source": "deterministic"}
+
+
+def generate_review_response(review_text: str, business_name: str = "Our Company") -> Dict[str, str]:
+    llm_result = _llm_review_response(review_text, business_name)
+    if llm_result:
+        record_response("review", "gemini")
+        llm_result["source"] = "gemini"
+        return llm_result
+
+    record_response("review", "deterministic")
+    return _deterministic_review_response(review_text, business_name)
+
+
+async def generate_review_response_async(review_text: str, business_name: str = "Our Company") -> Dict[str, str]:
+    source, result = await race_llm_with_fallback(
+        _llm_review_response_async(review_text, business_name),
+        lambda: _deterministic_review_response(review_text, business_name),
+        "review",
+    )
+    record_response("review", source)
+    if source == "gemini":
+        result["source"] = "gemini"
+    return result
+
+
+def _review_batch_prompt(reviews: List[str], business_name: str) -> str:
+    numbered = "\n".join(f"[{i}] {text}" for i, text in enumerate(reviews))
+    return f"""
+You are a customer support response writer for {business_name}.
+For EACH numbered review below, write a public reply.
+Return strict JSON: {{"results": [{{"id": number, "sentiment": "Positive"|"Negative"|"Neutral", "response": string}}]}}
+with exactly one result per review id.
+Rules:
+- If negative: empathetic, non-defensive, offer support via email support@{business_name.lower().replace(' ', '')}.com and sign with Customer Success Team.
+- If positive: thank warmly, mention what they liked, invite them back.
+- If neutral: thank and acknowledge feedback.
+Customer reviews:
+{numbered}
+"""
+
+
+async def _llm_review_batch_async(reviews: List[str], business_name: str) -> Dict[int, Dict[str, str]]:
+    """One Gemini call for a whole batch; returns only the items that validate, keyed by position."""
+    data = await generate_json_async(_review_batch_prompt(reviews, business_name), agent="review")
+    results = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        return {}
+
+    validated: Dict[int, Dict[str, str]] = {}
+    for item in results:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), int):
+            continue
+        if 0 <= item["id"] < len(reviews):
+            checked = _validate_review_response(item)
+            if checked:
+                validated[item["id"]] = checked
+    return validated
+
+
+def _cache_lookups(cache: TieredResultCache, keys: List[Optional[str]]) -> List[Optional[Dict[str, str]]]:
+    return [cache.get(key) if key is not None else None for key in keys]
+
+
+def _cache_stores(cache: TieredResultCache, entries: List[Tuple[str, Dict[str, str]]]) -> None:
+    for key, value in entries:
+        cache.set(key, value)
+
+
+async def generate_review_responses_bulk_async(
+    reviews: List[str], business_name: str = "Our Company", batch_size: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Answer many reviews with one LLM call per batch, yielding each batch's items as it completes.
+
+    Items the model skipped or answered invalidly fall back to the sentiment templates individually.
+    At most REVIEW_BULK_CONCURRENCY batches are in flight; the rest start as earlier ones finish, so
+    their LLM timeout does not run while they wait.
+    """
+    size = max(1, batch_size or REVIEW_BATCH_SIZE)
+    cache = get_review_cache()
+
+    # Cached replies go out immediately; only the misses are packed into LLM batches.
+    keys = [_review_cache_key(review_text, business_name) for review_text in reviews]
+    found = await asyncio.to_thread(_cache_lookups, cache, keys)
+    pending: List[int] = []
+    for index, cached in enumerate(found):
+        if cached is not None:
+            record_response("review", "gemini")
+            yield {"index": index, **cached, "source": "gemini"}
+        else:
+            pending.append(index)
+
+    slots = asyncio.Semaphore(max(1, REVIEW_BULK_CONCURRENCY))
+
+    async def run(indices: List[int]) -> List[Dict[str, Any]]:
+        batch = [reviews[index] for index in indices]
+        async with slots:
+            answered = await _llm_review_batch_async(batch, business_name)
+        items = []
+        fresh: List[Tuple[str, Dict[str, str]]] = []
+        for offset, index in enumerate(indices):
+            result = answered.get(offset)
+            if result:
+                if keys[index] is not None:
+                    fresh.append((keys[index], dict(result)))
+                record_response("review", "gemini")
+                result = {**result, "source": "gemini"}
+            else:
+                record_response("review", "deterministic")
+                result = _deterministic_review_response(reviews[index], business_name)
+            items.append({"index": index, **result})
+        if fresh:
+            await asyncio.to_thread(_cache_stores, cache, fresh)
+        return items
+
+    tasks = [asyncio.ensure_future(run(pending[start:start + size])) for start in range(0, len(pending), size)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            for item in await finished:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def parse_review_csv(text: str) -> List[str]:
+    """Review texts from CSV: the "review" column when there is a header naming one, else the first column."""
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = 0
+    if "review" in header:
+        column = header.index("review")
+        rows = rows[1:]
+
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
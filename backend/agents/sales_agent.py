@@ -1,8 +1,17 @@
 import re
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from agents.llm_client import generate_json, generate_text
+from agents.deadline import race_llm_with_fallback
+from agents.llm_client import (
+    LLMStreamInterrupted,
+    generate_json,
+    generate_json_async,
+    generate_text,
+    generate_text_async,
+    stream_text_async,
+)
+from agents.metrics import record_response, stage
 
 
 def _extract_budget(text: str) -> Optional[str]:
@@ -69,27 +78,67 @@ def _extract_location(text: str) -> Optional[str]:
     return None
 
 
-def _extract_lead_data(history: List[Dict[str, str]]) -> Dict[str, Optional[str]]:
-    budget = None
-    location = None
-    timeline = None
-    phone = None
-
-    for msg in history:
-        if msg.get("role") != "user":
-            continue
-        content = msg.get("content", "")
-        budget = budget or _extract_budget(content)
-        location = location or _extract_location(content)
-        timeline = timeline or _extract_timeline(content)
-        phone = phone or _extract_phone(content)
+class LeadExtractionState:
+    """Lead fields found so far plus how many history messages have been scanned.
+
+    update() only looks at messages past that point, so a conversation is scanned once overall
+    instead of once per turn. to_dict()/from_dict() let the state travel with the conversation.
+    """
+
+    FIELDS = ("budget", "location", "timeline", "contact_number")
+
+    def __init__(
+        self,
+        budget: Optional[str] = None,
+        location: Optional[str] = None,
+        timeline: Optional[str] = None,
+        contact_number: Optional[str] = None,
+        processed: int = 0,
+    ):
+        self.budget = budget
+        self.location = location
+        self.timeline = timeline
+        self.contact_number = contact_number
+        self.processed = processed
+
+    def update(self, history: List[Dict[str, str]]) -> "LeadExtractionState":
+        if self.processed > len(history):
+            # History is shorter than what was scanned (client reset or edited it); start over.
+            self.budget = self.location = self.timeline = self.contact_number = None
+            self.processed = 0
+
+        for msg in history[self.processed:]:
+            if msg.get("role") != "user" or self.is_complete():
+                continue
+            content = msg.get("content", "")
+            self.budget = self.budget or _extract_budget(content)
+            self.location = self.location or _extract_location(content)
+            self.timeline = self.timeline or _extract_timeline(content)
+            self.contact_number = self.contact_number or _extract_phone(content)
+
+        self.processed = len(history)
+        return self
+
+    def is_complete(self) -> bool:
+        return all(getattr(self, field) for field in self.FIELDS)
+
+    def as_data(self) -> Dict[str, Optional[str]]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.as_data(), "processed": self.processed}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "LeadExtractionState":
+        if not data:
+            return cls()
+        values = {field: data.get(field) if isinstance(data.get(field), str) else None for field in cls.FIELDS}
+        processed = data.get("processed")
+        return cls(**values, processed=processed if isinstance(processed, int) and processed >= 0 else 0)
 
-    return {
-        "budget": budget,
-        "location": location,
-        "timeline": timeline,
-        "contact_number": phone,
-    }
+
+def _extract_lead_data(history: List[Dict[str, str]]) -> Dict[str, Optional[str]]:
+    return LeadExtractionState().update(history).as_data()
 
 
 def _missing_fields(data: Dict[str, Optional[str]]) -> List[str]:
@@ -105,8 +154,18 @@ def _missing_fields(data: Dict[str, Optional[str]]) -> List[str]:
     return missing
 
 
-def _llm_qualify_response(history: List[Dict[str, str]], current_message: str, missing: List[str]) -> Optional[str]:
-    prompt = f"""
+QUALIFIED_REPLY = "Thank you! I have qualified your lead."
+
+FOLLOW_UP_MAP = {
+    "budget": "Great, what budget range are you considering?",
+    "location": "Got it. Which location or neighborhood are you targeting?",
+    "move-in date": "When are you planning to move in?",
+    "contact number": "Thanks. Could you also share your best contact number?",
+}
+
+
+def _qualify_prompt(history: List[Dict[str, str]], current_message: str, missing: List[str]) -> str:
+    return f"""
 You are Sarah, a real-estate intake assistant.
 Current user message: {current_message}
 Current missing fields: {missing}
@@ -117,41 +176,107 @@ Rules:
 - Otherwise ask only ONE short follow-up question for the next missing field.
 - Keep response under 20 words.
 """
-    reply = generate_text(prompt)
+
+
+def _llm_qualify_response(history: List[Dict[str, str]], current_message: str, missing: List[str]) -> Optional[str]:
+    reply = generate_text(_qualify_prompt(history, current_message, missing), agent="sales")
+    if not reply:
+        return None
+    return reply.strip()
+
+
+async def _llm_qualify_response_async(
+    history: List[Dict[str, str]], current_message: str, missing: List[str]
+) -> Optional[str]:
+    reply = await generate_text_async(_qualify_prompt(history, current_message, missing), agent="sales")
     if not reply:
         return None
     return reply.strip()
 
 
-def qualify_lead(history: List[Dict[str, str]], current_message: str) -> str:
+async def _llm_qualify_stream(
+    history: List[Dict[str, str]], current_message: str, missing: List[str]
+) -> AsyncIterator[str]:
+    async for text in stream_text_async(_qualify_prompt(history, current_message, missing), agent="sales"):
+        yield text
+
+
+def _prepare_qualify(
+    history: List[Dict[str, str]], current_message: str, state: Optional[LeadExtractionState]
+) -> Tuple[List[Dict[str, str]], List[str]]:
     deduped_history = history.copy()
     if not deduped_history or deduped_history[-1].get("content") != current_message:
         deduped_history.append({"role": "user", "content": current_message})
 
-    data = _extract_lead_data(deduped_history)
-    missing = _missing_fields(data)
+    state = state if state is not None else LeadExtractionState()
+    with stage("sales", "extract_fields"):
+        data = state.update(deduped_history).as_data()
+    return deduped_history, _missing_fields(data)
 
-    llm_reply = _llm_qualify_response(deduped_history, current_message, missing)
+
+def _qualify_reply(deduped_history: List[Dict[str, str]], missing: List[str], llm_reply: Optional[str]) -> str:
+    record_response("sales", "gemini" if llm_reply and missing else "deterministic")
     if llm_reply:
         if not missing:
-            return "Thank you! I have qualified your lead."
+            return QUALIFIED_REPLY
         return llm_reply
 
     if not missing:
-        return "Thank you! I have qualified your lead."
+        return QUALIFIED_REPLY
 
     next_field = missing[0]
-    follow_up_map = {
-        "budget": "Great, what budget range are you considering?",
-        "location": "Got it. Which location or neighborhood are you targeting?",
-        "move-in date": "When are you planning to move in?",
-        "contact number": "Thanks. Could you also share your best contact number?",
-    }
-
     if len([m for m in deduped_history if m.get("role") == "user"]) <= 1:
-        return "Hi! I can help with that. " + follow_up_map[next_field]
+        return "Hi! I can help with that. " + FOLLOW_UP_MAP[next_field]
+
+    return FOLLOW_UP_MAP[next_field]
+
+
+def qualify_lead(
+    history: List[Dict[str, str]], current_message: str, state: Optional[LeadExtractionState] = None
+) -> str:
+    """Reply to the next chat turn. Pass a LeadExtractionState to reuse (and advance) earlier extraction."""
+    deduped_history, missing = _prepare_qualify(history, current_message, state)
+    llm_reply = _llm_qualify_response(deduped_history, current_message, missing)
+    return _qualify_reply(deduped_history, missing, llm_reply)
+
 
-    return follow_up_map[next_field]
+async def qualify_lead_async(
+    history: List[Dict[str, str]], current_message: str, state: Optional[LeadExtractionState] = None
+) -> str:
+    deduped_history, missing = _prepare_qualify(history, current_message, state)
+    source, llm_reply = await race_llm_with_fallback(
+        _llm_qualify_response_async(deduped_history, current_message, missing), lambda: None, "sales"
+    )
+    return _qualify_reply(deduped_history, missing, llm_reply if source == "gemini" else None)
+
+
+async def stream_qualify_lead_async(
+    history: List[Dict[str, str]], current_message: str, state: Optional[LeadExtractionState] = None
+) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
+    """Yield ("token", {"text"}) events for the reply, then ("done", {"response"}) with the full reply.
+
+    If the model stream breaks off, "done" carries the deterministic reply and "interrupted": True,
+    and clients should show it in place of the tokens received so far.
+    """
+    deduped_history, missing = _prepare_qualify(history, current_message, state)
+
+    parts: List[str] = []
+    interrupted = False
+    if missing:
+        try:
+            async for text in _llm_qualify_stream(deduped_history, current_message, missing):
+                parts.append(text)
+                yield "token", {"text": text}
+        except LLMStreamInterrupted:
+            interrupted = True
+
+    reply = _qualify_reply(deduped_history, missing, None if interrupted else "".join(parts).strip() or None)
+    if not parts:
+        yield "token", {"text": reply}
+    if interrupted:
+        yield "done", {"response": reply, "interrupted": True}
+    else:
+        yield "done", {"response": reply}
 
 
 def _to_int_budget(budget_str: Optional[str]) -> int:
@@ -200,8 +325,8 @@ def _deterministic_score(data: Dict[str, Optional[str]]) -> Dict[str, Any]:
     return {"lead_score": score, "status": status}
 
 
-def _llm_score_lead(history: List[Dict[str, str]], data: Dict[str, Optional[str]]) -> Optional[Dict[str, Any]]:
-    prompt = f"""
+def _score_prompt(history: List[Dict[str, str]], data: Dict[str, Optional[str]]) -> str:
+    return f"""
 Analyze this lead conversation and return strict JSON with keys:
 budget, location, timeline, contact_number, lead_score, status, summary.
 status must be one of Hot, Warm, Cold.
@@ -210,7 +335,9 @@ If a field is unknown, set to "Unknown".
 Conversation: {history}
 Current extracted fields: {data}
 """
-    result = generate_json(prompt)
+
+
+def _validate_llm_score(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     if not result:
         return None
 
@@ -224,11 +351,18 @@ Current extracted fields: {data}
     return result
 
 
-def score_lead(history: List[Dict[str, str]]) -> Dict[str, Any]:
-    data = _extract_lead_data(history)
-    scored = _deterministic_score(data)
+def _llm_score_lead(history: List[Dict[str, str]], data: Dict[str, Optional[str]]) -> Optional[Dict[str, Any]]:
+    return _validate_llm_score(generate_json(_score_prompt(history, data), agent="sales"))
 
-    llm_scored = _llm_score_lead(history, data)
+
+async def _llm_score_lead_async(
+    history: List[Dict[str, str]], data: Dict[str, Optional[str]]
+) -> Optional[Dict[str, Any]]:
+    return _validate_llm_score(await generate_json_async(_score_prompt(history, data), agent="sales"))
+
+
+def _lead_record(data: Dict[str, Optional[str]], llm_scored: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    record_response("lead_scoring", "gemini" if llm_scored else "deterministic")
     if llm_scored:
         return {
             "budget": llm_scored.get("budget") or data.get("budget") or "Unknown",
@@ -242,6 +376,7 @@ def score_lead(history: List[Dict[str, str]]) -> Dict[str, Any]:
             "captured_at": datetime.utcnow().isoformat() + "Z",
         }
 
+    scored = _deterministic_score(data)
     summary = (
         f"Lead interested in {data.get('location') or 'unspecified area'}"
         f" with budget {data.get('budget') or 'unknown'}"
@@ -259,3 +394,41 @@ def score_lead(history: List[Dict[str, str]]) -> Dict[str, Any]:
         "source": "deterministic",
         "captured_at": datetime.utcnow().isoformat() + "Z",
     }
+
+
+def pending_lead_record(data: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """What is stored for a captured lead while it waits for background scoring."""
+    return {
+        "budget": data.get("budget") or "Unknown",
+        "location": data.get("location") or "Unknown",
+        "timeline": data.get("timeline") or "Unknown",
+        "contact_number": data.get("contact_number") or "Unknown",
+        "lead_score": 0,
+        "status": None,
+        "summary": "Lead scoring in progress.",
+        "source": None,
+        "captured_at": datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def lead_fields(history: List[Dict[str, str]], state: Optional[LeadExtractionState]) -> Dict[str, Optional[str]]:
+    state = state if state is not None else LeadExtractionState()
+    with stage("sales", "extract_fields"):
+        return state.update(history).as_data()
+
+
+def score_lead_fields(history: List[Dict[str, str]], data: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """score_lead for fields already extracted, e.g. by the request that queued the scoring job."""
+    return _lead_record(data, _llm_score_lead(history, data))
+
+
+def score_lead(history: List[Dict[str, str]], state: Optional[LeadExtractionState] = None) -> Dict[str, Any]:
+    return score_lead_fields(history, lead_fields(history, state))
+
+
+async def score_lead_async(
+    history: List[Dict[str, str]], state: Optional[LeadExtractionState] = None
+) -> Dict[str, Any]:
+    data = lead_fields(history, state)
+    source, llm_scored = await race_llm_with_fallback(_llm_score_lead_async(history, data), lambda: None, "sales")
+    return _lead_record(data, llm_scored if source == "gemini" else None)
@@ -0,0 +1,196 @@
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from agents.chunker import Chunk
+
+# On-disk inverted index for one document, read through mmap without loading it into memory.
+#
+# Layout: header, then 8-byte aligned sections
+#   chunk_offsets  uint64[n_chunks + 1]  byte offsets of each chunk's text in the text blob
+#   chunk_lengths  uint32[n_chunks]      token count of each chunk (BM25 length normalisation)
+#   chunk_spans    uint32[3 * n_chunks]  (page, start, end) of each chunk in its page's extracted text
+#   term_offsets   uint32[n_terms + 1]   byte offsets of each term in the term blob (terms sorted)
+#   term_postings  uint32[n_terms + 1]   index of each term's first posting
+#   posting_chunks uint32[n_postings]    chunk id of each posting, ascending within a term
+#   posting_freqs  uint32[n_postings]    term frequency of each posting
+#   term_blob      UTF-8 terms, concatenated
+#   text_blob      UTF-8 chunk texts, concatenated
+# Arrays are stored in the writer's byte order, which the header records.
+SEGMENT_MAGIC = b"SOPSEG01"
+_HEADER = struct.Struct("<8sB3xIIIQ9Q")
+_SECTIONS = (
+    "chunk_offsets", "chunk_lengths", "chunk_spans", "term_offsets", "term_postings",
+    "posting_chunks", "posting_freqs", "term_blob", "text_blob",
+)
+_BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def write_segment(path: str, chunks: Sequence[Chunk], tokenized_chunks: Iterable[List[str]]) -> int:
+    """Write a segment atomically (temp file + rename); returns the total token count."""
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    chunk_lengths = array.array("I")
+    for chunk_id, tokens in enumerate(tokenized_chunks):
+        chunk_lengths.append(len(tokens))
+        for token, freq in Counter(tokens).items():
+            postings.setdefault(token, []).append((chunk_id, freq))
+
+    chunk_offsets = array.array("Q", [0])
+    chunk_spans = array.array("I")
+    text_parts = []
+    for chunk in chunks:
+        encoded = chunk.text.encode("utf-8")
+        text_parts.append(encoded)
+        chunk_offsets.append(chunk_offsets[-1] + len(encoded))
+        chunk_spans.extend((chunk.page, chunk.start, chunk.end))
+
+    # Code point order equals UTF-8 byte order, so readers can binary-search the raw bytes.
+    terms = sorted(postings)
+    term_offsets = array.array("I", [0])
+    term_postings = array.array("I", [0])
+    posting_chunks = array.array("I")
+    posting_freqs = array.array("I")
+    term_parts = []
+    for term in terms:
+        encoded = term.encode("utf-8")
+        term_parts.append(encoded)
+        term_offsets.append(term_offsets[-1] + len(encoded))
+        for chunk_id, freq in postings[term]:
+            posting_chunks.append(chunk_id)
+            posting_freqs.append(freq)
+        term_postings.append(len(posting_chunks))
+
+    sections = [
+        chunk_offsets.tobytes(), chunk_lengths.tobytes(), chunk_spans.tobytes(),
+        term_offsets.tobytes(), term_postings.tobytes(),
+        posting_chunks.tobytes(), posting_freqs.tobytes(), b"".join(term_parts), b"".join(text_parts),
+    ]
+    offsets = []
+    position = _aligned(_HEADER.size)
+    for section in sections:
+        offsets.append(position)
+        position = _aligned(position + len(section))
+
+    total_tokens = sum(chunk_lengths)
+    header = _HEADER.pack(SEGMENT_MAGIC, _BYTE_ORDER, len(chunk_lengths), len(terms), 0, total_tokens, *offsets)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for offset, section in zip(offsets, sections):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(section)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return total_tokens
+
+
+class Segment:
+    """Read-only, memory-mapped view of a file written by write_segment."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an index segment")
+        magic, byte_order, n_chunks, n_terms, _, total_tokens, *offsets = _HEADER.unpack_from(self._mmap)
+        if magic != SEGMENT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an index segment")
+        if byte_order != _BYTE_ORDER:
+            self._mmap.close()
+            raise ValueError(f"{path} was written on a machine with a different byte order")
+
+        self.chunk_count = n_chunks
+        self.term_count = n_terms
+        self.total_tokens = total_tokens
+        self._view = memoryview(self._mmap)
+        bounds = dict(zip(_SECTIONS, zip(offsets, offsets[1:] + [len(self._mmap)])))
+
+        def section(name: str, fmt: str, count: int) -> memoryview:
+            start = bounds[name][0]
+            itemsize = array.array(fmt).itemsize
+            return self._view[start:start + count * itemsize].cast(fmt)
+
+        self._chunk_offsets = section("chunk_offsets", "Q", n_chunks + 1)
+        self._chunk_lengths = section("chunk_lengths", "I", n_chunks)
+        self._chunk_spans = section("chunk_spans", "I", 3 * n_chunks)
+        self._term_offsets = section("term_offsets", "I", n_terms + 1)
+        self._term_postings = section("term_postings", "I", n_terms + 1)
+        n_postings = self._term_postings[n_terms] if n_terms else 0
+        self._posting_chunks = section("posting_chunks", "I", n_postings)
+        self._posting_freqs = section("posting_freqs", "I", n_postings)
+        self._term_blob = bounds["term_blob"][0]
+        self._text_blob = bounds["text_blob"][0]
+
+    def _term(self, index: int) -> bytes:
+        start = self._term_blob + self._term_offsets[index]
+        return self._mmap[start:self._term_blob + self._term_offsets[index + 1]]
+
+    def _find(self, term: str) -> Optional[int]:
+        target = term.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.term_count and self._term(low) == target else None
+
+    def doc_freq(self, term: str) -> int:
+        index = self._find(term)
+        return 0 if index is None else self._term_postings[index + 1] - self._term_postings[index]
+
+    def postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """(chunk ids, term frequencies) for a term; both empty if it does not occur."""
+        index = self._find(term)
+        if index is None:
+            return (), ()
+        start, end = self._term_postings[index], self._term_postings[index + 1]
+        return self._posting_chunks[start:end], self._posting_freqs[start:end]
+
+    @property
+    def chunk_lengths(self) -> Sequence[int]:
+        """Token count per chunk, indexed by chunk id (a view into the mapped file)."""
+        return self._chunk_lengths
+
+    def chunk_length(self, chunk_id: int) -> int:
+        return self._chunk_lengths[chunk_id]
+
+    def chunk_span(self, chunk_id: int) -> Tuple[int, int, int]:
+        """(page, start, end) of the chunk within its page's extracted text."""
+        position = 3 * chunk_id
+        return tuple(self._chunk_spans[position:position + 3])
+
+    def chunk_text(self, chunk_id: int) -> str:
+        start = self._text_blob + self._chunk_offsets[chunk_id]
+        end = self._text_blob + self._chunk_offsets[chunk_id + 1]
+        return self._mmap[start:end].decode("utf-8")
+
+    def close(self) -> None:
+        for name in ("_chunk_offsets", "_chunk_lengths", "_chunk_spans", "_term_offsets", "_term_postings",
+                     "_posting_chunks", "_posting_freqs", "_view"):
+            getattr(self, name).release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A search still holds a postings slice; the mapping is closed when that is garbage collected.
+            pass
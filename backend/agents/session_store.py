@@ -0,0 +1,62 @@
+import os
+import secrets
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+from agents.result_cache import MemoryResultCache, SQLiteResultCache
+
+# "memory" keeps sessions in this process; "sqlite" shares them between workers through one file.
+SALES_SESSION_BACKEND = os.getenv("SALES_SESSION_BACKEND", "memory")
+SALES_SESSION_DB_PATH = os.getenv("SALES_SESSION_DB_PATH", "sales_sessions.db")
+SALES_SESSION_TTL_SECONDS = float(os.getenv("SALES_SESSION_TTL_SECONDS", "1800"))
+SALES_SESSION_MAX = int(os.getenv("SALES_SESSION_MAX", "10000"))
+
+SessionBackend = Union[MemoryResultCache, SQLiteResultCache]
+
+
+class SalesSessionStore:
+    """Server-side sales chat sessions: history plus serialized lead state, with sliding TTL."""
+
+    def __init__(self, backend: SessionBackend):
+        self.backend = backend
+
+    def create(self) -> str:
+        session_id = secrets.token_urlsafe(16)
+        self.save(session_id, [], None)
+        return session_id
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.backend.get(session_id)
+
+    def save(self, session_id: str, history: List[Dict[str, str]], lead_state: Optional[Dict[str, Any]]) -> None:
+        # Saving re-arms the TTL, so active conversations never expire mid-chat.
+        self.backend.set(session_id, {"history": history, "lead_state": lead_state})
+
+    def delete(self, session_id: str) -> None:
+        self.backend.delete(session_id)
+
+
+_stores: Dict[str, SalesSessionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_session_store() -> SalesSessionStore:
+    if SALES_SESSION_BACKEND == "sqlite":
+        key = "sqlite:" + os.path.abspath(SALES_SESSION_DB_PATH)
+    else:
+        key = "memory"
+
+    store = _stores.get(key)
+    if store is not None:
+        return store
+
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if SALES_SESSION_BACKEND == "sqlite":
+                backend = SQLiteResultCache(SALES_SESSION_DB_PATH, SALES_SESSION_TTL_SECONDS, SALES_SESSION_MAX)
+            else:
+                backend = MemoryResultCache(SALES_SESSION_TTL_SECONDS, SALES_SESSION_MAX)
+            store = SalesSessionStore(backend)
+            _stores[key] = store
+    return store
@@ -1,96 +1,156 @@
-import io
-import re
-from collections import Counter
-from typing import Dict, List
+import array
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from agents.llm_client import generate_text
+from agents.chunker import iter_page_chunks
+from agents.deadline import race_llm_with_fallback
+from agents.doc_cache import CachedDocument, DocumentCache
+from agents.llm_client import LLMStreamInterrupted, generate_text, generate_text_async, stream_text_async
+from agents.metrics import observe_stage, record_response, stage
+from agents.pdf_extract import iter_pages
+from agents.retrieval import BM25Index
+from agents.sop_text import sop_prompt, tokenize
+from agents.uploads import UploadData, upload_digest, upload_source
 
-try:
-    from pypdf import PdfReader
-except ImportError:  # pragma: no cover
-    PdfReader = None
+NOT_FOUND_ANSWER = "I cannot find that information in the provided document."
 
+DOCUMENT_CACHE = DocumentCache(
+    max_entries=int(os.getenv("SOP_CACHE_MAX_DOCS", "32")),
+    max_bytes=int(os.getenv("SOP_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+)
 
-STOP_WORDS = {
-    "the", "a", "an", "and", "or", "to", "of", "in", "on", "for", "with", "is", "are", "was", "were",
-    "this", "that", "it", "as", "at", "by", "from", "be", "what", "how", "when", "where", "who", "why",
-}
 
+def extract_pages_from_pdf(source: Union[bytes, str]) -> Iterator[str]:
+    """Text of each page, extracted while the caller consumes it.
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    if PdfReader is None:
-        return "Error reading PDF: pypdf is not installed"
+    Raises if the PDF cannot be opened; a page that cannot be read raises during iteration.
+    """
+    started = time.perf_counter()
+    pages = iter_pages(source)
+    return _timed_pages(pages, time.perf_counter() - started)
 
+
+def _timed_pages(pages: Iterator[str], elapsed: float) -> Iterator[str]:
+    # Only time spent extracting counts, not the caller's work between pages.
+    try:
+        while True:
+            started = time.perf_counter()
+            page = next(pages, None)
+            elapsed += time.perf_counter() - started
+            if page is None:
+                return
+            yield page
+    finally:
+        observe_stage("sop", "pdf_extract", elapsed)
+
+
+def extract_text_from_pdf(file_bytes: Union[bytes, str]) -> str:
     try:
-        pdf_stream = io.BytesIO(file_bytes)
-        reader = PdfReader(pdf_stream)
-        pages: List[str] = []
-        for page in reader.pages:
-            pages.append(page.extract_text() or "")
-        return "\n".join(pages).strip()
+        return "\n".join(extract_pages_from_pdf(file_bytes)).strip()
     except Exception as exc:
         return f"Error reading PDF: {exc}"
 
 
-def _tokenize(text: str) -> List[str]:
-    return [w for w in re.findall(r"[a-zA-Z0-9']+", text.lower()) if w not in STOP_WORDS and len(w) > 2]
+def _split_chunks(document_text: str) -> List[str]:
+    return [chunk.text for chunk in iter_page_chunks([document_text])]
 
 
-def _best_matching_chunks(document_text: str, question: str, limit: int = 3) -> List[str]:
-    question_tokens = _tokenize(question)
+def _rank_chunk_ids(index: BM25Index, question: str, limit: int = 3) -> List[int]:
+    question_tokens = tokenize(question)
     if not question_tokens:
         return []
 
-    q_counts = Counter(question_tokens)
-    chunks = [c.strip() for c in re.split(r"\n\s*\n|(?<=[.!?])\s+", document_text) if c.strip()]
+    return [chunk_id for _, chunk_id in index.search(question_tokens, limit)]
+
+
+def _rank_chunks(chunks: List[str], index: BM25Index, question: str, limit: int = 3) -> List[str]:
+    return [chunks[chunk_id] for chunk_id in _rank_chunk_ids(index, question, limit)]
+
 
-    scored = []
-    for chunk in chunks:
-        chunk_tokens = Counter(_tokenize(chunk))
-        overlap = sum(min(chunk_tokens[token], count) for token, count in q_counts.items())
-        if overlap > 0:
-            scored.append((overlap, chunk))
+def _best_matching_chunks(document_text: str, question: str, limit: int = 3) -> List[str]:
+    chunks = _split_chunks(document_text)
+    return _rank_chunks(chunks, BM25Index(tokenize(chunk) for chunk in chunks), question, limit)
+
+
+def _build_document(doc_id: str, pages: Iterable[str]) -> CachedDocument:
+    chunks: List[str] = []
+    locations = array.array("I")
+    characters = 0
+
+    def counted(pages: Iterable[str]) -> Iterator[str]:
+        nonlocal characters
+        for page in pages:
+            characters += len(page)
+            yield page
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [chunk for _, chunk in scored[:limit]]
+    with stage("sop", "index_build"):
+        for chunk in iter_page_chunks(counted(pages)):
+            chunks.append(chunk.text)
+            locations.extend((chunk.page, chunk.start, chunk.end))
+        index = BM25Index(tokenize(chunk) for chunk in chunks)
+    size_bytes = 2 * sum(len(chunk) for chunk in chunks) + locations.itemsize * len(locations) + index.size_bytes()
+    return CachedDocument(doc_id, characters, chunks, index, size_bytes, locations)
+
+
+def _load_document(file_bytes: UploadData) -> Tuple[Optional[CachedDocument], Optional[str]]:
+    # A SpooledUpload was hashed while it streamed in and pypdf reads it from its temp file.
+    doc_id = upload_digest(file_bytes)
+    document = DOCUMENT_CACHE.get(doc_id)
+    if document is not None:
+        return document, None
+
+    # Pages go straight from the extractor to the chunker, so a read error can surface mid-build.
+    try:
+        document = _build_document(doc_id, extract_pages_from_pdf(upload_source(file_bytes)))
+    except Exception as exc:
+        return None, f"Error reading PDF: {exc}"
+
+    DOCUMENT_CACHE.put(document)
+    return document, None
 
 
 def _llm_answer(question: str, context_chunks: List[str]) -> str | None:
     if not context_chunks:
         return None
 
-    context = "\n\n".join(context_chunks)
-    prompt = f"""
-You are an SOP assistant. Answer the user question using only the provided context.
-If the answer is not present, say exactly: I cannot find that information in the provided document.
-Keep it concise and practical.
+    return generate_text(sop_prompt(question, context_chunks), agent="sop")
+
+
+async def _llm_answer_async(question: str, context_chunks: List[str]) -> str | None:
+    if not context_chunks:
+        return None
+
+    return await generate_text_async(sop_prompt(question, context_chunks), agent="sop")
 
-Context:
-{context}
 
-Question: {question}
-"""
-    return generate_text(prompt)
+async def _llm_answer_stream(question: str, context_chunks: List[str]) -> AsyncIterator[str]:
+    async for text in stream_text_async(sop_prompt(question, context_chunks), agent="sop"):
+        yield text
 
 
-def answer_sop_question(file_bytes: bytes, question: str) -> Dict[str, object]:
-    pdf_text = extract_text_from_pdf(file_bytes)
+Location = Dict[str, int]
 
-    if pdf_text.startswith("Error reading PDF"):
-        return {"error": pdf_text}
 
-    if not pdf_text:
-        return {"answer": "I cannot find that information in the provided document."}
+def _document_matches(document: CachedDocument, question: str) -> Tuple[List[str], List[Location]]:
+    """Best chunks for the question, plus the page and character span each one came from."""
+    if not document.chunks:
+        return [], []
+    with stage("sop", "retrieval"):
+        chunk_ids = _rank_chunk_ids(document.index, question)
+    spans = (document.location(chunk_id) for chunk_id in chunk_ids)
+    locations = [dict(zip(("page", "start", "end"), span)) for span in spans if span is not None]
+    return [document.chunks[chunk_id] for chunk_id in chunk_ids], locations
 
-    matches = _best_matching_chunks(pdf_text, question)
-    if not matches:
-        return {"answer": "I cannot find that information in the provided document."}
 
-    llm_response = _llm_answer(question, matches)
+def _format_answer(matches: List[str], llm_response: Optional[str], locations: List[Location]) -> Dict[str, object]:
+    record_response("sop", "gemini" if llm_response else "deterministic")
     if llm_response:
         return {
             "answer": llm_response,
             "citations": matches,
+            "locations": locations,
             "source": "gemini",
         }
 
@@ -98,5 +158,120 @@ def answer_sop_question(file_bytes: bytes, question: str) -> Dict[str, object]:
     return {
         "answer": f"Based on the document:\n\n{answer}",
         "citations": matches,
+        "locations": locations,
         "source": "deterministic",
     }
+
+
+def _answer_from_document(document: CachedDocument, question: str) -> Dict[str, object]:
+    matches, locations = _document_matches(document, question)
+    if not matches:
+        return {"answer": NOT_FOUND_ANSWER}
+
+    return _format_answer(matches, _llm_answer(question, matches), locations)
+
+
+async def _answer_from_document_async(document: CachedDocument, question: str) -> Dict[str, object]:
+    matches, locations = _document_matches(document, question)
+    if not matches:
+        return {"answer": NOT_FOUND_ANSWER}
+
+    # The deterministic answer is just the matches themselves, so there is nothing to precompute.
+    source, llm_response = await race_llm_with_fallback(_llm_answer_async(question, matches), lambda: None, "sop")
+    return _format_answer(matches, llm_response if source == "gemini" else None, locations)
+
+
+def ingest_document(file_bytes: UploadData) -> Dict[str, object]:
+    document, error = _load_document(file_bytes)
+    if error:
+        return {"error": error}
+
+    return {
+        "doc_id": document.doc_id,
+        "characters": document.characters,
+        "chunks": len(document.chunks),
+    }
+
+
+def answer_sop_question(file_bytes: UploadData, question: str) -> Dict[str, object]:
+    document, error = _load_document(file_bytes)
+    if error:
+        return {"error": error}
+
+    return _answer_from_document(document, question)
+
+
+def answer_sop_question_by_id(doc_id: str, question: str) -> Optional[Dict[str, object]]:
+    document = DOCUMENT_CACHE.get(doc_id)
+    if document is None:
+        return None
+
+    return _answer_from_document(document, question)
+
+
+async def answer_sop_question_async(file_bytes: UploadData, question: str) -> Dict[str, object]:
+    # PDF parsing and index building are CPU-bound; keep them off the event loop.
+    document, error = await asyncio.to_thread(_load_document, file_bytes)
+    if error:
+        return {"error": error}
+
+    return await _answer_from_document_async(document, question)
+
+
+async def answer_sop_question_by_id_async(doc_id: str, question: str) -> Optional[Dict[str, object]]:
+    document = DOCUMENT_CACHE.get(doc_id)
+    if document is None:
+        return None
+
+    return await _answer_from_document_async(document, question)
+
+
+async def _stream_answer_from_document(
+    document: CachedDocument, question: str
+) -> AsyncIterator[Tuple[str, Dict[str, object]]]:
+    matches, locations = _document_matches(document, question)
+    if not matches:
+        yield "token", {"text": NOT_FOUND_ANSWER}
+        yield "done", {"answer": NOT_FOUND_ANSWER}
+        return
+
+    yield "citations", {"citations": matches, "locations": locations}
+
+    parts: List[str] = []
+    interrupted = False
+    try:
+        async for text in _llm_answer_stream(question, matches):
+            parts.append(text)
+            yield "token", {"text": text}
+    except LLMStreamInterrupted:
+        # The tokens sent so far are a fragment; "done" carries the deterministic answer instead.
+        interrupted = True
+
+    result = _format_answer(matches, None if interrupted else "".join(parts).strip() or None, locations)
+    if interrupted:
+        result["interrupted"] = True
+    if not parts:
+        yield "token", {"text": result["answer"]}
+    yield "done", result
+
+
+async def stream_sop_question_async(
+    question: str, file_bytes: Optional[UploadData] = None, doc_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict[str, object]]]:
+    """Yield (event, data) pairs: citations, then answer tokens, then the full response as "done".
+
+    A "done" with "interrupted": True means the model stream broke off; its answer replaces the tokens.
+    """
+    if file_bytes is not None:
+        document, error = await asyncio.to_thread(_load_document, file_bytes)
+        if error:
+            yield "done", {"error": error}
+            return
+    else:
+        document = DOCUMENT_CACHE.get(doc_id) if doc_id else None
+        if document is None:
+            yield "error", {"detail": "Unknown doc_id; upload the document again"}
+            return
+
+    async for event in _stream_answer_from_document(document, question):
+        yield event
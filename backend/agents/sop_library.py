@@ -0,0 +1,315 @@
+import asyncio
+import heapq
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from agents.chunker import Chunk, iter_page_chunks
+from agents.deadline import race_llm_with_fallback
+from agents.llm_client import generate_text, generate_text_async
+from agents.metrics import record_response, stage
+from agents.retrieval import bm25_idf
+from agents.segment_index import Segment, write_segment
+from agents.sqlite_utils import ThreadLocalConnections
+from agents.sop_agent import DOCUMENT_CACHE, extract_pages_from_pdf
+from agents.sop_text import sop_prompt, tokenize
+from agents.uploads import UploadData, upload_digest, upload_source
+
+# Directory holding the library manifest (library.db) and one index segment per document.
+SOP_LIBRARY_DIR = os.getenv("SOP_LIBRARY_DIR", "sop_library")
+SOP_LIBRARY_TOP_K = int(os.getenv("SOP_LIBRARY_TOP_K", "5"))
+
+LIBRARY_NOT_FOUND_ANSWER = "I cannot find that information in the document library."
+
+# Open segments as of one manifest revision: (doc_id, name, segment) in the order documents were added.
+LibraryView = List[Tuple[str, str, Segment]]
+
+
+class SOPLibrary:
+    """Searchable collection of SOP documents, persisted under one directory.
+
+    Every document is indexed once into its own memory-mapped segment file, so adding or removing
+    a document never rebuilds the others. BM25 statistics (document frequencies, average chunk
+    length) are summed across segments at query time, so scores match a single combined index.
+    The SQLite manifest lets several worker processes share the library.
+    """
+
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    added_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS library_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO library_revision (id, revision) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS documents_revision_insert AFTER INSERT ON documents
+BEGIN UPDATE library_revision SET revision = revision + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS documents_revision_delete AFTER DELETE ON documents
+BEGIN UPDATE library_revision SET revision = revision + 1 WHERE id = 1; END;
+"""
+
+    def __init__(self, directory: str, k1: float = 1.5, b: float = 0.75):
+        self.directory = os.path.abspath(directory)
+        self.k1 = k1
+        self.b = b
+        os.makedirs(self.directory, exist_ok=True)
+        self._connections = ThreadLocalConnections(os.path.join(self.directory, "library.db"))
+        self._lock = threading.Lock()
+        self._segments: Dict[str, Segment] = {}
+        self._view: LibraryView = []
+        self._revision: Optional[int] = None
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def _segment_path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.seg")
+
+    @staticmethod
+    def _describe(row) -> Dict[str, Any]:
+        doc_id, name, chunks, tokens, added_at = row
+        return {"doc_id": doc_id, "name": name, "chunks": chunks, "tokens": tokens, "added_at": added_at}
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT doc_id, name, chunks, tokens, added_at FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return self._describe(row) if row else None
+
+    def documents(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT doc_id, name, chunks, tokens, added_at FROM documents ORDER BY id"
+        ).fetchall()
+        return [self._describe(row) for row in rows]
+
+    def indexed(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Document info if doc_id is listed and its segment can be searched."""
+        info = self.get(doc_id)
+        if info is None or doc_id in self._segments:
+            return info
+        try:
+            Segment(self._segment_path(doc_id)).close()
+        except (FileNotFoundError, ValueError):
+            return None
+        return info
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def add(self, doc_id: str, name: str, chunks: Iterable[Chunk]) -> Tuple[Dict[str, Any], bool]:
+        """Index a document; returns (document info, added). Adding a doc_id twice is a no-op.
+
+        A listed document whose segment is missing or unreadable is indexed again, since search skips it.
+        """
+        existing = self.indexed(doc_id)
+        if existing is not None:
+            return existing, False
+        self._connect().execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+        # The segment is complete on disk before the manifest row makes it visible to readers.
+        with stage("sop_library", "index_build"):
+            chunks = list(chunks)
+            tokens = write_segment(self._segment_path(doc_id), chunks, (tokenize(chunk.text) for chunk in chunks))
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO documents (doc_id, name, chunks, tokens, added_at) VALUES (?, ?, ?, ?, ?)",
+            (doc_id, name, len(chunks), tokens, datetime.utcnow().isoformat() + "Z"),
+        )
+        return self.get(doc_id), cursor.rowcount > 0
+
+    def remove(self, doc_id: str) -> bool:
+        if not self._connect().execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount:
+            return False
+        # Open mappings stay readable after the unlink, so in-flight searches elsewhere are unaffected.
+        try:
+            os.unlink(self._segment_path(doc_id))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _current_view(self) -> LibraryView:
+        revision = self._connect().execute("SELECT revision FROM library_revision WHERE id = 1").fetchone()[0]
+        if revision == self._revision:
+            return self._view
+
+        with self._lock:
+            if revision == self._revision:
+                return self._view
+            rows = self._connect().execute("SELECT doc_id, name FROM documents ORDER BY id").fetchall()
+            live = {doc_id for doc_id, _ in rows}
+            # Searches in other threads may still be reading an older view, so removed segments are only
+            # dropped here; each mapping is released once the last view holding it is garbage collected.
+            for doc_id in [doc_id for doc_id in self._segments if doc_id not in live]:
+                del self._segments[doc_id]
+
+            view: LibraryView = []
+            for doc_id, name in rows:
+                segment = self._segments.get(doc_id)
+                if segment is None:
+                    try:
+                        segment = Segment(self._segment_path(doc_id))
+                    except (FileNotFoundError, ValueError):
+                        # Removed (or half-written by a crashed worker) since the manifest was read.
+                        continue
+                    self._segments[doc_id] = segment
+                view.append((doc_id, name, segment))
+            self._view = view
+            self._revision = revision
+        return view
+
+    def search(self, question: str, limit: int = SOP_LIBRARY_TOP_K) -> List[Dict[str, Any]]:
+        """Best-matching chunks across every document, best first; ties keep the order documents were added."""
+        query_tokens = tokenize(question)
+        view = self._current_view()
+        if not query_tokens or not view or limit <= 0:
+            return []
+
+        chunk_count = sum(segment.chunk_count for _, _, segment in view)
+        if not chunk_count:
+            return []
+        avg_length = (sum(segment.total_tokens for _, _, segment in view) / chunk_count) or 1.0
+
+        query_freqs: Dict[str, int] = {}
+        for token in query_tokens:
+            query_freqs[token] = query_freqs.get(token, 0) + 1
+
+        # One pass collects each segment's postings and the corpus-wide document frequency per term.
+        postings_by_term: Dict[str, List[Tuple[int, Segment, Any, Any]]] = {}
+        for position, (_, _, segment) in enumerate(view):
+            for token in query_freqs:
+                chunk_ids, freqs = segment.postings(token)
+                if len(chunk_ids):
+                    postings_by_term.setdefault(token, []).append((position, segment, chunk_ids, freqs))
+
+        # Scores are keyed by (document position << 32 | chunk id) so ties sort in document order cheaply.
+        scores: Dict[int, float] = {}
+        k1, b = self.k1, self.b
+        norm_base = k1 * (1 - b)
+        norm_per_token = k1 * b / avg_length
+        for token, segment_postings in postings_by_term.items():
+            doc_freq = sum(len(chunk_ids) for _, _, chunk_ids, _ in segment_postings)
+            weight = bm25_idf(chunk_count, doc_freq) * query_freqs[token] * (k1 + 1)
+            for position, segment, chunk_ids, freqs in segment_postings:
+                lengths = segment.chunk_lengths
+                base = position << 32
+                # tolist() copies the mapped slice in C, which iterates much faster than a memoryview.
+                for chunk_id, freq in zip(chunk_ids.tolist(), freqs.tolist()):
+                    key = base | chunk_id
+                    norm = norm_base + norm_per_token * lengths[chunk_id]
+                    scores[key] = scores.get(key, 0.0) + weight * freq / (freq + norm)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        hits = []
+        for key, score in top:
+            doc_id, name, segment = view[key >> 32]
+            chunk_id = key & 0xFFFFFFFF
+            page, start, end = segment.chunk_span(chunk_id)
+            hits.append({
+                "doc_id": doc_id,
+                "document": name,
+                "chunk": chunk_id,
+                "page": page,
+                "start": start,
+                "end": end,
+                "text": segment.chunk_text(chunk_id),
+                "score": round(score, 4),
+            })
+        return hits
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+            self._view = []
+            self._revision = None
+
+
+_libraries: Dict[str, SOPLibrary] = {}
+_libraries_lock = threading.Lock()
+
+
+def get_sop_library() -> SOPLibrary:
+    key = os.path.abspath(SOP_LIBRARY_DIR)
+    library = _libraries.get(key)
+    if library is not None:
+        return library
+
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = SOPLibrary(SOP_LIBRARY_DIR)
+            _libraries[key] = library
+    return library
+
+
+def add_library_document(file_bytes: UploadData, name: str) -> Dict[str, object]:
+    doc_id = upload_digest(file_bytes)
+    library = get_sop_library()
+    existing = library.indexed(doc_id)
+    if existing is not None:
+        return {**existing, "added": False}
+
+    # Reuse the chunks if this PDF was recently uploaded for single-document chat.
+    cached = DOCUMENT_CACHE.get(doc_id)
+    if cached is not None:
+        chunks = [Chunk(text, *cached.location(chunk_id)) for chunk_id, text in enumerate(cached.chunks)]
+        info, added = library.add(doc_id, name, chunks)
+        return {**info, "added": added}
+
+    # Pages are extracted while the segment is built, so a read error can surface from add().
+    try:
+        info, added = library.add(doc_id, name, iter_page_chunks(extract_pages_from_pdf(upload_source(file_bytes))))
+    except Exception as exc:
+        return {"error": f"Error reading PDF: {exc}"}
+    return {**info, "added": added}
+
+
+def remove_library_document(doc_id: str) -> bool:
+    return get_sop_library().remove(doc_id)
+
+
+def _library_matches(question: str) -> List[Dict[str, Any]]:
+    with stage("sop_library", "retrieval"):
+        return get_sop_library().search(question)
+
+
+def _library_context(hits: List[Dict[str, Any]]) -> List[str]:
+    return [f"[{hit['document']}] {hit['text']}" for hit in hits]
+
+
+def _format_library_answer(hits: List[Dict[str, Any]], llm_response: Optional[str]) -> Dict[str, object]:
+    record_response("sop_library", "gemini" if llm_response else "deterministic")
+    if llm_response:
+        return {"answer": llm_response, "citations": hits, "source": "gemini"}
+
+    answer = "\n\n".join(_library_context(hits))
+    return {"answer": f"Based on the document library:\n\n{answer}", "citations": hits, "source": "deterministic"}
+
+
+def answer_library_question(question: str) -> Dict[str, object]:
+    hits = _library_matches(question)
+    if not hits:
+        return {"answer": LIBRARY_NOT_FOUND_ANSWER, "citations": []}
+
+    llm_response = generate_text(sop_prompt(question, _library_context(hits)), agent="sop_library")
+    return _format_library_answer(hits, llm_response)
+
+
+async def answer_library_question_async(question: str) -> Dict[str, object]:
+    # Search reads the manifest and segment files and scores every posting, so keep it off the event loop.
+    hits = await asyncio.to_thread(_library_matches, question)
+    if not hits:
+        return {"answer": LIBRARY_NOT_FOUND_ANSWER, "citations": []}
+
+    llm_call = generate_text_async(sop_prompt(question, _library_context(hits)), agent="sop_library")
+    source, llm_response = await race_llm_with_fallback(llm_call, lambda: None, "sop_library")
+    return _format_library_answer(hits, llm_response if source == "gemini" else None)
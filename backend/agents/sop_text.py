@@ -0,0 +1,25 @@
+import re
+from typing import List
+
+STOP_WORDS = {
+    "the", "a", "an", "and", "or", "to", "of", "in", "on", "for", "with", "is", "are", "was", "were",
+    "this", "that", "it", "as", "at", "by", "from", "be", "what", "how", "when", "where", "who", "why",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [w for w in re.findall(r"[a-zA-Z0-9']+", text.lower()) if w not in STOP_WORDS and len(w) > 2]
+
+
+def sop_prompt(question: str, context_chunks: List[str]) -> str:
+    context = "\n\n".join(context_chunks)
+    return f"""
+You are an SOP assistant. Answer the user question using only the provided context.
+If the answer is not present, say exactly: I cannot find that information in the provided document.
+Keep it concise and practical.
+
+Context:
+{context}
+
+Question: {question}
+"""
@@ -0,0 +1,24 @@
+import sqlite3
+import threading
+
+
+class ThreadLocalConnections:
+    """One autocommit SQLite connection per thread to a WAL-mode database file.
+
+    sqlite3 connections must not be shared between threads, and WAL lets several
+    worker processes read while one writes.
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional, Union
+
+from agents.doc_cache import content_hash
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# Uploads up to this size stay in memory; larger ones are spooled to a temp file.
+UPLOAD_MEMORY_MAX_BYTES = int(os.getenv("UPLOAD_MEMORY_MAX_BYTES", str(2 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+class SpooledUpload:
+    """An upload held either in memory or in a temp file, with its SHA-256 computed while it was received.
+
+    Agents take either raw bytes or a SpooledUpload; the helpers below hide the difference.
+    Call close() (or use it as a context manager) to remove the temp file.
+    """
+
+    def __init__(
+        self,
+        data: Optional[bytes],
+        path: Optional[str],
+        size: int,
+        sha256: str,
+        filename: str = "upload",
+        content_type: Optional[str] = None,
+    ):
+        self._data = data
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """What pypdf and zipfile should open: the in-memory bytes or the temp file path."""
+        return self._data if self._data is not None else self.path
+
+    def head(self, length: int = 8) -> bytes:
+        if self._data is not None:
+            return self._data[:length]
+        with open(self.path, "rb") as f:
+            return f.read(length)
+
+    def read_bytes(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self) -> None:
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._data = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+
+UploadData = Union[bytes, SpooledUpload]
+
+
+def upload_digest(data: UploadData) -> str:
+    if isinstance(data, SpooledUpload):
+        return data.sha256
+    return content_hash(data)
+
+
+def upload_head(data: UploadData, length: int = 8) -> bytes:
+    return data.head(length) if isinstance(data, SpooledUpload) else data[:length]
+
+
+def upload_source(data: UploadData) -> Union[bytes, str]:
+    return data.source if isinstance(data, SpooledUpload) else data
+
+
+def upload_bytes(data: UploadData) -> bytes:
+    return data.read_bytes() if isinstance(data, SpooledUpload) else data
+
+
+class _Spool:
+    """Accumulates an upload in memory, moving it to a temp file once it passes UPLOAD_MEMORY_MAX_BYTES."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.memory = bytearray()
+        self.spill = None
+
+    def accept(self, chunk: bytes) -> None:
+        """Count and hash a chunk; raises UploadTooLarge as soon as the limit is passed."""
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise UploadTooLarge(self.limit)
+        self.digest.update(chunk)
+
+    @property
+    def on_disk(self) -> bool:
+        """Whether write() will touch the file system (async callers run it in a thread)."""
+        return self.spill is not None or self.size > UPLOAD_MEMORY_MAX_BYTES
+
+    def write(self, chunk: bytes) -> None:
+        if self.spill is None and self.size > UPLOAD_MEMORY_MAX_BYTES:
+            self.spill = tempfile.NamedTemporaryFile(prefix="upload-", dir=UPLOAD_TMP_DIR, delete=False)
+            self.spill.write(bytes(self.memory))
+            self.memory = bytearray()
+        if self.spill is not None:
+            self.spill.write(chunk)
+        else:
+            self.memory.extend(chunk)
+
+    def discard(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
+            os.unlink(self.spill.name)
+
+    def finish(self, filename: str, content_type: Optional[str]) -> SpooledUpload:
+        if self.spill is None:
+            return SpooledUpload(bytes(self.memory), None, self.size, self.digest.hexdigest(), filename, content_type)
+        self.spill.close()
+        return SpooledUpload(None, self.spill.name, self.size, self.digest.hexdigest(), filename, content_type)
+
+
+async def spool_upload(file, max_bytes: Optional[int] = None) -> SpooledUpload:
+    """Copy an UploadFile in chunks, hashing as it goes; raises UploadTooLarge as soon as the limit is passed."""
+    limit = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    known_size = getattr(file, "size", None)
+    if known_size is not None and known_size > limit:
+        raise UploadTooLarge(limit)
+
+    spool = _Spool(limit)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            spool.accept(chunk)
+            if spool.on_disk:
+                await asyncio.to_thread(spool.write, chunk)
+            else:
+                spool.write(chunk)
+    except BaseException:
+        spool.discard()
+        raise
+
+    filename = getattr(file, "filename", None) or "upload"
+    return spool.finish(filename, getattr(file, "content_type", None))
+
+
+def spool_stream(
+    stream: BinaryIO,
+    filename: str = "upload",
+    content_type: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> SpooledUpload:
+    """Blocking counterpart of spool_upload for file-like objects such as zip archive members."""
+    spool = _Spool(UPLOAD_MAX_BYTES if max_bytes is None else max_bytes)
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            spool.accept(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.discard()
+        raise
+    return spool.finish(filename, content_type)
@@ -0,0 +1,37 @@
+import os
+import time
+from typing import Callable, Dict
+
+from agents import llm_client, pdf_extract
+from agents.invoice_agent import get_invoice_cache
+from agents.lead_store import get_lead_repository
+from agents.review_agent import get_review_cache
+from agents.session_store import get_session_store
+
+# Run warm_up() during application startup (for platforms that pre-warm instances before routing traffic).
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "0").lower() in ("1", "true", "yes")
+
+
+def _timed(timings: Dict[str, float], name: str, step: Callable[[], object]) -> None:
+    started = time.perf_counter()
+    step()
+    timings[name] = round(time.perf_counter() - started, 4)
+
+
+def warm_up() -> Dict[str, float]:
+    """Pay the one-time costs the first request would otherwise pay; returns seconds spent per step.
+
+    Imports pypdf and (when an API key is set) the Gemini SDK, builds the shared models and opens
+    the SQLite-backed stores. Safe to call more than once.
+    """
+    timings: Dict[str, float] = {}
+    _timed(timings, "pypdf", pdf_extract._pdf_reader_class)
+    _timed(timings, "gemini_models", lambda: (
+        llm_client.get_model(llm_client.MODEL_NAME, llm_client.JSON_GENERATION_CONFIG),
+        llm_client.get_model(llm_client.MODEL_NAME, llm_client.TEXT_GENERATION_CONFIG),
+    ))
+    _timed(timings, "invoice_cache", get_invoice_cache)
+    _timed(timings, "review_cache", get_review_cache)
+    _timed(timings, "lead_store", get_lead_repository)
+    _timed(timings, "session_store", get_session_store)
+    return timings
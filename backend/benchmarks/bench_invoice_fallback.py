@@ -0,0 +1,126 @@
+"""Deterministic invoice fallback: legacy multi-pass regex extraction vs. the single-pass scanner.
+
+Run from the backend directory:  python benchmarks/bench_invoice_fallback.py [line_items] [repeats]
+"""
+import random
+import re
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from agents import invoice_agent  # noqa: E402
+
+
+def legacy_extract_invoice_fields(text: str) -> Dict[str, Any]:
+    """The original multi-pass implementation, kept here as the comparison baseline."""
+    invoice_number = None
+    date = None
+    vendor_name = None
+    total_amount = None
+    tax_amount = 0.0
+    currency = "USD"
+
+    inv_match = re.search(r"invoice\s*(?:number|no|#)?\s*[:#-]?\s*([A-Z0-9-]+)", text, re.IGNORECASE)
+    if inv_match:
+        invoice_number = inv_match.group(1)
+
+    date_match = re.search(r"\b(\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b", text)
+    if date_match:
+        raw_date = date_match.group(1)
+        for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y"):
+            try:
+                date = datetime.strptime(raw_date, fmt).strftime("%Y-%m-%d")
+                break
+            except ValueError:
+                continue
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if lines:
+        vendor_name = lines[0][:120]
+
+    total_match = re.search(r"(?:total\s*(?:due|amount)?|amount\s*due)\s*[:$€£₹]*\s*([0-9][0-9,]*\.?[0-9]{0,2})", text, re.IGNORECASE)
+    if total_match:
+        total_amount = invoice_agent._safe_float(total_match.group(1))
+
+    tax_match = re.search(r"(?:tax|vat|gst)\s*[:$€£₹]*\s*([0-9][0-9,]*\.?[0-9]{0,2})", text, re.IGNORECASE)
+    if tax_match:
+        parsed_tax = invoice_agent._safe_float(tax_match.group(1))
+        if parsed_tax is not None:
+            tax_amount = parsed_tax
+
+    currency_match = re.search(r"(USD|EUR|GBP|INR|AUD|CAD)\b|[$€£₹]", text, re.IGNORECASE)
+    if currency_match:
+        symbol_or_code = currency_match.group(0)
+        currency = invoice_agent.CURRENCY_MAP.get(symbol_or_code, symbol_or_code.upper())
+
+    line_items: List[Dict[str, Any]] = []
+    item_pattern = re.compile(r"^([A-Za-z].*?)\s{2,}([0-9][0-9,]*\.?[0-9]{0,2})$")
+    for line in lines:
+        match = item_pattern.match(line)
+        if match:
+            amount = invoice_agent._safe_float(match.group(2))
+            if amount is not None:
+                line_items.append({"description": match.group(1).strip(), "amount": amount})
+
+    return {
+        "invoice_number": invoice_number,
+        "date": date,
+        "vendor_name": vendor_name,
+        "total_amount": total_amount,
+        "currency": currency,
+        "tax_amount": tax_amount,
+        "line_items": line_items,
+    }
+
+
+PRODUCTS = ["Widget", "Gasket", "Bearing", "Consulting hour", "Freight", "Licence seat", "Cable", "Bracket"]
+
+
+def synthetic_invoice(line_items: int, seed: int = 11) -> str:
+    rng = random.Random(seed)
+    lines = [
+        "Northwind Industrial Supply Ltd",
+        "221 Harbour Road, Leeds",
+        "Invoice # INV-2024-0917",
+        "Issued 14/03/2024",
+        "",
+    ]
+    for n in range(line_items):
+        if n and n % 40 == 0:
+            lines += ["", f"Page {n // 40 + 1}", "Description    Amount", ""]
+        amount = rng.uniform(5, 5000)
+        lines.append(f"{rng.choice(PRODUCTS)} batch {n}    {amount:,.2f}")
+    lines += [
+        "VAT: 1,204.55",
+        "Total Due: £ 24,091.10",
+    ]
+    return "\n".join(lines)
+
+
+def _time(fn, text: str, repeats: int) -> float:
+    """Best-of-5 mean milliseconds per call."""
+    return min(timeit.repeat(lambda: fn(text), number=repeats, repeat=5)) / repeats * 1000
+
+
+def main(line_items: int = 2000, repeats: int = 20) -> None:
+    text = synthetic_invoice(line_items)
+    legacy = legacy_extract_invoice_fields(text)
+    scanned = invoice_agent._extract_invoice_fields(text)
+    assert legacy == scanned, "single-pass scanner disagrees with the legacy extractor"
+
+    print(f"invoice: {line_items} line items, {len(text):,} chars")
+    legacy_ms = _time(legacy_extract_invoice_fields, text, repeats)
+    scanned_ms = _time(invoice_agent._extract_invoice_fields, text, repeats)
+    print(f"legacy multi-pass   : {legacy_ms:8.2f} ms")
+    print(f"single-pass scanner : {scanned_ms:8.2f} ms")
+    print(f"speedup             : {legacy_ms / scanned_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,93 @@
+"""Query latency of SOP chunk retrieval: legacy linear scan vs. prebuilt BM25 index.
+
+Run from the backend directory:  python benchmarks/bench_sop_retrieval.py
+"""
+import random
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from agents import sop_agent, sop_text  # noqa: E402
+
+
+VOCABULARY = [
+    "account", "approval", "archive", "backup", "badge", "billing", "calibration", "checklist", "compliance",
+    "contractor", "customer", "dispatch", "escalation", "equipment", "expense", "firmware", "forklift",
+    "hazard", "incident", "inventory", "invoice", "laptop", "maintenance", "manager", "onboarding",
+    "overtime", "password", "payroll", "permit", "procurement", "quarantine", "refund", "reimbursement",
+    "retention", "safety", "shipment", "shutdown", "supervisor", "timesheet", "training", "vendor", "warehouse",
+]
+
+
+def synthetic_manual(pages: int, sentences_per_page: int = 40, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    page_texts = []
+    for _ in range(pages):
+        sentences = []
+        for _ in range(sentences_per_page):
+            words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 18))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        page_texts.append(" ".join(sentences))
+    return "\n\n".join(page_texts)
+
+
+def legacy_best_matching_chunks(document_text: str, question: str, limit: int = 3):
+    """The original per-query linear scan, kept here as the comparison baseline."""
+    question_tokens = sop_text.tokenize(question)
+    if not question_tokens:
+        return []
+
+    q_counts = Counter(question_tokens)
+    chunks = [c.strip() for c in re.split(r"\n\s*\n|(?<=[.!?])\s+", document_text) if c.strip()]
+
+    scored = []
+    for chunk in chunks:
+        chunk_tokens = Counter(sop_text.tokenize(chunk))
+        overlap = sum(min(chunk_tokens[token], count) for token, count in q_counts.items())
+        if overlap > 0:
+            scored.append((overlap, chunk))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [chunk for _, chunk in scored[:limit]]
+
+
+QUESTIONS = [
+    "What is the escalation process for a forklift incident?",
+    "Who approves expense reimbursement for contractors?",
+    "How do I reset a laptop password?",
+    "When is the warehouse safety checklist due?",
+]
+
+
+def _time_per_query(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeats):
+        fn(QUESTIONS[i % len(QUESTIONS)])
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main(pages: int = 200, repeats: int = 20) -> None:
+    text = synthetic_manual(pages)
+    print(f"manual: {pages} pages, {len(text):,} chars")
+
+    legacy_ms = _time_per_query(lambda q: legacy_best_matching_chunks(text, q), repeats)
+
+    start = time.perf_counter()
+    document = sop_agent._build_document("bench", text.split("\n\n"))
+    build_ms = (time.perf_counter() - start) * 1000
+    indexed_ms = _time_per_query(lambda q: sop_agent._rank_chunks(document.chunks, document.index, q), repeats)
+
+    print(f"legacy linear scan : {legacy_ms:9.2f} ms/query")
+    print(f"bm25 index build   : {build_ms:9.2f} ms (once per document)")
+    print(f"bm25 indexed query : {indexed_ms:9.2f} ms/query")
+    print(f"speedup per query  : {legacy_ms / indexed_ms:9.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
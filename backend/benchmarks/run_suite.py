@@ -0,0 +1,298 @@
+"""Hot-path benchmark suite for every agent, run on synthetic corpora with the LLM switched off.
+
+Each case records median latency and peak traced memory, then compares them against
+benchmarks/baselines.json. The run fails (exit code 1) if any case regresses past the tolerance.
+
+Run from the backend directory:
+    python benchmarks/run_suite.py                     # compare against baselines
+    python benchmarks/run_suite.py --update-baselines  # re-record after an intended change
+    python benchmarks/run_suite.py --only sop --scale 0.1
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+for path in (BACKEND_DIR, BENCH_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from agents import invoice_agent, llm_client, review_agent, sales_agent, sop_agent  # noqa: E402
+from agents.chunker import iter_page_chunks  # noqa: E402
+from agents.lead_store import SQLiteLeadRepository  # noqa: E402
+from agents.sop_library import SOPLibrary  # noqa: E402
+from bench_invoice_fallback import synthetic_invoice  # noqa: E402
+from bench_sop_retrieval import QUESTIONS, synthetic_manual  # noqa: E402
+
+BASELINES_PATH = BENCH_DIR / "baselines.json"
+# Relative slack on both latency and memory, plus absolute floors so sub-millisecond noise never fails a run.
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "1.5"))
+MIN_SLACK_MS = 0.5
+MIN_SLACK_KB = 256
+
+# A case is (setup, repeats): setup builds the input untimed and returns the zero-argument callable to measure.
+Case = Tuple[Callable[[], Callable[[], Any]], int]
+
+
+def _stub_llm() -> None:
+    # Treat the API key as absent so every agent takes its deterministic path.
+    llm_client.invalidate_models()
+    llm_client._cached_api_key = None
+
+
+def synthetic_pdf(pages: int) -> bytes:
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+    import io
+
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for page_text in synthetic_manual(pages, sentences_per_page=30).split("\n\n"):
+        page = writer.add_blank_page(width=612, height=792)
+        ops = "".join(f"({sentence}) Tj 0 -14 Td " for sentence in page_text.split(". "))
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 9 Tf 36 760 Td {ops}ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(stream)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def synthetic_chat(turns: int, seed: int = 3) -> List[Dict[str, str]]:
+    """A chat where the lead never gives a phone number, so extraction can never stop early."""
+    rng = random.Random(seed)
+    user_lines = [
+        "I'm looking at a few places, still deciding.",
+        "Something with a garden would be nice for the kids and the dog.",
+        "We liked the last viewing but the kitchen felt small honestly.",
+        "Can you tell me more about schools and commute times around there?",
+        "My partner prefers somewhere quieter, maybe away from main roads.",
+    ]
+    history = []
+    for turn in range(max(turns, 4)):
+        history.append({"role": "user", "content": rng.choice(user_lines)})
+        history.append({"role": "assistant", "content": f"Thanks! Noted point {turn}. Anything else you need?"})
+    history[2]["content"] = "My budget is around $650,000"
+    history[6]["content"] = "Hoping to move within 3 months"
+    return history
+
+
+def synthetic_reviews(count: int, seed: int = 5) -> List[str]:
+    rng = random.Random(seed)
+    words = sorted(review_agent.POSITIVE_WORDS | review_agent.NEGATIVE_WORDS) + [
+        "food", "staff", "table", "order", "pizza", "waiter", "price", "evening", "visit", "service",
+    ] * 4
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(10, 60))) for _ in range(count)]
+
+
+def synthetic_lead_store(path: str, count: int, seed: int = 9) -> SQLiteLeadRepository:
+    rng = random.Random(seed)
+    repository = SQLiteLeadRepository(path)
+    leads = [
+        {
+            "budget": f"${rng.randint(100, 2000) * 1000:,}",
+            "location": rng.choice(["Downtown", "Harbor", "Uptown", "Riverside"]),
+            "lead_score": rng.randint(0, 100),
+            "status": rng.choice(["Hot", "Warm", "Cold"]),
+            "captured_at": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00Z",
+        }
+        for _ in range(count)
+    ]
+    conn = repository._connect()
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO leads (lead_score, status, captured_at, data) VALUES (?, ?, ?, ?)",
+        [repository._row(lead) for lead in leads],
+    )
+    conn.execute("COMMIT")
+    return repository
+
+
+def _stream_pages(text: str) -> Iterator[str]:
+    # Pages arrive one at a time, as pdf_extract.iter_pages hands them over, and are not kept.
+    start = 0
+    while start <= len(text):
+        end = text.find("\n\n", start)
+        end = len(text) if end < 0 else end
+        yield text[start:end]
+        start = end + 2
+
+
+def build_cases(scale: float, workdir: str) -> Dict[str, Case]:
+    def scaled(n: int) -> int:
+        return max(1, int(n * scale))
+
+    def sop_extract_pdf():
+        pdf = synthetic_pdf(scaled(300))
+        return lambda: sop_agent.extract_text_from_pdf(pdf)
+
+    def sop_ingest():
+        text = synthetic_manual(scaled(300))
+        return lambda: sop_agent._build_document("bench", _stream_pages(text))
+
+    def sop_query_indexed():
+        document = sop_agent._build_document("bench", synthetic_manual(scaled(300)).split("\n\n"))
+        questions = iter(QUESTIONS * 1000)
+        return lambda: sop_agent._rank_chunks(document.chunks, document.index, next(questions))
+
+    def sop_best_matching_chunks():
+        text = synthetic_manual(scaled(300))
+        return lambda: sop_agent._best_matching_chunks(text, QUESTIONS[0])
+
+    def sop_library_query():
+        library = SOPLibrary(os.path.join(workdir, "sop_library"))
+        if not len(library):
+            for doc in range(scaled(200)):
+                text = synthetic_manual(10, seed=doc)
+                library.add(f"doc-{doc}", f"manual-{doc}.pdf", iter_page_chunks(text.split("\n\n")))
+        questions = iter(QUESTIONS * 1000)
+        return lambda: library.search(next(questions))
+
+    def invoice_fallback():
+        text = synthetic_invoice(scaled(5000))
+        return lambda: invoice_agent._extract_invoice_fields(text)
+
+    def sales_extract_lead_data():
+        history = synthetic_chat(scaled(100))
+        return lambda: sales_agent._extract_lead_data(history)
+
+    def sales_score_lead():
+        history = synthetic_chat(scaled(100))
+        return lambda: sales_agent.score_lead(history)
+
+    def review_sentiment():
+        reviews = synthetic_reviews(scaled(10000))
+        return lambda: [review_agent._sentiment(review) for review in reviews]
+
+    def leads_store():
+        path = os.path.join(workdir, "leads.db")
+        if not os.path.exists(path):
+            synthetic_lead_store(path, scaled(100000))
+        return SQLiteLeadRepository(path)
+
+    def leads_list_all():
+        repository = leads_store()
+        return lambda: repository.list_leads()
+
+    def leads_list_filtered():
+        repository = leads_store()
+        return lambda: repository.list_leads(status="Hot", min_score=70, limit=50)
+
+    return {
+        "sop_extract_pdf_300p": (sop_extract_pdf, 3),
+        "sop_ingest_300p": (sop_ingest, 5),
+        "sop_query_indexed_300p": (sop_query_indexed, 50),
+        "sop_best_matching_chunks_300p": (sop_best_matching_chunks, 5),
+        "sop_library_query_200_docs": (sop_library_query, 20),
+        "invoice_fallback_5000_items": (invoice_fallback, 10),
+        "sales_extract_lead_data_100_turns": (sales_extract_lead_data, 200),
+        "sales_score_lead_100_turns": (sales_score_lead, 200),
+        "review_sentiment_10k": (review_sentiment, 5),
+        "leads_list_all_100k": (leads_list_all, 3),
+        "leads_list_filtered_100k": (leads_list_filtered, 20),
+    }
+
+
+def measure(setup: Callable[[], Callable[[], Any]], repeats: int) -> Dict[str, float]:
+    fn = setup()
+    fn()  # warm-up: imports, lazy caches, SQLite page cache
+
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Memory is traced on a separate run because tracemalloc itself slows allocation-heavy code.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"median_ms": round(statistics.median(timings), 3), "peak_kb": round(peak / 1024, 1)}
+
+
+def compare(name: str, result: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    problems = []
+    ms_limit = baseline["median_ms"] * tolerance + MIN_SLACK_MS
+    if result["median_ms"] > ms_limit:
+        problems.append(f"{name}: median {result['median_ms']:.2f} ms > limit {ms_limit:.2f} ms")
+    kb_limit = baseline["peak_kb"] * tolerance + MIN_SLACK_KB
+    if result["peak_kb"] > kb_limit:
+        problems.append(f"{name}: peak {result['peak_kb']:.0f} KB > limit {kb_limit:.0f} KB")
+    return problems
+
+
+def run(only: str = "", scale: float = 1.0, repeats: int = 0) -> Dict[str, Dict[str, float]]:
+    """Measure the selected cases; ``repeats`` overrides each case's own repeat count when set."""
+    _stub_llm()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, (setup, case_repeats) in build_cases(scale, workdir).items():
+            if only and only not in name:
+                continue
+            results[name] = measure(setup, repeats or case_repeats)
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="", help="run only cases whose name contains this substring")
+    parser.add_argument("--scale", type=float, default=1.0, help="input size multiplier; baselines apply at 1.0")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.scale)
+    baselines = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+
+    problems: List[str] = []
+    print(f"{'case':38} {'median ms':>11} {'peak KB':>10} {'baseline ms':>12}")
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        print(f"{name:38} {result['median_ms']:11.2f} {result['peak_kb']:10.0f} "
+              f"{baseline['median_ms'] if baseline else float('nan'):12.2f}")
+        if baseline and args.scale == 1.0 and not args.update_baselines:
+            problems.extend(compare(name, result, baseline, args.tolerance))
+
+    if args.update_baselines:
+        if args.scale != 1.0:
+            print("refusing to record baselines at --scale other than 1.0")
+            return 2
+        baselines.update(results)
+        BASELINES_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"baselines written to {BASELINES_PATH}")
+        return 0
+
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
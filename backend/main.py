@@ -1,16 +1,68 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from starlette.background import BackgroundTask
+from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import os
+import time
 
 # Import your agents
-from agents.invoice_agent import process_invoice
-from agents.sop_agent import answer_sop_question
-from agents.sales_agent import qualify_lead, score_lead # <--- Ensure score_lead is imported!
-from agents.review_agent import generate_review_response
+from agents.invoice_agent import (
+    expand_invoice_uploads,
+    get_invoice_cache,
+    process_invoice_async,
+    process_invoice_batch_async,
+)
+from agents.sop_agent import (
+    answer_sop_question_async,
+    answer_sop_question_by_id_async,
+    ingest_document,
+    stream_sop_question_async,
+)
+from agents.sop_library import (
+    add_library_document,
+    answer_library_question_async,
+    get_sop_library,
+    remove_library_document,
+)
+from agents.sales_agent import (
+    LeadExtractionState,
+    lead_fields,
+    pending_lead_record,
+    qualify_lead_async,
+    score_lead_async,
+    score_lead_fields,
+    stream_qualify_lead_async,
+)
+from agents.review_agent import (
+    generate_review_response_async,
+    get_review_cache,
+    generate_review_responses_bulk_async,
+    parse_review_csv,
+)
+from agents.llm_client import circuit_breaker_state, llm_cache_stats
+from agents.deadline import end_request_budget, start_request_budget
+from agents.doc_cache import content_hash
+from agents.job_queue import LEAD_SCORING_QUEUE
+from agents.lead_store import SCORING_DONE, SCORING_FAILED, SCORING_PENDING, get_lead_repository
+from agents.metrics import METRICS_ENABLED, observe_request_size, observe_stage, render_metrics, stage
+from agents.session_store import get_session_store
+from agents.uploads import UPLOAD_MAX_BYTES, SpooledUpload, UploadTooLarge, spool_upload
+from agents.warmup import WARM_UP_ON_STARTUP, warm_up
+
+@asynccontextmanager
+async def lifespan(app):
+    if WARM_UP_ON_STARTUP:
+        await asyncio.to_thread(warm_up)
+    yield
+    # Let queued lead scoring finish so captured leads are not left pending.
+    await asyncio.to_thread(LEAD_SCORING_QUEUE.shutdown, 30)
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS (Allows Frontend to talk to Backend)
 app.add_middleware(
@@ -19,28 +71,286 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+# Per-agent request latency; streamed responses are timed until their headers are sent.
+# The agent label comes from the matched route, so unknown paths cannot add new metric series.
+@app.middleware("http")
+async def time_agent_requests(request, call_next):
+    if not METRICS_ENABLED or not request.url.path.startswith("/api/agent/"):
+        return await call_next(request)
+
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        route_path = getattr(request.scope.get("route"), "path", "")
+        agent = route_path.split("/")[3] if route_path.startswith("/api/agent/") else "other"
+        observe_stage(agent, "request", time.perf_counter() - started)
+
+# Optional per-request latency budget (X-Latency-Budget-Ms header, else AGENT_LATENCY_BUDGET_SECONDS).
+# When it runs out, agents return their deterministic answer instead of waiting for Gemini.
+@app.middleware("http")
+async def apply_latency_budget(request, call_next):
+    header = request.headers.get("x-latency-budget-ms")
+    try:
+        budget = float(header) / 1000 if header else None
+    except ValueError:
+        budget = None
+    token = start_request_budget(budget)
+    try:
+        return await call_next(request)
+    finally:
+        end_request_budget(token)
+
+# Request bodies are counted as they arrive, before Starlette parses (and spools) the multipart form,
+# so an oversized upload is cut off at the limit whether or not it declared a Content-Length.
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(10 * UPLOAD_MAX_BYTES)))
+
+def _too_large(limit: int) -> JSONResponse:
+    return JSONResponse(status_code=413, content={"detail": f"Request body exceeds the {limit} byte limit"})
+
+class LimitRequestSize:
+    """Pure ASGI middleware: answers 413 once the body passes the limit and tells the app the client left."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        limit = UPLOAD_MAX_REQUEST_BYTES
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            return await _too_large(limit)(scope, receive, send)
+
+        received = 0
+        started = False
+        rejected = False
+
+        async def counted_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    if not started:
+                        await _too_large(limit)(scope, receive, send)
+                    # The app stops reading (Starlette raises ClientDisconnect) and its reply is dropped.
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        await self.app(scope, counted_receive, guarded_send)
+
+app.add_middleware(LimitRequestSize)
+
+# Uploads are copied in chunks (hashed on the way) to memory or a temp file, never read whole.
+# Callers must close() the result; HTTP 413 if a single file is over UPLOAD_MAX_BYTES. That check
+# runs after Starlette has parsed the form, so LimitRequestSize is what bounds how much is received.
+# The copy is owned by the agent code, independent of when the framework closes the form's files.
+async def _spool(file: UploadFile, agent: str) -> SpooledUpload:
+    try:
+        with stage(agent, "read_upload"):
+            upload = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    observe_request_size(agent, upload.size)
+    return upload
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _event_stream(events, background: Optional[BackgroundTask] = None):
+    async def body():
+        try:
+            async for event, data in events:
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
 @app.get("/")
 def home():
     return {"status": "Portfolio Backend Live"}
 
+# Prometheus scrape target; disabled (404) when METRICS_ENABLED is off.
+@app.get("/metrics")
+def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Pre-warm hook for platforms that send a warm-up request before routing traffic.
+@app.get("/api/warmup")
+async def warmup():
+    return {"status": "warm", "seconds": await asyncio.to_thread(warm_up)}
+
+# Gemini circuit breaker; while "open", agents answer from their deterministic fallbacks.
+@app.get("/api/llm/status")
+def llm_status():
+    return circuit_breaker_state()
+
+@app.get("/api/llm/cache")
+def llm_cache_status():
+    return llm_cache_stats()
+
+@app.get("/api/jobs/lead-scoring")
+def lead_scoring_queue_stats():
+    return LEAD_SCORING_QUEUE.stats()
+
 # --- AGENT 1: INVOICE EXTRACTOR ---
 @app.post("/api/agent/invoice")
 async def analyze_invoice(file: UploadFile = File(...)):
+    mime_type = file.content_type if file.content_type else "image/jpeg"
+    upload = await _spool(file, "invoice")
     try:
-        mime_type = file.content_type if file.content_type else "image/jpeg"
-        file_bytes = await file.read()
-        return process_invoice(file_bytes, mime_type)
+        with upload:
+            return await process_invoice_async(upload, mime_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Accepts several files and/or zip archives; streams one NDJSON line per invoice as it finishes.
+@app.post("/api/agent/invoice/batch")
+async def analyze_invoice_batch(files: List[UploadFile] = File(...)):
+    uploads = []
+    try:
+        for file in files:
+            mime_type = file.content_type if file.content_type else "image/jpeg"
+            uploads.append((file.filename or "upload", await _spool(file, "invoice"), mime_type))
+        entries = await asyncio.to_thread(expand_invoice_uploads, uploads)
+    except ValueError as e:
+        for _, upload, _ in uploads:
+            upload.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        for _, upload, _ in uploads:
+            upload.close()
+        raise
+
+    def close_uploads():
+        for _, upload, _ in uploads:
+            upload.close()
+
+    async def lines():
+        try:
+            async for item in process_invoice_batch_async(entries):
+                yield json.dumps(item) + "\n"
+        finally:
+            close_uploads()
+
+    # The background task also runs when the client goes away before the body generator ever starts.
+    return StreamingResponse(lines(), media_type="application/x-ndjson", background=BackgroundTask(close_uploads))
+
+@app.get("/api/agent/invoice/cache")
+def invoice_cache_stats():
+    return get_invoice_cache().stats()
+
 # --- AGENT 2: SOP MANUAL CHAT ---
+@app.post("/api/agent/sop/documents")
+async def upload_sop_document(file: UploadFile = File(...)):
+    upload = await _spool(file, "sop")
+    try:
+        with upload:
+            return await asyncio.to_thread(ingest_document, upload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/agent/sop")
-async def chat_with_sop(file: UploadFile = File(...), question: str = Form(...)):
+async def chat_with_sop(
+    question: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    doc_id: Optional[str] = Form(None),
+):
+    if file is None and not doc_id:
+        raise HTTPException(status_code=400, detail="Provide either a file or a doc_id")
+
+    upload = await _spool(file, "sop") if file is not None else None
     try:
-        file_bytes = await file.read()
-        return answer_sop_question(file_bytes, question)
+        if upload is not None:
+            with upload:
+                return await answer_sop_question_async(upload, question)
+        result = await answer_sop_question_by_id_async(doc_id, question)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown doc_id; upload the document again")
+    return result
+
+# Same inputs as /api/agent/sop, answered as Server-Sent Events:
+# "citations" first, then "token" events, then "done" carrying the regular JSON response.
+@app.post("/api/agent/sop/stream")
+async def stream_chat_with_sop(
+    question: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    doc_id: Optional[str] = Form(None),
+):
+    if file is None and not doc_id:
+        raise HTTPException(status_code=400, detail="Provide either a file or a doc_id")
+
+    upload = await _spool(file, "sop") if file is not None else None
+
+    def close_upload():
+        if upload is not None:
+            upload.close()
+
+    async def events():
+        try:
+            async for event in stream_sop_question_async(question, file_bytes=upload, doc_id=doc_id):
+                yield event
+        finally:
+            close_upload()
+
+    # The background task also runs when the client goes away before the event generator ever starts.
+    return _event_stream(events(), background=BackgroundTask(close_upload))
+
+# Document library: PDFs are indexed once and questions are answered across all of them.
+@app.post("/api/agent/sop/library")
+async def add_sop_library_document(file: UploadFile = File(...), name: Optional[str] = Form(None)):
+    upload = await _spool(file, "sop_library")
+    try:
+        with upload:
+            result = await asyncio.to_thread(add_library_document, upload, name or upload.filename)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@app.get("/api/agent/sop/library")
+def list_sop_library():
+    return get_sop_library().documents()
+
+@app.delete("/api/agent/sop/library/{doc_id}")
+def delete_sop_library_document(doc_id: str):
+    if not remove_library_document(doc_id):
+        raise HTTPException(status_code=404, detail="Unknown doc_id")
+    return {"removed": doc_id}
+
+@app.post("/api/agent/sop/library/ask")
+async def ask_sop_library(question: str = Form(...)):
+    try:
+        return await answer_library_question_async(question)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -51,67 +361,220 @@ class ReviewRequest(BaseModel):
 
 @app.post("/api/agent/review")
 async def draft_review_reply(request: ReviewRequest):
+    observe_request_size("review", len(request.review.encode()))
     try:
-        return generate_review_response(request.review, request.business_name)
+        return await generate_review_response_async(request.review, request.business_name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/agent/review/cache")
+def review_cache_stats():
+    return get_review_cache().stats()
+
+class BulkReviewRequest(BaseModel):
+    reviews: List[str]
+    business_name: str = "My Business"
+    batch_size: Optional[int] = None
+
+def _bulk_review_stream(reviews: List[str], business_name: str, batch_size: Optional[int]):
+    async def lines():
+        async for item in generate_review_responses_bulk_async(reviews, business_name, batch_size):
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Bulk variants stream one NDJSON line per review ({"index", "response", "sentiment", "source"}).
+@app.post("/api/agent/review/bulk")
+async def draft_review_replies_bulk(request: BulkReviewRequest):
+    return _bulk_review_stream(request.reviews, request.business_name, request.batch_size)
+
+@app.post("/api/agent/review/bulk/csv")
+async def draft_review_replies_from_csv(
+    file: UploadFile = File(...),
+    business_name: str = Form("My Business"),
+    batch_size: Optional[int] = Form(None),
+):
+    upload = await _spool(file, "review")
+    try:
+        with upload:
+            reviews = parse_review_csv(upload.read_bytes().decode("utf-8-sig"))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+    return _bulk_review_stream(reviews, business_name, batch_size)
+
 # --- AGENT 4: SALES LEAD QUALIFIER ---
 class ChatMessage(BaseModel):
     role: str
     content: str
 
+# Two ways to hold a conversation:
+# - session mode: send only "message" (plus the "session_id" from the previous response);
+#   history and lead state stay on the server.
+# - stateless mode: send the full "history" each turn, optionally echoing back "lead_state"
+#   so only new messages are scanned.
 class SalesChatRequest(BaseModel):
-    history: List[ChatMessage]
     message: str
+    history: Optional[List[ChatMessage]] = None
+    lead_state: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None
+
+def _open_conversation(request: SalesChatRequest):
+    if request.session_id:
+        session = get_session_store().load(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired session_id")
+        return request.session_id, list(session["history"]), LeadExtractionState.from_dict(session["lead_state"])
+
+    if request.history is not None:
+        history_dicts = [{"role": m.role, "content": m.content} for m in request.history]
+        return None, history_dicts, LeadExtractionState.from_dict(request.lead_state)
+
+    return get_session_store().create(), [], LeadExtractionState()
+
+def _finish_turn(session_id, history_dicts, message: str, bot_response: str, state: LeadExtractionState):
+    if session_id is None:
+        return {"lead_state": state.to_dict()}
+
+    history = history_dicts + [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": bot_response}
+    ]
+    get_session_store().save(session_id, history, state.to_dict())
+    return {"session_id": session_id}
+
+def _is_qualified(bot_response: str) -> bool:
+    return "Thank you" in bot_response and "qualified" in bot_response
+
+def _score_pending_lead(repository, lead_id: int, full_history, data, pending) -> None:
+    lead_data = score_lead_fields(full_history, data)
+    lead_data["captured_at"] = pending["captured_at"]
+    lead_data["scoring_status"] = SCORING_DONE
+    repository.update(lead_id, lead_data)
+
+def _mark_scoring_failed(repository, lead_id: int, pending, error: BaseException) -> None:
+    repository.update(lead_id, {**pending, "scoring_status": SCORING_FAILED, "scoring_error": str(error)})
+
+async def _capture_lead(history_dicts, message: str, bot_response: str, state: LeadExtractionState):
+    """Store the lead and return (lead_id, lead).
+
+    Scoring is a second LLM call, so it runs on the background queue and the lead is stored as
+    pending until it finishes. With the queue disabled or full the lead is scored inline.
+    """
+    full_history = history_dicts + [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": bot_response}
+    ]
+    if not LEAD_SCORING_QUEUE.enabled:
+        lead_data = {**await score_lead_async(full_history, state), "scoring_status": SCORING_DONE}
+        return await asyncio.to_thread(get_lead_repository().add, lead_data), lead_data
+
+    # Field extraction is cheap and advances the lead state the client gets back, so it stays in the request.
+    data = lead_fields(full_history, state)
+    pending = {**pending_lead_record(data), "scoring_status": SCORING_PENDING}
+    repository = get_lead_repository()
+    lead_id = await asyncio.to_thread(repository.add, pending)
+    queued = LEAD_SCORING_QUEUE.submit(
+        lambda: _score_pending_lead(repository, lead_id, full_history, data, pending),
+        on_failure=lambda error: _mark_scoring_failed(repository, lead_id, pending, error),
+    )
+    if not queued:
+        await asyncio.to_thread(_score_pending_lead, repository, lead_id, full_history, data, pending)
+        return lead_id, await asyncio.to_thread(repository.get, lead_id)
+    return lead_id, pending
 
 @app.post("/api/agent/sales")
 async def sales_chat(request: SalesChatRequest):
+    # 1. Prepare history (from the session store, or as sent by the client)
+    session_id, history_dicts, state = _open_conversation(request)
+
     try:
-        # 1. Prepare history
-        history_dicts = [{"role": m.role, "content": m.content} for m in request.history]
-        
         # 2. Get Bot Response
-        bot_response = qualify_lead(history_dicts, request.message)
+        bot_response = await qualify_lead_async(history_dicts, request.message, state)
         
         # 3. CHECK: Is the conversation finished?
-        if "Thank you" in bot_response and "qualified" in bot_response:
-            
-            # --- TRIGGER SCORING ---
-            full_history = history_dicts + [
-                {"role": "user", "content": request.message},
-                {"role": "assistant", "content": bot_response}
-            ]
-            lead_data = score_lead(full_history)
-            
-            # Save to leads_db.json
-            try:
-                with open("leads_db.json", "r+") as f:
-                    try:
-                        leads = json.load(f)
-                    except json.JSONDecodeError:
-                        leads = []
-                    leads.append(lead_data)
-                    f.seek(0)
-                    json.dump(leads, f, indent=2)
-            except FileNotFoundError:
-                with open("leads_db.json", "w") as f:
-                    json.dump([lead_data], f)
-            
-            return {"response": bot_response, "lead_captured": True, "data": lead_data}
-
-        return {"response": bot_response, "lead_captured": False}
+        if _is_qualified(bot_response):
+            lead_id, lead_data = await _capture_lead(history_dicts, request.message, bot_response, state)
+            extra = _finish_turn(session_id, history_dicts, request.message, bot_response, state)
+            return {"response": bot_response, "lead_captured": True, "lead_id": lead_id, "data": lead_data, **extra}
+
+        extra = _finish_turn(session_id, history_dicts, request.message, bot_response, state)
+        return {"response": bot_response, "lead_captured": False, **extra}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Streaming variant: "token" events for the reply, then "done" with the regular JSON response.
+@app.post("/api/agent/sales/stream")
+async def stream_sales_chat(request: SalesChatRequest):
+    session_id, history_dicts, state = _open_conversation(request)
+
+    async def events():
+        async for event, data in stream_qualify_lead_async(history_dicts, request.message, state):
+            if event != "done":
+                yield event, data
+                continue
+
+            bot_response = data["response"]
+            if _is_qualified(bot_response):
+                lead_id, lead_data = await _capture_lead(history_dicts, request.message, bot_response, state)
+                extra = _finish_turn(session_id, history_dicts, request.message, bot_response, state)
+                yield "done", {"response": bot_response, "lead_captured": True, "lead_id": lead_id, "data": lead_data, **extra}
+            else:
+                extra = _finish_turn(session_id, history_dicts, request.message, bot_response, state)
+                yield "done", {"response": bot_response, "lead_captured": False, **extra}
+
+    return _event_stream(events())
+
 # --- NEW: GET LEADS ENDPOINT (This was missing!) ---
+LEADS_DEFAULT_LIMIT = int(os.getenv("LEADS_DEFAULT_LIMIT", "100"))
+LEADS_MAX_LIMIT = int(os.getenv("LEADS_MAX_LIMIT", "1000"))
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+# Highest score first, one page at a time: follow X-Next-Cursor (absent on the last page).
+# The ETag covers the store revision and the query, so pollers with If-None-Match get a 304
+# without the leads being read at all.
 @app.get("/api/leads")
-def get_leads():
+def get_leads(
+    request: Request,
+    status: Optional[str] = None,
+    min_score: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(LEADS_DEFAULT_LIMIT, ge=1, le=LEADS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+):
+    try:
+        repository = get_lead_repository()
+        etag = '"' + content_hash(f"{repository.revision()}?{request.url.query}".encode())[:32] + '"'
+    except Exception:
+        return []
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
     try:
-        with open("leads_db.json", "r") as f:
-            leads = json.load(f)
-        # Return sorted leads (Highest score first)
-        return sorted(leads, key=lambda x: x.get('lead_score', 0), reverse=True)
-    except:
-        return [] # Return empty list if file missing
\ No newline at end of file
+        leads, next_cursor = repository.query_leads(
+            status=status, min_score=min_score, since=since, until=until, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        return []
+
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return JSONResponse(leads, headers=headers)
+
+# Poll this after the final sales turn: scoring_status goes from "pending" to "scored" (or "failed").
+@app.get("/api/leads/{lead_id}")
+def get_lead(lead_id: int):
+    lead = get_lead_repository().get(lead_id)
+    if lead is None:
+        raise HTTPException(status_code=404, detail="Unknown lead_id")
+    return {"lead_id": lead_id, "scoring_status": SCORING_DONE, **lead}
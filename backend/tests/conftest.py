@@ -4,3 +4,58 @@ from pathlib import Path
 BACKEND_DIR = Path(__file__).resolve().parents[1]
 if str(BACKEND_DIR) not in sys.path:
     sys.path.insert(0, str(BACKEND_DIR))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _reset_agent_caches(tmp_path, monkeypatch):
+    from agents import invoice_agent, job_queue, llm_client, metrics, review_agent, sop_agent, sop_library
+
+    monkeypatch.setattr(invoice_agent, "INVOICE_CACHE_PATH", str(tmp_path / "invoice_cache.db"))
+    monkeypatch.setattr(review_agent, "_review_caches", {})
+    monkeypatch.setattr(llm_client, "_llm_caches", {})
+    monkeypatch.setattr(sop_library, "_libraries", {})
+    monkeypatch.setattr(sop_library, "SOP_LIBRARY_DIR", str(tmp_path / "sop_library"))
+    monkeypatch.setattr(llm_client, "LLM_CACHE_PATH", str(tmp_path / "llm_cache.db"))
+    metrics.REGISTRY.clear()
+    llm_client.CIRCUIT_BREAKER.reset()
+    sop_agent.DOCUMENT_CACHE.clear()
+    yield
+    # Background scoring jobs must not outlive the test whose lead store they write to.
+    job_queue.LEAD_SCORING_QUEUE.join(timeout=10)
+    sop_agent.DOCUMENT_CACHE.clear()
+    llm_client.invalidate_models()
+
+
+def _build_pdf(page_texts):
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+    import io
+
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for text in page_texts:
+        page = writer.add_blank_page(width=612, height=792)
+        lines = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in text.splitlines()]
+        ops = "".join(f"({line}) Tj 0 -14 Td " for line in lines)
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 12 Tf 72 720 Td {ops}ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(stream)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def make_pdf():
+    pytest.importorskip("pypdf")
+    return _build_pdf
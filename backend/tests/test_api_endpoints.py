@@ -1,4 +1,6 @@
+import asyncio
 import json
+import time
 
 import pytest
 
@@ -37,7 +39,10 @@ def test_invoice_endpoint_returns_structured_payload_for_binary_file():
 
 
 def test_sop_endpoint(monkeypatch):
-    monkeypatch.setattr(main, "answer_sop_question", lambda file_bytes, question: {"answer": f"Echo: {question}"})
+    async def fake_answer(file_bytes, question):
+        return {"answer": f"Echo: {question}"}
+
+    monkeypatch.setattr(main, "answer_sop_question_async", fake_answer)
     files = {"file": ("doc.pdf", b"%PDF-1.4", "application/pdf")}
     data = {"question": "How do I reset password?"}
     response = client.post("/api/agent/sop", files=files, data=data)
@@ -68,18 +73,387 @@ def test_sales_and_leads_endpoints(tmp_path, monkeypatch):
         ])
         if payload.get("lead_captured"):
             captured = True
-            assert payload["data"]["lead_score"] >= 0
-            assert payload["data"]["source"] in {"gemini", "deterministic"}
+            assert payload["data"]["scoring_status"] == "pending"
             break
 
     assert captured, "Expected lead to be captured by final step"
 
+    from agents.job_queue import LEAD_SCORING_QUEUE
+
+    assert LEAD_SCORING_QUEUE.join(timeout=10)
+    lead = client.get(f"/api/leads/{payload['lead_id']}").json()
+    assert lead["scoring_status"] == "scored"
+    assert lead["lead_score"] >= 0
+    assert lead["source"] in {"gemini", "deterministic"}
+    assert client.get("/api/leads/99999").status_code == 404
+
     leads_resp = client.get("/api/leads")
     assert leads_resp.status_code == 200
     leads = leads_resp.json()
     assert isinstance(leads, list)
     assert len(leads) >= 1
 
-    with open("leads_db.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
-    assert isinstance(data, list)
+    from agents.lead_store import get_lead_repository
+
+    assert get_lead_repository().count() == len(leads)
+
+
+def test_sop_upload_then_ask_by_doc_id(monkeypatch):
+    from agents import sop_agent
+
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Refunds are approved by the finance lead."])
+    monkeypatch.setattr(sop_agent, "_llm_answer", lambda *_: None)
+
+    files = {"file": ("doc.pdf", b"%PDF-1.4 refunds", "application/pdf")}
+    upload = client.post("/api/agent/sop/documents", files=files)
+    assert upload.status_code == 200
+    doc_id = upload.json()["doc_id"]
+
+    response = client.post("/api/agent/sop", data={"question": "Who approves refunds?", "doc_id": doc_id})
+    assert response.status_code == 200
+    assert response.json()["citations"] == ["Refunds are approved by the finance lead."]
+
+    missing = client.post("/api/agent/sop", data={"question": "Who approves refunds?", "doc_id": "nope"})
+    assert missing.status_code == 404
+
+
+def _parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_sop_stream_endpoint(monkeypatch):
+    from agents import sop_agent
+
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Refunds are approved by the finance lead."])
+    files = {"file": ("doc.pdf", b"%PDF-1.4 stream", "application/pdf")}
+    response = client.post("/api/agent/sop/stream", files=files, data={"question": "Who approves refunds?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(response.text)
+    assert events[0] == ("citations", {
+        "citations": ["Refunds are approved by the finance lead."],
+        "locations": [{"page": 1, "start": 0, "end": 41}],
+    })
+    assert events[-1][0] == "done"
+    assert events[-1][1]["citations"] == ["Refunds are approved by the finance lead."]
+
+
+class _TrackedUpload:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_sop_stream_closes_upload_even_if_the_body_never_starts(monkeypatch):
+    upload = _TrackedUpload()
+
+    async def fake_spool(*_):
+        return upload
+
+    monkeypatch.setattr(main, "_spool", fake_spool)
+    response = asyncio.run(main.stream_chat_with_sop(question="Q?", file=object(), doc_id=None))
+    assert not upload.closed
+    asyncio.run(response.background())
+    assert upload.closed
+
+
+def test_invoice_batch_closes_uploads_even_if_the_body_never_starts(monkeypatch):
+    uploads = [_TrackedUpload(), _TrackedUpload()]
+    spooled = iter(uploads)
+
+    async def fake_spool(*_):
+        return next(spooled)
+
+    class _File:
+        filename = "invoice.pdf"
+        content_type = "application/pdf"
+
+    monkeypatch.setattr(main, "_spool", fake_spool)
+    monkeypatch.setattr(main, "expand_invoice_uploads", lambda uploads: [])
+    response = asyncio.run(main.analyze_invoice_batch(files=[_File(), _File()]))
+    assert not any(upload.closed for upload in uploads)
+    asyncio.run(response.background())
+    assert all(upload.closed for upload in uploads)
+
+
+def test_sales_stream_endpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    response = client.post("/api/agent/sales/stream", json={"history": [], "message": "Hi"})
+    assert response.status_code == 200
+
+    events = _parse_sse(response.text)
+    assert events[-1][0] == "done"
+    assert events[-1][1]["lead_captured"] is False
+    assert "".join(data["text"] for name, data in events if name == "token") == events[-1][1]["response"]
+
+
+def test_invoice_batch_endpoint_streams_ndjson():
+    files = [
+        ("files", ("a.png", b"\x89PNG\r\n", "image/png")),
+        ("files", ("b.png", b"\x89PNG\r\nB", "image/png")),
+    ]
+    response = client.post("/api/agent/invoice/batch", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["filename"] for line in lines) == ["a.png", "b.png"]
+    assert all(line["result"]["source"] in {"gemini", "deterministic"} for line in lines)
+
+
+def test_sales_endpoint_round_trips_lead_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = client.post("/api/agent/sales", json={"history": [], "message": "My budget is $450000"}).json()
+    assert first["lead_state"]["budget"] == "$450,000"
+
+    history = [
+        {"role": "user", "content": "My budget is $450000"},
+        {"role": "assistant", "content": first["response"]},
+    ]
+    second = client.post(
+        "/api/agent/sales",
+        json={"history": history, "message": "Downtown Manhattan", "lead_state": first["lead_state"]},
+    ).json()
+    assert second["lead_state"]["location"] == "Downtown Manhattan"
+    assert second["lead_state"]["processed"] == 3
+
+
+def test_sales_session_mode_keeps_history_on_server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    first = client.post("/api/agent/sales", json={"message": "Hi"}).json()
+    session_id = first["session_id"]
+    assert "lead_state" not in first
+
+    payload = None
+    for message in ["My budget is $450000", "Downtown Manhattan", "Next week", "+1 555 555 1212"]:
+        payload = client.post("/api/agent/sales", json={"session_id": session_id, "message": message}).json()
+        assert payload["session_id"] == session_id
+
+    assert payload["lead_captured"] is True
+    assert payload["data"]["budget"] == "$450,000"
+
+    missing = client.post("/api/agent/sales", json={"session_id": "expired", "message": "Hi"})
+    assert missing.status_code == 404
+
+
+def _finish_sales_chat():
+    history = [
+        {"role": "user", "content": "My budget is $450000"},
+        {"role": "assistant", "content": "Where?"},
+        {"role": "user", "content": "Downtown Manhattan"},
+        {"role": "assistant", "content": "When?"},
+        {"role": "user", "content": "Next week"},
+        {"role": "assistant", "content": "Phone?"},
+    ]
+    return client.post("/api/agent/sales", json={"history": history, "message": "+1 555 555 1212"}).json()
+
+
+def test_final_sales_turn_does_not_wait_for_scoring(tmp_path, monkeypatch):
+    import threading
+
+    from agents.job_queue import LEAD_SCORING_QUEUE
+
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+
+    def slow_score(history, data):
+        release.wait(10)
+        return {"lead_score": 90, "status": "Hot", "source": "gemini", "captured_at": "later"}
+
+    monkeypatch.setattr(main, "score_lead_fields", slow_score)
+    payload = _finish_sales_chat()
+    assert payload["lead_captured"] is True
+    assert payload["data"]["budget"] == "$450,000"
+    assert client.get(f"/api/leads/{payload['lead_id']}").json()["scoring_status"] == "pending"
+
+    release.set()
+    assert LEAD_SCORING_QUEUE.join(timeout=10)
+    lead = client.get(f"/api/leads/{payload['lead_id']}").json()
+    assert (lead["scoring_status"], lead["lead_score"], lead["status"]) == ("scored", 90, "Hot")
+    assert lead["captured_at"] == payload["data"]["captured_at"]
+
+
+def test_lead_scoring_failure_and_inline_fallback(tmp_path, monkeypatch):
+    from agents import job_queue
+
+    monkeypatch.chdir(tmp_path)
+    failing = job_queue.BackgroundJobQueue("lead_scoring", 1, 10, max_attempts=2, retry_backoff_seconds=0.001)
+    monkeypatch.setattr(main, "LEAD_SCORING_QUEUE", failing)
+    monkeypatch.setattr(main, "score_lead_fields", lambda *_: 1 / 0)
+    payload = _finish_sales_chat()
+    assert failing.join(timeout=10)
+    lead = client.get(f"/api/leads/{payload['lead_id']}").json()
+    assert lead["scoring_status"] == "failed"
+    assert failing.stats()["retried"] == 1
+
+    # With background scoring switched off, the final turn scores and stores the lead itself.
+    monkeypatch.setattr(main, "LEAD_SCORING_QUEUE", job_queue.BackgroundJobQueue("lead_scoring", 0, 10))
+    payload = _finish_sales_chat()
+    assert payload["data"]["scoring_status"] == "scored"
+    assert payload["data"]["source"] in {"gemini", "deterministic"}
+    assert client.get(f"/api/leads/{payload['lead_id']}").json()["lead_score"] == payload["data"]["lead_score"]
+
+
+def test_bulk_review_endpoints_stream_one_line_per_review():
+    response = client.post(
+        "/api/agent/review/bulk",
+        json={"reviews": ["Great service", "Terrible and rude", "Fine"], "business_name": "Cafe", "batch_size": 2},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+
+    files = {"file": ("reviews.csv", b"review\nGreat food\nCold coffee\n", "text/csv")}
+    csv_response = client.post("/api/agent/review/bulk/csv", files=files, data={"business_name": "Cafe"})
+    assert len(csv_response.text.splitlines()) == 2
+
+
+def test_metrics_endpoint_reports_agent_stages(monkeypatch):
+    async def fake_review(review, business_name):
+        return {"response": "Thanks", "sentiment": "Positive", "source": "deterministic"}
+
+    monkeypatch.setattr(main, "generate_review_response_async", fake_review)
+    client.post("/api/agent/review", json={"review": "Great food", "business_name": "Cafe"})
+    for path in ("/api/agent/made-up-1", "/api/agent/made-up-2/x"):
+        assert client.get(path).status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'agent_stage_duration_seconds_count{agent="review",stage="request"} 1' in response.text
+    assert 'agent_request_size_bytes_count{agent="review"} 1' in response.text
+    assert 'agent_stage_duration_seconds_count{agent="other",stage="request"} 2' in response.text
+    assert "made-up" not in response.text
+
+
+def test_latency_budget_header_returns_deterministic_answer(monkeypatch):
+    from agents import review_agent
+
+    async def slow_llm(review_text, business_name):
+        await asyncio.sleep(2.0)
+        return {"sentiment": "Positive", "response": "Too late"}
+
+    monkeypatch.setattr(review_agent, "_llm_review_response_async", slow_llm)
+    started = time.perf_counter()
+    response = client.post(
+        "/api/agent/review",
+        json={"review": "Great food", "business_name": "Cafe"},
+        headers={"X-Latency-Budget-Ms": "100"},
+    )
+    assert response.status_code == 200
+    assert response.json()["source"] == "deterministic"
+    assert time.perf_counter() - started < 1.5
+
+
+def test_oversized_upload_returns_413(monkeypatch):
+    from agents import uploads
+
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024)
+    files = {"file": ("big.pdf", b"%PDF" + b"0" * 4096, "application/pdf")}
+    response = client.post("/api/agent/invoice", files=files)
+    assert response.status_code == 413
+
+    monkeypatch.setattr(main, "UPLOAD_MAX_REQUEST_BYTES", 100)
+    response = client.post("/api/agent/invoice", files=files)
+    assert response.status_code == 413
+
+
+def test_chunked_upload_is_cut_off_at_the_request_limit(monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_MAX_REQUEST_BYTES", 64 * 1024)
+
+    def body():
+        # Chunked transfer: no Content-Length header for the middleware to check up front.
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.pdf"\r\n'
+        yield b"Content-Type: application/pdf\r\n\r\n"
+        for _ in range(64):
+            yield b"0" * 4096
+        yield b"\r\n--b--\r\n"
+
+    response = client.post(
+        "/api/agent/invoice", content=body(), headers={"Content-Type": "multipart/form-data; boundary=b"}
+    )
+    assert response.status_code == 413
+    assert "byte limit" in response.json()["detail"]
+
+
+def test_request_size_limit_stops_reading_the_body(monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_MAX_REQUEST_BYTES", 10_000)
+    chunks_read = []
+    sent = []
+
+    async def endless_body():
+        chunks_read.append(1)
+        return {"type": "http.request", "body": b"0" * 4096, "more_body": True}
+
+    async def app(scope, receive, send):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"too late"})
+
+    async def record(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"transfer-encoding", b"chunked")]}
+    asyncio.run(main.LimitRequestSize(app)(scope, endless_body, record))
+    assert len(chunks_read) == 3
+    assert sent[0]["status"] == 413
+    assert b"too late" not in b"".join(message.get("body", b"") for message in sent)
+
+
+def test_leads_pagination_and_etag(tmp_path, monkeypatch):
+    from agents import lead_store
+
+    monkeypatch.setattr(lead_store, "LEADS_DB_PATH", str(tmp_path / "leads.db"))
+    monkeypatch.setattr(lead_store, "LEADS_JSON_PATH", str(tmp_path / "leads_db.json"))
+    repository = lead_store.get_lead_repository()
+    for score in (10, 80, 50):
+        repository.add({"lead_score": score, "status": "Warm"})
+
+    first = client.get("/api/leads", params={"limit": 2})
+    assert [lead["lead_score"] for lead in first.json()] == [80, 50]
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get("/api/leads", params={"limit": 2, "cursor": cursor})
+    assert [lead["lead_score"] for lead in second.json()] == [10]
+    assert "X-Next-Cursor" not in second.headers
+
+    etag = first.headers["ETag"]
+    cached = client.get("/api/leads", params={"limit": 2}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    repository.add({"lead_score": 99, "status": "Hot"})
+    changed = client.get("/api/leads", params={"limit": 2}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()[0]["lead_score"] == 99
+
+    assert client.get("/api/leads", params={"cursor": "garbage!"}).status_code == 400
+
+
+def test_sop_library_endpoints(monkeypatch):
+    from agents import sop_library
+
+    texts = {b"%PDF-1.4 refunds": "Refunds are approved by the finance lead.", b"%PDF-1.4 outages": "Outages page on-call."}
+    monkeypatch.setattr(sop_library, "extract_pages_from_pdf", lambda source: [texts[bytes(source)]])
+    monkeypatch.setattr(sop_library, "generate_text_async", lambda *_, **__: asyncio.sleep(0, None))
+
+    for name, body in (("refunds.pdf", b"%PDF-1.4 refunds"), ("outages.pdf", b"%PDF-1.4 outages")):
+        added = client.post("/api/agent/sop/library", files={"file": (name, body, "application/pdf")})
+        assert added.status_code == 200 and added.json()["added"] is True
+    documents = client.get("/api/agent/sop/library").json()
+    assert [doc["name"] for doc in documents] == ["refunds.pdf", "outages.pdf"]
+
+    answer = client.post("/api/agent/sop/library/ask", data={"question": "Who approves refunds?"}).json()
+    assert answer["citations"][0]["document"] == "refunds.pdf"
+
+    refunds_id = documents[0]["doc_id"]
+    assert client.delete(f"/api/agent/sop/library/{refunds_id}").json() == {"removed": refunds_id}
+    assert client.delete(f"/api/agent/sop/library/{refunds_id}").status_code == 404
+    answer = client.post("/api/agent/sop/library/ask", data={"question": "Who approves refunds?"}).json()
+    assert answer["citations"] == []
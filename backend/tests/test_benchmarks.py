@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+import run_suite  # noqa: E402
+
+
+def test_suite_runs_every_case_at_small_scale():
+    pytest.importorskip("pypdf")
+    results = run_suite.run(scale=0.01, repeats=1)
+    assert set(results) == set(run_suite.build_cases(1.0, "").keys())
+    assert all(result["median_ms"] >= 0 and result["peak_kb"] >= 0 for result in results.values())
+
+
+def test_compare_flags_latency_and_memory_regressions():
+    baseline = {"median_ms": 10.0, "peak_kb": 1000.0}
+    assert run_suite.compare("case", {"median_ms": 14.0, "peak_kb": 1200.0}, baseline, 1.5) == []
+
+    problems = run_suite.compare("case", {"median_ms": 40.0, "peak_kb": 5000.0}, baseline, 1.5)
+    assert len(problems) == 2
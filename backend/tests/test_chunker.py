@@ -0,0 +1,53 @@
+from agents import chunker
+from agents.chunker import Chunk, iter_page_chunks, sentence_spans
+
+PAGE = "First rule applies.  Second rule follows!\n\nThird rule here? Fourth rule ends."
+
+
+def test_sentence_spans_trim_whitespace():
+    spans = list(sentence_spans(PAGE))
+    assert [PAGE[start:end] for start, end in spans] == [
+        "First rule applies.", "Second rule follows!", "Third rule here?", "Fourth rule ends.",
+    ]
+    assert list(sentence_spans("  \n\n  ")) == []
+
+
+def test_default_chunks_are_single_sentences():
+    chunks = list(iter_page_chunks([PAGE]))
+    assert [chunk.text for chunk in chunks] == [
+        "First rule applies.", "Second rule follows!", "Third rule here?", "Fourth rule ends.",
+    ]
+    assert all(chunk.page == 1 and PAGE[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+
+
+def test_windows_overlap_and_keep_the_tail():
+    chunks = list(iter_page_chunks([PAGE], sentences=3, overlap=1))
+    assert [chunk.text for chunk in chunks] == [
+        PAGE[:PAGE.index("Fourth") - 1].rstrip(),
+        PAGE[PAGE.index("Third"):],
+    ]
+    assert all(PAGE[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+
+
+def test_windows_never_cross_pages(monkeypatch):
+    monkeypatch.setattr(chunker, "SOP_CHUNK_SENTENCES", 2)
+    pages = ["Only sentence.", "", "Alpha one. Beta two. Gamma three."]
+    chunks = list(iter_page_chunks(pages))
+    assert chunks == [
+        Chunk("Only sentence.", 1, 0, 14),
+        Chunk("Alpha one. Beta two.", 3, 0, 20),
+        Chunk("Gamma three.", 3, 21, 33),
+    ]
+
+
+def test_pages_are_consumed_lazily():
+    consumed = []
+
+    def pages():
+        for text in ["Page one.", "Page two."]:
+            consumed.append(text)
+            yield text
+
+    stream = iter_page_chunks(pages())
+    assert next(stream).page == 1
+    assert consumed == ["Page one."]
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from agents import deadline, metrics
+
+
+async def _slow_llm(delay, value):
+    await asyncio.sleep(delay)
+    return value
+
+
+def _race(llm_coro, fallback, budget):
+    async def run():
+        token = deadline.start_request_budget(budget)
+        try:
+            return await deadline.race_llm_with_fallback(llm_coro, fallback, "review")
+        finally:
+            deadline.end_request_budget(token)
+
+    return asyncio.run(run())
+
+
+def test_without_budget_waits_for_llm():
+    assert _race(_slow_llm(0.05, {"ok": 1}), lambda: "fallback", 0) == ("gemini", {"ok": 1})
+
+
+def test_fallback_wins_when_llm_misses_deadline():
+    started = time.perf_counter()
+    source, result = _race(_slow_llm(1.0, {"ok": 1}), lambda: "fallback", 0.05)
+    assert (source, result) == ("deadline", "fallback")
+    assert time.perf_counter() - started < 0.5
+    assert metrics.LLM_CALLS.value("review", "deadline_exceeded") == 1
+
+
+def test_llm_within_deadline_wins_and_failure_falls_back():
+    assert _race(_slow_llm(0.0, {"ok": 1}), lambda: "fallback", 1.0) == ("gemini", {"ok": 1})
+    assert _race(_slow_llm(0.0, None), lambda: "fallback", 1.0) == ("deterministic", "fallback")
+
+
+def test_config_default_budget(monkeypatch):
+    monkeypatch.setattr(deadline, "AGENT_LATENCY_BUDGET_SECONDS", 2.0)
+    token = deadline.start_request_budget()
+    try:
+        assert 1.5 < deadline.remaining_budget() <= 2.0
+    finally:
+        deadline.end_request_budget(token)
+    assert deadline.remaining_budget() is None
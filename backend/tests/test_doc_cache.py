@@ -0,0 +1,33 @@
+from agents.doc_cache import CachedDocument, DocumentCache, content_hash
+
+
+def _doc(doc_id, size):
+    return CachedDocument(doc_id, 4, ["text"], None, size)
+
+
+def test_lru_eviction_by_entry_count():
+    cache = DocumentCache(max_entries=2, max_bytes=1000)
+    cache.put(_doc("a", 10))
+    cache.put(_doc("b", 10))
+    assert cache.get("a") is not None
+    cache.put(_doc("c", 10))
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_eviction_by_byte_budget():
+    cache = DocumentCache(max_entries=10, max_bytes=100)
+    cache.put(_doc("a", 60))
+    cache.put(_doc("b", 60))
+    assert "a" not in cache
+    assert cache.stats()["bytes"] == 60
+
+    cache.put(_doc("huge", 500))
+    assert "huge" not in cache
+    assert "b" in cache
+
+
+def test_content_hash_is_sha256():
+    assert content_hash(b"abc") == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
@@ -1,4 +1,10 @@
-from agents import invoice_agent
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+from agents import deadline, invoice_agent
 
 
 def test_process_invoice_returns_warning_for_non_pdf_binary(monkeypatch):
@@ -50,3 +56,164 @@ Total Due: 220.00 USD
     assert parsed["tax_amount"] == 20.0
     assert parsed["currency"] == "USD"
     assert len(parsed["line_items"]) >= 2
+
+
+def test_process_invoice_async_uses_gemini_result(monkeypatch):
+    async def fake_llm(*_):
+        return {"invoice_number": "INV-ASYNC", "line_items": []}
+
+    monkeypatch.setattr(invoice_agent, "_llm_extract_invoice_async", fake_llm)
+    result = asyncio.run(invoice_agent.process_invoice_async(b"fake", "image/png"))
+    assert result["invoice_number"] == "INV-ASYNC"
+    assert result["source"] == "gemini"
+
+
+def test_process_invoice_serves_repeat_uploads_from_cache(monkeypatch):
+    calls = []
+
+    def fake_llm(file_data, mime_type):
+        calls.append(file_data)
+        return {"invoice_number": "INV-CACHE", "line_items": []}
+
+    monkeypatch.setattr(invoice_agent, "_llm_extract_invoice", fake_llm)
+    first = invoice_agent.process_invoice(b"same invoice", "image/png")
+    second = invoice_agent.process_invoice(b"same invoice", "image/png")
+    invoice_agent.process_invoice(b"other invoice", "image/png")
+
+    assert first == second
+    assert len(calls) == 2
+    stats = invoice_agent.get_invoice_cache().stats()
+    assert stats["hits_by_source"] == {"gemini": 1}
+    assert stats["misses"] == 2
+
+
+def test_deadline_fallback_is_not_cached(monkeypatch):
+    async def slow_llm(file_data, mime_type):
+        await asyncio.sleep(1.0)
+        return {"invoice_number": "INV-LLM", "line_items": []}
+
+    async def fast_llm(file_data, mime_type):
+        return {"invoice_number": "INV-LLM", "line_items": []}
+
+    async def run(budget):
+        token = deadline.start_request_budget(budget)
+        try:
+            return await invoice_agent.process_invoice_async(b"budgeted invoice", "image/png")
+        finally:
+            deadline.end_request_budget(token)
+
+    monkeypatch.setattr(invoice_agent, "_llm_extract_invoice_async", slow_llm)
+    assert asyncio.run(run(0.05))["source"] == "deterministic"
+    assert len(invoice_agent.get_invoice_cache()) == 0
+
+    # A later client without a tight budget gets (and caches) the LLM result.
+    monkeypatch.setattr(invoice_agent, "_llm_extract_invoice_async", fast_llm)
+    assert asyncio.run(run(0))["invoice_number"] == "INV-LLM"
+    assert len(invoice_agent.get_invoice_cache()) == 1
+
+
+def test_batch_processing_isolates_failures_and_bounds_concurrency(monkeypatch):
+    active = {"now": 0, "peak": 0}
+
+    async def fake_process(data, mime_type):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        if data == b"bad":
+            raise RuntimeError("corrupt file")
+        return {"invoice_number": data.decode(), "source": "deterministic"}
+
+    monkeypatch.setattr(invoice_agent, "process_invoice_async", fake_process)
+    files = [(f"f{n}.png", b"bad" if n == 2 else f"INV-{n}".encode(), "image/png") for n in range(6)]
+
+    async def collect():
+        return [item async for item in invoice_agent.process_invoice_batch_async(files, concurrency=2)]
+
+    results = asyncio.run(collect())
+    assert sorted(item["index"] for item in results) == list(range(6))
+    assert [item["error"] for item in results if "error" in item] == ["corrupt file"]
+    assert active["peak"] == 2
+
+
+def test_expand_invoice_uploads_unpacks_zip_archives():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("march/inv-1.pdf", b"%PDF-1.4")
+        archive.writestr("inv-2.png", b"\x89PNG")
+        archive.writestr("__MACOSX/.DS_Store", b"")
+
+    files = invoice_agent.expand_invoice_uploads([
+        ("batch.zip", buffer.getvalue(), "application/zip"),
+        ("loose.jpg", b"jpeg", "image/jpeg"),
+    ])
+    assert [(name, mime) for name, _, mime in files] == [
+        ("march/inv-1.pdf", "application/pdf"),
+        ("inv-2.png", "image/png"),
+        ("loose.jpg", "image/jpeg"),
+    ]
+    # Members are unpacked on demand, not while the archive is listed.
+    assert isinstance(files[0][1], invoice_agent.ArchiveMember)
+    with files[0][1].open() as member:
+        assert member.read_bytes() == b"%PDF-1.4"
+    assert files[2][1] == b"jpeg"
+
+    with pytest.raises(ValueError):
+        invoice_agent.expand_invoice_uploads([("broken.zip", b"not a zip", "application/zip")])
+
+
+def test_batch_unpacks_archive_members_inside_workers(monkeypatch):
+    from agents import uploads
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("inv-1.png", b"INV-1")
+        archive.writestr("huge.png", b"x" * 64)
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 32)
+    seen = []
+
+    async def fake_process(data, mime_type):
+        seen.append(data)
+        return {"invoice_number": data.read_bytes().decode(), "source": "deterministic"}
+
+    monkeypatch.setattr(invoice_agent, "process_invoice_async", fake_process)
+    files = invoice_agent.expand_invoice_uploads([("batch.zip", buffer.getvalue(), "application/zip")])
+
+    async def collect():
+        return [item async for item in invoice_agent.process_invoice_batch_async(files)]
+
+    results = sorted(asyncio.run(collect()), key=lambda item: item["index"])
+    assert results[0]["result"]["invoice_number"] == "INV-1"
+    assert "byte limit" in results[1]["error"]
+    assert len(seen) == 1 and seen[0].source is None  # closed once processed
+
+
+def test_extract_invoice_fields_handles_split_labels_and_day_first_dates():
+    text = """\
+Bistro Supplies
+Invoice
+INV-77
+Issued 31/12/2024
+Coffee beans    1,200.50
+Milk 13
+Total Due:
+1,212.50
+"""
+
+    parsed = invoice_agent._extract_invoice_fields(text)
+
+    assert parsed["invoice_number"] == "INV-77"
+    assert parsed["date"] == "2024-12-31"
+    assert parsed["total_amount"] == 1212.5
+    assert parsed["currency"] == "USD"
+    assert parsed["line_items"] == [{"description": "Coffee beans", "amount": 1200.5}]
+
+
+def test_extract_invoice_fields_matches_labels_split_over_three_lines():
+    # Each label, qualifier and value on its own line, as the old whole-text regexes accepted.
+    text = "ACME Ltd\nInvoice\nNo:\nINV-77\nTotal\nDue:\n220.00\nVAT\n:\n20"
+    parsed = invoice_agent._extract_invoice_fields(text)
+
+    assert parsed["invoice_number"] == "INV-77"
+    assert parsed["total_amount"] == 220.0
+    assert parsed["tax_amount"] == 20.0
@@ -0,0 +1,98 @@
+import threading
+
+from agents import metrics
+from agents.job_queue import BackgroundJobQueue
+
+
+def _queue(**overrides):
+    options = {"workers": 2, "max_pending": 10, "max_attempts": 3, "retry_backoff_seconds": 0.001}
+    options.update(overrides)
+    return BackgroundJobQueue("test_jobs", **options)
+
+
+def test_jobs_run_in_background_and_join_waits():
+    queue = _queue()
+    done = []
+    for n in range(5):
+        assert queue.submit(lambda n=n: done.append(n))
+
+    assert queue.join(timeout=5)
+    assert sorted(done) == [0, 1, 2, 3, 4]
+    assert queue.stats()["completed"] == 5
+    assert queue.stats()["pending"] == 0
+    assert metrics.BACKGROUND_JOBS.value("test_jobs", "success") == 5
+    queue.shutdown(timeout=5)
+
+
+def test_failing_job_is_retried_then_reported():
+    queue = _queue()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("database is locked")
+
+    failures = []
+    queue.submit(flaky)
+    queue.submit(lambda: 1 / 0, on_failure=failures.append)
+    assert queue.join(timeout=5)
+
+    assert len(attempts) == 3
+    assert len(failures) == 1 and isinstance(failures[0], ZeroDivisionError)
+    stats = queue.stats()
+    assert (stats["completed"], stats["failed"], stats["retried"]) == (1, 1, 4)
+    assert metrics.BACKGROUND_JOBS.value("test_jobs", "failed") == 1
+    queue.shutdown(timeout=5)
+
+
+def test_full_or_disabled_queue_rejects_jobs():
+    queue = _queue(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    assert queue.submit(blocker)
+    assert started.wait(5)
+    assert queue.submit(lambda: None)
+    assert not queue.submit(lambda: None)
+    assert queue.stats()["rejected"] == 1
+
+    release.set()
+    assert queue.join(timeout=5)
+    queue.shutdown(timeout=5)
+    assert queue.stats()["running_workers"] == 0
+
+    assert not _queue(workers=0).submit(lambda: None)
+
+
+def test_shutdown_does_not_block_on_a_full_queue():
+    import time
+
+    queue = _queue(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+    done = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    assert queue.submit(blocker)
+    assert started.wait(5)
+    assert queue.submit(lambda: done.append("queued"))
+
+    began = time.monotonic()
+    assert queue.shutdown(timeout=0.1) is False
+    assert time.monotonic() - began < 2
+    release.set()
+
+    # The queued job waits for the next submit, which restarts the workers even if it is rejected.
+    queue.submit(lambda: done.append("late"))
+    assert queue.join(timeout=5)
+    assert "queued" in done
+    queue.shutdown(timeout=5)
+    assert queue.stats()["running_workers"] == 0
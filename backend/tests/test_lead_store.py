@@ -0,0 +1,117 @@
+import json
+import threading
+
+import pytest
+
+from agents.lead_store import JsonLeadRepository, LeadRepository, SQLiteLeadRepository
+
+
+def test_sqlite_repository_orders_and_filters(tmp_path):
+    repo = SQLiteLeadRepository(str(tmp_path / "leads.db"))
+    repo.add({"lead_score": 40, "status": "Cold"})
+    repo.add({"lead_score": 90, "status": "Hot"})
+    repo.add({"lead_score": 90, "status": "Hot", "summary": "second"})
+    repo.add({"lead_score": 60, "status": "Warm"})
+
+    assert [lead["lead_score"] for lead in repo.list_leads()] == [90, 90, 60, 40]
+    assert repo.list_leads()[1]["summary"] == "second"
+    assert [lead["status"] for lead in repo.list_leads(status="Hot")] == ["Hot", "Hot"]
+    assert len(repo.list_leads(min_score=60)) == 3
+    assert len(repo.list_leads(limit=1)) == 1
+
+
+def test_sqlite_repository_migrates_json_once(tmp_path):
+    legacy = tmp_path / "leads_db.json"
+    legacy.write_text(json.dumps([{"lead_score": 95, "status": "Qualified"}, {"budget": "$5000"}]))
+    db_path = str(tmp_path / "leads.db")
+
+    repo = SQLiteLeadRepository(db_path, legacy_json_path=str(legacy))
+    assert repo.count() == 2
+    assert repo.list_leads()[0]["status"] == "Qualified"
+
+    reopened = SQLiteLeadRepository(db_path, legacy_json_path=str(legacy))
+    assert reopened.count() == 2
+
+
+def test_sqlite_repository_concurrent_inserts(tmp_path):
+    repo = SQLiteLeadRepository(str(tmp_path / "leads.db"))
+
+    def writer(offset):
+        for i in range(25):
+            repo.add({"lead_score": offset + i, "status": "Warm"})
+
+    threads = [threading.Thread(target=writer, args=(n * 100,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert repo.count() == 100
+
+
+def test_json_repository_round_trip(tmp_path):
+    repo = JsonLeadRepository(str(tmp_path / "leads_db.json"))
+    repo.add({"lead_score": 10})
+    repo.add({"lead_score": 70})
+    assert [lead["lead_score"] for lead in repo.list_leads()] == [70, 10]
+
+
+def _seed(repo):
+    for score, status, day in [(40, "Cold", 1), (90, "Hot", 2), (90, "Hot", 3), (60, "Warm", 4), (75, "Hot", 5)]:
+        repo.add({"lead_score": score, "status": status, "captured_at": f"2026-03-0{day}T10:00:00Z"})
+
+
+def _pages(repo, **filters):
+    pages, cursor = [], None
+    while True:
+        leads, cursor = repo.query_leads(limit=2, cursor=cursor, **filters)
+        pages.append([(lead["lead_score"], lead["captured_at"][8:10]) for lead in leads])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pagination_matches_full_ordering(tmp_path):
+    for repo in (SQLiteLeadRepository(str(tmp_path / "leads.db")), JsonLeadRepository(str(tmp_path / "leads.json"))):
+        _seed(repo)
+        assert _pages(repo) == [[(90, "02"), (90, "03")], [(75, "05"), (60, "04")], [(40, "01")]]
+        assert _pages(repo, status="Hot", min_score=80) == [[(90, "02"), (90, "03")]]
+        in_range = _pages(repo, since="2026-03-02", until="2026-03-05")
+        assert in_range == [[(90, "02"), (90, "03")], [(60, "04")]]
+
+
+def test_invalid_cursor_is_rejected(tmp_path):
+    import pytest
+
+    repo = SQLiteLeadRepository(str(tmp_path / "leads.db"))
+    with pytest.raises(ValueError):
+        repo.query_leads(cursor="not-a-cursor!")
+
+
+def test_revision_changes_on_every_write(tmp_path):
+    repo = SQLiteLeadRepository(str(tmp_path / "leads.db"))
+    before = repo.revision()
+    repo.add({"lead_score": 10})
+    after_add = repo.revision()
+    assert after_add != before
+    assert SQLiteLeadRepository(str(tmp_path / "leads.db")).revision() == after_add
+
+
+def test_get_and_update_by_id(tmp_path):
+    for repo in (SQLiteLeadRepository(str(tmp_path / "leads.db")), JsonLeadRepository(str(tmp_path / "leads.json"))):
+        repo.add({"lead_score": 50, "status": "Warm"})
+        lead_id = repo.add({"lead_score": 0, "status": None, "scoring_status": "pending"})
+        revision = repo.revision()
+
+        assert repo.get(lead_id)["scoring_status"] == "pending"
+        assert repo.update(lead_id, {"lead_score": 85, "status": "Hot", "scoring_status": "scored"})
+        assert repo.get(lead_id) == {"lead_score": 85, "status": "Hot", "scoring_status": "scored"}
+        assert repo.list_leads(status="Hot")[0]["lead_score"] == 85
+        assert repo.revision() != revision
+
+        assert repo.get(999) is None
+        assert not repo.update(999, {"lead_score": 1})
+
+
+def test_repository_interface_is_abstract():
+    with pytest.raises(TypeError):
+        LeadRepository()
@@ -0,0 +1,351 @@
+import asyncio
+import time
+
+import pytest
+
+from agents import llm_client
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _AsyncModel:
+    def __init__(self, delay=0.0, text='{"ok": true}'):
+        self.delay = delay
+        self.text = text
+        self.active = 0
+        self.peak = 0
+
+    async def generate_content_async(self, contents):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return _Response(self.text)
+        finally:
+            self.active -= 1
+
+
+class _SyncModel:
+    def generate_content(self, contents):
+        time.sleep(0.01)
+        return _Response("plain answer")
+
+
+def test_generate_json_async_parses_response(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _AsyncModel(text='```json\n{"a": 1}\n```'))
+    assert asyncio.run(llm_client.generate_json_async("prompt", agent="invoice")) == {"a": 1}
+
+
+def test_generate_text_async_falls_back_to_thread_for_sync_sdk(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _SyncModel())
+    assert asyncio.run(llm_client.generate_text_async("prompt")) == "plain answer"
+
+
+def test_generate_text_async_returns_none_on_timeout(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _AsyncModel(delay=1.0))
+    assert asyncio.run(llm_client.generate_text_async("prompt", timeout=0.01)) is None
+
+
+def test_per_agent_concurrency_is_bounded(monkeypatch):
+    model = _AsyncModel(delay=0.02)
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    monkeypatch.setenv("LLM_CONCURRENCY_REVIEW", "2")
+
+    async def run():
+        return await asyncio.gather(*(llm_client.generate_json_async("p", agent="review") for _ in range(6)))
+
+    results = asyncio.run(run())
+    assert all(result == {"ok": True} for result in results)
+    assert model.peak == 2
+
+
+def test_async_helpers_return_none_without_llm(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: None)
+    assert asyncio.run(llm_client.generate_json_async("prompt")) is None
+    assert asyncio.run(llm_client.generate_text_async("prompt")) is None
+
+
+class _FakeGenai:
+    def __init__(self):
+        self.configured = []
+        self.created = []
+
+    def configure(self, api_key):
+        self.configured.append(api_key)
+
+    def GenerativeModel(self, name, generation_config=None):
+        model = object()
+        self.created.append((name, generation_config))
+        return model
+
+
+def test_models_are_reused_until_invalidated(monkeypatch):
+    fake = _FakeGenai()
+    monkeypatch.setattr(llm_client, "genai", fake)
+    monkeypatch.setenv("GEMINI_API_KEY", "key-1")
+    llm_client.invalidate_models()
+
+    first = llm_client._model(response_json=True)
+    assert llm_client._model(response_json=True) is first
+    assert llm_client._model(response_json=False) is not first
+    assert fake.configured == ["key-1"]
+    assert len(fake.created) == 2
+
+    monkeypatch.setenv("GEMINI_API_KEY", "key-2")
+    assert llm_client._model(response_json=True) is first
+
+    llm_client.invalidate_models()
+    rotated = llm_client._model(response_json=True)
+    assert rotated is not first
+    assert fake.configured == ["key-1", "key-2"]
+
+    monkeypatch.delenv("GEMINI_API_KEY")
+    monkeypatch.delenv("GEMINI_API_KEY_2", raising=False)
+    llm_client.invalidate_models()
+    assert llm_client._model() is None
+
+
+class _StreamingAsyncModel:
+    async def generate_content_async(self, contents, stream=False):
+        async def chunks():
+            for text in ["Hel", "lo", ""]:
+                yield _Response(text)
+
+        return chunks()
+
+
+class _StreamingSyncModel:
+    def generate_content(self, contents, stream=False):
+        return iter([_Response("a"), _Response("b")])
+
+
+async def _collect(stream):
+    return [text async for text in stream]
+
+
+def test_stream_text_async_yields_chunks(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _StreamingAsyncModel())
+    assert asyncio.run(_collect(llm_client.stream_text_async("prompt"))) == ["Hel", "lo"]
+
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _StreamingSyncModel())
+    assert asyncio.run(_collect(llm_client.stream_text_async("prompt"))) == ["a", "b"]
+
+
+class _DroppingStreamModel:
+    def __init__(self, fail_after: int):
+        self.fail_after = fail_after
+
+    async def generate_content_async(self, contents, stream=False):
+        async def chunks():
+            for text in ["Refunds are ", "approved by the"][:self.fail_after]:
+                yield _Response(text)
+            raise RuntimeError("connection reset")
+
+        return chunks()
+
+
+def test_stream_text_async_reports_a_dropped_stream(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _DroppingStreamModel(2))
+    received = []
+
+    async def consume():
+        async for text in llm_client.stream_text_async("prompt"):
+            received.append(text)
+
+    with pytest.raises(llm_client.LLMStreamInterrupted) as interrupted:
+        asyncio.run(consume())
+    assert received == ["Refunds are ", "approved by the"]
+    assert interrupted.value.partial_text == "Refunds are approved by the"
+    assert interrupted.value.outcome == "error"
+
+    # Failing before any text is indistinguishable from an unavailable model: an empty stream.
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _DroppingStreamModel(0))
+    assert asyncio.run(_collect(llm_client.stream_text_async("prompt"))) == []
+
+
+def test_stream_text_async_is_empty_without_llm(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: None)
+    assert asyncio.run(_collect(llm_client.stream_text_async("prompt"))) == []
+
+
+class _FailingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents):
+        self.calls += 1
+        raise RuntimeError("503 Service Unavailable")
+
+
+def test_circuit_opens_after_failures_and_skips_calls(monkeypatch):
+    model = _FailingModel()
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    breaker = llm_client.CIRCUIT_BREAKER
+
+    for _ in range(breaker.min_calls):
+        assert llm_client.generate_text("prompt") is None
+    assert breaker.state == "open"
+
+    assert llm_client.generate_json("prompt") is None
+    assert model.calls == breaker.min_calls
+    assert llm_client.circuit_breaker_state()["times_opened"] == 1
+
+
+def test_half_open_probe_closes_circuit_on_success(monkeypatch):
+    breaker = llm_client.CircuitBreaker(min_calls=2, failure_rate=0.5, cooldown_seconds=0.05, half_open_probes=1)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    assert not breaker.allow_request()  # only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = llm_client.CircuitBreaker(min_calls=1, failure_rate=0.5, cooldown_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+
+
+def test_invalid_json_does_not_count_as_outage(monkeypatch):
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: _AsyncModel(text="not json"))
+    for _ in range(llm_client.CIRCUIT_BREAKER.min_calls + 1):
+        assert asyncio.run(llm_client.generate_json_async("prompt")) is None
+    assert llm_client.CIRCUIT_BREAKER.state == "closed"
+
+
+def test_queueing_timeouts_do_not_trip_the_circuit(monkeypatch):
+    from agents import metrics
+
+    model = _AsyncModel(delay=0.2)
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    monkeypatch.setenv("LLM_CONCURRENCY_REVIEW", "1")
+
+    async def run():
+        calls = (llm_client.generate_json_async("p", agent="review", timeout=0.1) for _ in range(3))
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(run()) == [None, None, None]
+    assert metrics.LLM_CALLS.value("review", "timeout") == 1
+    assert metrics.LLM_CALLS.value("review", "queue_timeout") == 2
+    snapshot = llm_client.circuit_breaker_state()
+    assert snapshot["state"] == "closed" and snapshot["window_failures"] == 1
+
+
+class _CountingModel:
+    def __init__(self, text='{"score": 5}'):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        if stream:
+            return iter([_Response("cached "), _Response("answer")])
+        return _Response(self.text)
+
+
+def test_response_cache_is_opt_in_and_keyed_by_prompt_and_payload(monkeypatch):
+    from agents import metrics
+
+    model = _CountingModel()
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    llm_client.generate_json("prompt", agent="sales")
+    llm_client.generate_json("prompt", agent="sales")
+    assert model.calls == 2
+    assert llm_client.llm_cache_stats() == {"enabled": False}
+
+    monkeypatch.setattr(llm_client, "LLM_CACHE_ENABLED", True)
+    first = llm_client.generate_json("prompt", agent="sales")
+    first["score"] = 100  # callers mutating a result must not change the cached copy
+    assert llm_client.generate_json("prompt", agent="sales") == {"score": 5}
+    assert asyncio.run(llm_client.generate_json_async("prompt", agent="sales")) == {"score": 5}
+    assert model.calls == 3
+    assert metrics.LLM_CALLS.value("sales", "cache_hit") == 2
+
+    llm_client.generate_json("prompt", {"mime_type": "application/pdf", "data": b"%PDF-1"}, agent="sales")
+    llm_client.generate_json("prompt", {"mime_type": "application/pdf", "data": b"%PDF-2"}, agent="sales")
+    assert model.calls == 5
+
+    # Text and JSON replies use different generation configs, so they never share entries.
+    model.text = "plain"
+    assert llm_client.generate_text("prompt", agent="sales") == "plain"
+    assert model.calls == 6
+    assert llm_client.llm_cache_stats()["hits"] == 2
+
+
+def test_response_cache_persists_across_processes_and_honours_agent_ttl(monkeypatch):
+    model = _CountingModel(text="answer")
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    monkeypatch.setattr(llm_client, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setenv("LLM_CACHE_TTL_SOP", "0")
+
+    assert llm_client.generate_text("q", agent="sales") == "answer"
+    llm_client._llm_caches.clear()  # a fresh worker only has the SQLite tier
+    assert asyncio.run(llm_client.generate_text_async("q", agent="sales")) == "answer"
+    assert model.calls == 1
+
+    llm_client.generate_text("q", agent="sop")
+    llm_client.generate_text("q", agent="sop")
+    assert model.calls == 3
+
+
+def test_response_cache_skips_failures_and_replays_streams(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_CACHE_ENABLED", True)
+    failing = _FailingModel()
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: failing)
+    assert llm_client.generate_text("q") is None
+    assert llm_client.generate_text("q") is None
+    assert failing.calls == 2
+
+    model = _CountingModel()
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    assert asyncio.run(_collect(llm_client.stream_text_async("q"))) == ["cached ", "answer"]
+    assert asyncio.run(_collect(llm_client.stream_text_async("q"))) == ["cached answer"]
+    assert llm_client.generate_text("q") == "cached answer"
+    assert model.calls == 1
+
+
+def test_async_paths_touch_the_response_cache_off_the_event_loop(monkeypatch):
+    import threading
+
+    monkeypatch.setattr(llm_client, "LLM_CACHE_ENABLED", True)
+    model = _CountingModel(text="answer")
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: model)
+    threads = []
+    lookup, store = llm_client._cache_lookup, llm_client._cache_store
+
+    def recording_lookup(*args):
+        threads.append(threading.get_ident())
+        return lookup(*args)
+
+    def recording_store(*args):
+        threads.append(threading.get_ident())
+        return store(*args)
+
+    monkeypatch.setattr(llm_client, "_cache_lookup", recording_lookup)
+    monkeypatch.setattr(llm_client, "_cache_store", recording_store)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await llm_client.generate_text_async("q")
+        await llm_client.generate_text_async("q")
+        await _collect(llm_client.stream_text_async("other"))
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 5
+    assert loop_thread not in threads
+    assert model.calls == 2
@@ -0,0 +1,54 @@
+import asyncio
+
+from agents import llm_client, metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Stage time.", ("agent",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "sop")
+    histogram.observe(0.1, "sop")
+    histogram.observe(5.0, "sop")
+
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{agent="sop",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{agent="sop",le="1"} 2' in text
+    assert 'stage_seconds_bucket{agent="sop",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{agent="sop"} 3' in text
+
+
+def test_stage_timer_and_counters():
+    with metrics.stage("invoice", "pdf_extract"):
+        pass
+    metrics.record_response("invoice", "deterministic")
+
+    assert metrics.STAGE_SECONDS.count("invoice", "pdf_extract") == 1
+    assert metrics.AGENT_RESPONSES.value("invoice", "deterministic") == 1
+    assert 'agent_responses_total{agent="invoice",source="deterministic"} 1' in metrics.render_metrics()
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    with metrics.stage("sop", "retrieval"):
+        pass
+    metrics.record_llm_call("sop", "success")
+
+    assert metrics.STAGE_SECONDS.count("sop", "retrieval") == 0
+    assert metrics.LLM_CALLS.value("sop", "success") == 0
+
+
+def test_llm_outcomes_are_counted(monkeypatch):
+    class SlowModel:
+        async def generate_content_async(self, contents):
+            await asyncio.sleep(1.0)
+
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: SlowModel())
+    assert asyncio.run(llm_client.generate_text_async("prompt", agent="sop", timeout=0.01)) is None
+
+    monkeypatch.setattr(llm_client, "_model", lambda response_json=False: None)
+    assert llm_client.generate_json("prompt", agent="review") is None
+
+    assert metrics.LLM_CALLS.value("sop", "timeout") == 1
+    assert metrics.LLM_CALLS.value("review", "unavailable") == 1
+    assert metrics.STAGE_SECONDS.count("sop", "llm") == 1
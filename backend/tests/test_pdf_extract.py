@@ -0,0 +1,84 @@
+import pytest
+
+from agents import pdf_extract
+
+
+def test_extract_pages_respects_page_limit(make_pdf):
+    data = make_pdf([f"Page {n}" for n in range(5)])
+    pages = pdf_extract.extract_pages(data, max_pages=3)
+    assert [page.strip() for page in pages] == ["Page 0", "Page 1", "Page 2"]
+
+
+def test_parallel_extraction_keeps_page_order(make_pdf, monkeypatch):
+    monkeypatch.setattr(pdf_extract, "PDF_WORKERS", 2)
+    monkeypatch.setattr(pdf_extract, "PDF_PARALLEL_MIN_PAGES", 2)
+    data = make_pdf([f"Section {n}" for n in range(9)])
+
+    pages = pdf_extract.extract_pages(data)
+    assert [page.strip() for page in pages] == [f"Section {n}" for n in range(9)]
+    pdf_extract.shutdown_pool()
+
+
+def test_parallel_pages_stream_a_few_batches_ahead(make_pdf, monkeypatch):
+    monkeypatch.setattr(pdf_extract, "PDF_WORKERS", 2)
+    monkeypatch.setattr(pdf_extract, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(pdf_extract, "PDF_BATCH_PAGES", 1)
+    data = make_pdf([f"Section {n}" for n in range(9)])
+
+    pool = pdf_extract._get_pool()
+    submitted = []
+    submit = pool.submit
+    monkeypatch.setattr(pool, "submit", lambda *args: submitted.append(args[2]) or submit(*args))
+
+    pages = pdf_extract.iter_pages(data)
+    assert next(pages).strip() == "Section 0"
+    assert submitted == [0, 1, 2, 3, 4]  # two batches per worker, refilled as each one is read
+    pages.close()
+    # Stopping early cancels the queued batches but keeps the shared pool.
+    assert [page.strip() for page in pdf_extract.iter_pages(data)] == [f"Section {n}" for n in range(9)]
+    assert pdf_extract._get_pool() is pool
+    pdf_extract.shutdown_pool()
+
+
+def test_iter_pages_fails_early_on_unreadable_pdf(make_pdf):
+    with pytest.raises(Exception):
+        pdf_extract.iter_pages(b"not a pdf")
+
+
+def test_retired_pool_is_stopped_only_after_its_last_user(monkeypatch):
+    import time
+
+    monkeypatch.setattr(pdf_extract, "PDF_WORKERS", 1)
+    pool = pdf_extract._acquire_pool()
+    assert pool._mp_context.get_start_method() == "spawn"
+    assert pdf_extract._acquire_pool() is pool  # a second request extracting on the same pool
+    busy = pool.submit(time.sleep, 30)
+    while not busy.running():
+        time.sleep(0.01)
+    processes = list(pool._processes.values())
+
+    pdf_extract._release_pool(pool, retire=True)
+    assert pdf_extract._get_pool() is not pool
+    assert all(process.is_alive() for process in processes)
+
+    pdf_extract._release_pool(pool)
+    for process in processes:
+        process.join(10)
+        assert not process.is_alive()
+    pdf_extract.shutdown_pool()
+
+
+def test_extraction_timeout_raises(make_pdf):
+    data = make_pdf(["one", "two"])
+    with pytest.raises(pdf_extract.PdfExtractionTimeout):
+        pdf_extract.extract_pages(data, timeout=-1)
+
+
+def test_sop_and_invoice_agents_share_extractor(make_pdf):
+    from agents import invoice_agent, sop_agent
+
+    data = make_pdf(["Escalations go to the duty manager."])
+    assert sop_agent.extract_text_from_pdf(data) == "Escalations go to the duty manager."
+    assert "duty manager" in invoice_agent._extract_text_from_pdf_bytes(data)
+    assert sop_agent.extract_text_from_pdf(b"not a pdf").startswith("Error reading PDF")
+    assert invoice_agent._extract_text_from_pdf_bytes(b"not a pdf") == ""
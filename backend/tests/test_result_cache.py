@@ -0,0 +1,74 @@
+import time
+
+from agents.result_cache import MemoryResultCache, SQLiteResultCache, TieredResultCache
+
+
+def test_hit_miss_counters_and_saved_time(tmp_path):
+    cache = SQLiteResultCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=10)
+    assert cache.get("k") is None
+    cache.set("k", {"source": "gemini", "total": 1}, compute_seconds=2.5)
+
+    assert cache.get("k") == {"source": "gemini", "total": 1}
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hits_by_source"] == {"gemini": 1}
+    assert stats["saved_seconds"] == 2.5
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = SQLiteResultCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=10)
+    cache.set("k", {"v": 1}, ttl_seconds=-1)
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SQLiteResultCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=2)
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    assert cache.get("a") == 1
+    time.sleep(0.01)
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_entries_survive_reopen(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SQLiteResultCache(path, ttl_seconds=60, max_entries=10).set("k", {"v": 1})
+    assert SQLiteResultCache(path, ttl_seconds=60, max_entries=10).get("k") == {"v": 1}
+
+
+def test_memory_cache_ttl_and_lru_eviction():
+    cache = MemoryResultCache(ttl_seconds=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    cache.set("gone", 4, ttl_seconds=-1)
+    assert cache.get("gone") is None
+    cache.delete("a")
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = SQLiteResultCache(str(tmp_path / "tier.db"), ttl_seconds=60, max_entries=10)
+    TieredResultCache(MemoryResultCache(60, 10), disk).set("k", {"v": 1})
+
+    cache = TieredResultCache(MemoryResultCache(60, 10), disk)
+    assert cache.get("k") == {"v": 1}
+    assert cache.get("k") == {"v": 1}
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert stats["memory"]["hits"] == 1
+    assert stats["disk"]["hits"] == 1
+    assert (stats["hits"], stats["misses"]) == (2, 1)
@@ -0,0 +1,21 @@
+from agents.retrieval import BM25Index
+
+
+def test_search_prefers_rare_terms_and_keeps_document_order_on_ties():
+    index = BM25Index([
+        ["policy", "training"],
+        ["escalation", "policy"],
+        ["policy", "review"],
+        ["escalation", "policy"],
+    ])
+
+    results = index.search(["escalation", "policy"], limit=2)
+    assert [chunk_id for _, chunk_id in results] == [1, 3]
+    assert index.doc_freq("policy") == 4
+
+
+def test_search_ignores_unknown_terms_and_empty_queries():
+    index = BM25Index([["alpha"], ["beta"]])
+    assert index.search(["gamma"]) == []
+    assert index.search([]) == []
+    assert BM25Index([]).search(["alpha"]) == []
@@ -1,3 +1,5 @@
+import asyncio
+
 from agents import review_agent
 
 
@@ -32,3 +34,175 @@ def test_gemini_review_path(monkeypatch):
     result = review_agent.generate_review_response("Okay service", "Luigi Pizza")
     assert result["source"] == "gemini"
     assert result["sentiment"] == "Neutral"
+
+
+def test_async_review_falls_back_to_deterministic(monkeypatch):
+    async def no_llm(*_):
+        return None
+
+    monkeypatch.setattr(review_agent, "_llm_review_response_async", no_llm)
+    result = asyncio.run(review_agent.generate_review_response_async("The food was cold and late", "Luigi Pizza"))
+    assert result["sentiment"] == "Negative"
+    assert result["source"] == "deterministic"
+
+
+def test_bulk_reviews_batch_calls_and_per_item_fallback(monkeypatch):
+    batches = []
+
+    async def fake_batch(reviews, business_name):
+        batches.append(list(reviews))
+        # The model answers only the first review of each batch.
+        return {0: {"sentiment": "Positive", "response": "Thanks!"}}
+
+    monkeypatch.setattr(review_agent, "_llm_review_batch_async", fake_batch)
+    reviews = ["Great pizza", "Food was cold", "Okay", "Rude staff", "Amazing"]
+
+    async def collect():
+        return [item async for item in review_agent.generate_review_responses_bulk_async(reviews, "Luigi", 2)]
+
+    items = sorted(asyncio.run(collect()), key=lambda item: item["index"])
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [item["source"] for item in items] == ["gemini", "deterministic", "gemini", "deterministic", "gemini"]
+    assert items[1]["sentiment"] == "Negative"
+
+
+def test_bulk_reviews_limit_batches_in_flight(monkeypatch):
+    active = peak = 0
+
+    async def fake_batch(reviews, business_name):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return {}
+
+    monkeypatch.setattr(review_agent, "_llm_review_batch_async", fake_batch)
+    monkeypatch.setattr(review_agent, "REVIEW_BULK_CONCURRENCY", 2)
+
+    async def collect():
+        return [item async for item in review_agent.generate_review_responses_bulk_async(["Okay"] * 10, "Luigi", 1)]
+
+    assert len(asyncio.run(collect())) == 10
+    assert peak == 2
+
+
+def test_llm_review_batch_discards_invalid_items(monkeypatch):
+    async def fake_json(prompt, payload=None, agent="default", timeout=None):
+        return {"results": [
+            {"id": 0, "sentiment": "Negative", "response": "Sorry."},
+            {"id": 1, "sentiment": "Angry", "response": "?"},
+            {"id": 7, "sentiment": "Positive", "response": "Out of range"},
+            "junk",
+        ]}
+
+    monkeypatch.setattr(review_agent, "generate_json_async", fake_json)
+    answered = asyncio.run(review_agent._llm_review_batch_async(["bad", "meh"], "Luigi"))
+    assert answered == {0: {"sentiment": "Negative", "response": "Sorry."}}
+
+
+def test_parse_review_csv_uses_review_column_or_first_column():
+    assert review_agent.parse_review_csv("rating,review\n5,Great\n1,\n2,Cold food\n") == ["Great", "Cold food"]
+    assert review_agent.parse_review_csv("Loved it\nToo slow\n") == ["Loved it", "Too slow"]
+
+
+def test_near_duplicate_reviews_share_cached_response(monkeypatch):
+    calls = []
+
+    def fake_json(prompt, payload=None, agent="default"):
+        calls.append(prompt)
+        return {"sentiment": "Positive", "response": "Thanks a lot!"}
+
+    monkeypatch.setattr(review_agent, "generate_json", fake_json)
+    first = review_agent.generate_review_response("Great service!!", "Luigi Pizza")
+    second = review_agent.generate_review_response("  great   SERVICE ", "Luigi Pizza")
+    other_business = review_agent.generate_review_response("Great service", "Mario Pasta")
+
+    assert first == second
+    assert first["source"] == "gemini"
+    assert other_business["source"] == "gemini"
+    assert len(calls) == 2
+    stats = review_agent.get_review_cache().stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_emoji_only_reviews_do_not_share_cached_replies(monkeypatch):
+    replies = iter([
+        {"sentiment": "Positive", "response": "So glad you loved it!"},
+        {"sentiment": "Negative", "response": "We're sorry to hear that."},
+        {"sentiment": "Negative", "response": "Sorry we let you down."},
+        {"sentiment": "Neutral", "response": "Thanks for the note."},
+        {"sentiment": "Neutral", "response": "Thanks again."},
+    ])
+    monkeypatch.setattr(review_agent, "generate_json", lambda *_, **__: next(replies))
+
+    assert review_agent.generate_review_response("😍👍", "Luigi")["sentiment"] == "Positive"
+    assert review_agent.generate_review_response("😡😡😡", "Luigi")["sentiment"] == "Negative"
+    assert review_agent.generate_review_response("😡😡😡 1/10", "Luigi")["response"] == "Sorry we let you down."
+    # Pure punctuation normalizes to nothing, so it is never cached.
+    assert review_agent._review_cache_key("!!!", "Luigi") is None
+    assert review_agent.generate_review_response("!!!", "Luigi")["response"] == "Thanks for the note."
+    assert review_agent.generate_review_response("???", "Luigi")["response"] == "Thanks again."
+
+
+def test_review_cache_disk_tier_survives_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(review_agent, "REVIEW_CACHE_PATH", str(tmp_path / "reviews.db"))
+    monkeypatch.setattr(review_agent, "generate_json", lambda *_, **__: {"sentiment": "Neutral", "response": "Noted."})
+    review_agent.generate_review_response("It was fine.", "Luigi")
+
+    # Simulate a restart: fresh memory tier, same file.
+    monkeypatch.setattr(review_agent, "_review_caches", {})
+    monkeypatch.setattr(review_agent, "generate_json", lambda *_, **__: None)
+    result = review_agent.generate_review_response("it was FINE", "Luigi")
+    assert result["source"] == "gemini"
+    assert review_agent.get_review_cache().stats()["disk"]["hits"] == 1
+
+
+def test_bulk_reviews_skip_cached_items(monkeypatch):
+    review_agent.get_review_cache().set(
+        review_agent._review_cache_key("Great pizza", "Luigi"), {"sentiment": "Positive", "response": "Cached!"}
+    )
+    batches = []
+
+    async def fake_batch(reviews, business_name):
+        batches.append(list(reviews))
+        return {}
+
+    monkeypatch.setattr(review_agent, "_llm_review_batch_async", fake_batch)
+
+    async def collect():
+        return [item async for item in review_agent.generate_review_responses_bulk_async(["great pizza!", "Cold"], "Luigi")]
+
+    items = sorted(asyncio.run(collect()), key=lambda item: item["index"])
+    assert batches == [["Cold"]]
+    assert items[0]["response"] == "Cached!"
+    assert items[1]["source"] == "deterministic"
+
+
+def test_async_paths_use_the_review_cache_off_the_event_loop(tmp_path, monkeypatch):
+    import threading
+
+    monkeypatch.setattr(review_agent, "REVIEW_CACHE_PATH", str(tmp_path / "reviews.db"))
+    cache = review_agent.get_review_cache()
+    threads = []
+    get, set_ = cache.get, cache.set
+    monkeypatch.setattr(cache, "get", lambda *args: threads.append(threading.get_ident()) or get(*args))
+    monkeypatch.setattr(cache, "set", lambda *args, **kw: threads.append(threading.get_ident()) or set_(*args, **kw))
+
+    async def fake_json(*_, **__):
+        return {"sentiment": "Neutral", "response": "Noted."}
+
+    async def fake_batch(reviews, business_name):
+        return {0: {"sentiment": "Positive", "response": "Thanks!"}}
+
+    monkeypatch.setattr(review_agent, "generate_json_async", fake_json)
+    monkeypatch.setattr(review_agent, "_llm_review_batch_async", fake_batch)
+
+    async def run():
+        await review_agent._llm_review_response_async("It was fine.", "Luigi")
+        [item async for item in review_agent.generate_review_responses_bulk_async(["It was fine.", "Great"], "Luigi")]
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 5
+    assert loop_thread not in threads
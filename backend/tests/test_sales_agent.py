@@ -1,3 +1,5 @@
+import asyncio
+
 from agents import sales_agent
 
 
@@ -60,3 +62,78 @@ def test_score_lead_gemini_path(monkeypatch):
     assert scored["source"] == "gemini"
     assert scored["lead_score"] == 88
     assert scored["status"] == "Hot"
+
+
+def test_stream_qualify_lead_deterministic(monkeypatch):
+    async def no_stream(*_):
+        return
+        yield
+
+    monkeypatch.setattr(sales_agent, "_llm_qualify_stream", no_stream)
+
+    async def collect():
+        return [event async for event in sales_agent.stream_qualify_lead_async([], "Hi")]
+
+    events = asyncio.run(collect())
+    assert [name for name, _ in events] == ["token", "done"]
+    assert "budget" in events[-1][1]["response"].lower()
+
+
+def test_stream_qualify_lead_replaces_a_broken_stream(monkeypatch):
+    async def broken_stream(*_):
+        yield "Great, what budget"
+        raise sales_agent.LLMStreamInterrupted("Great, what budget", "error")
+
+    monkeypatch.setattr(sales_agent, "_llm_qualify_stream", broken_stream)
+
+    async def collect():
+        return [event async for event in sales_agent.stream_qualify_lead_async([], "Hi")]
+
+    events = asyncio.run(collect())
+    assert [name for name, _ in events] == ["token", "done"]
+    assert events[-1][1]["interrupted"] is True
+    assert events[-1][1]["response"] == "Hi! I can help with that. " + sales_agent.FOLLOW_UP_MAP["budget"]
+
+
+def test_lead_extraction_state_only_scans_new_messages(monkeypatch):
+    seen = []
+    original = sales_agent._extract_budget
+
+    def counting_budget(text):
+        seen.append(text)
+        return original(text)
+
+    monkeypatch.setattr(sales_agent, "_extract_budget", counting_budget)
+
+    history = [{"role": "user", "content": "Looking in Austin"}]
+    state = sales_agent.LeadExtractionState().update(history)
+    history += [{"role": "assistant", "content": "Budget?"}, {"role": "user", "content": "$250000"}]
+    state.update(history)
+
+    assert seen.count("Looking in Austin") == 1
+    assert state.budget == "$250,000"
+    assert state.processed == 3
+
+
+def test_lead_extraction_state_round_trips_and_recovers_from_shorter_history():
+    state = sales_agent.LeadExtractionState(budget="$5,000", processed=4)
+    restored = sales_agent.LeadExtractionState.from_dict(state.to_dict())
+    assert restored.to_dict() == state.to_dict()
+
+    restored.update([{"role": "user", "content": "next week"}])
+    assert restored.budget is None
+    assert restored.timeline == "Next week"
+    assert sales_agent.LeadExtractionState.from_dict({"budget": 5, "processed": "x"}).to_dict()["processed"] == 0
+
+
+def test_qualify_lead_with_state_matches_stateless_result(monkeypatch):
+    monkeypatch.setattr(sales_agent, "_llm_qualify_response", lambda *_: None)
+    state = sales_agent.LeadExtractionState()
+    history = []
+    for message in ["My budget is $400000", "Downtown Manhattan", "next week", "+1 555 555 1212"]:
+        with_state = sales_agent.qualify_lead(history, message, state)
+        assert with_state == sales_agent.qualify_lead(history, message)
+        history += [{"role": "user", "content": message}, {"role": "assistant", "content": with_state}]
+
+    assert "qualified" in with_state.lower()
+    assert state.is_complete()
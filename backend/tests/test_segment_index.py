@@ -0,0 +1,40 @@
+import pytest
+
+from agents.chunker import Chunk
+from agents.segment_index import Segment, write_segment
+
+
+def test_segment_round_trip(tmp_path):
+    path = str(tmp_path / "doc.seg")
+    texts = ["Refunds need approval.", "Escalate outages to on-call.", "Café refunds refunds"]
+    chunks = [Chunk(texts[0], 1, 0, 22), Chunk(texts[1], 1, 23, 51), Chunk(texts[2], 2, 4, 24)]
+    tokenized = [["refunds", "need", "approval"], ["escalate", "outages", "call"], ["café", "refunds", "refunds"]]
+    assert write_segment(path, chunks, tokenized) == 9
+
+    segment = Segment(path)
+    assert (segment.chunk_count, segment.term_count, segment.total_tokens) == (3, 7, 9)
+    assert segment.doc_freq("refunds") == 2
+    assert [list(part) for part in segment.postings("refunds")] == [[0, 2], [1, 2]]
+    assert segment.doc_freq("café") == 1
+    assert segment.postings("missing") == ((), ())
+    assert segment.chunk_text(2) == "Café refunds refunds"
+    assert segment.chunk_length(1) == 3
+    assert segment.chunk_span(1) == (1, 23, 51)
+    assert segment.chunk_span(2) == (2, 4, 24)
+    segment.close()
+
+
+def test_empty_segment_and_bad_file(tmp_path):
+    path = str(tmp_path / "empty.seg")
+    write_segment(path, [], [])
+    segment = Segment(path)
+    assert segment.chunk_count == 0 and segment.doc_freq("anything") == 0
+    segment.close()
+
+    bogus = tmp_path / "bogus.seg"
+    bogus.write_bytes(b"x" * 128)
+    with pytest.raises(ValueError):
+        Segment(str(bogus))
+    bogus.write_bytes(b"short")
+    with pytest.raises(ValueError):
+        Segment(str(bogus))
@@ -0,0 +1,35 @@
+from agents.result_cache import MemoryResultCache, SQLiteResultCache
+from agents.session_store import SalesSessionStore
+
+
+def test_session_round_trip_and_delete():
+    store = SalesSessionStore(MemoryResultCache(ttl_seconds=60, max_entries=10))
+    session_id = store.create()
+    assert store.load(session_id) == {"history": [], "lead_state": None}
+
+    store.save(session_id, [{"role": "user", "content": "Hi"}], {"budget": "$5,000", "processed": 1})
+    assert store.load(session_id)["lead_state"]["budget"] == "$5,000"
+
+    store.delete(session_id)
+    assert store.load(session_id) is None
+
+
+def test_sessions_expire_and_are_capped():
+    store = SalesSessionStore(MemoryResultCache(ttl_seconds=-1, max_entries=10))
+    assert store.load(store.create()) is None
+
+    capped = SalesSessionStore(MemoryResultCache(ttl_seconds=60, max_entries=2))
+    first = capped.create()
+    capped.create()
+    capped.create()
+    assert capped.load(first) is None
+
+
+def test_sqlite_backend_is_shared_between_store_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    writer = SalesSessionStore(SQLiteResultCache(path, ttl_seconds=60, max_entries=10))
+    reader = SalesSessionStore(SQLiteResultCache(path, ttl_seconds=60, max_entries=10))
+
+    session_id = writer.create()
+    writer.save(session_id, [{"role": "user", "content": "Hi"}], None)
+    assert reader.load(session_id)["history"] == [{"role": "user", "content": "Hi"}]
@@ -1,6 +1,12 @@
+import asyncio
+
 from agents import sop_agent
 
 
+def _unreadable_pdf(_):
+    raise ValueError("broken")
+
+
 def test_best_matching_chunks_returns_relevant_text():
     doc = (
         "Onboarding requires account setup and policy training. "
@@ -13,7 +19,7 @@ def test_best_matching_chunks_returns_relevant_text():
 
 
 def test_answer_sop_question_no_matches(monkeypatch):
-    monkeypatch.setattr(sop_agent, "extract_text_from_pdf", lambda _: "Alpha beta gamma")
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Alpha beta gamma"])
     result = sop_agent.answer_sop_question(b"pdf", "What is payroll policy?")
     assert result["answer"] == "I cannot find that information in the provided document."
 
@@ -21,8 +27,8 @@ def test_answer_sop_question_no_matches(monkeypatch):
 def test_answer_sop_question_with_deterministic_fallback(monkeypatch):
     monkeypatch.setattr(
         sop_agent,
-        "extract_text_from_pdf",
-        lambda _: "Reset password by opening Settings. For MFA issues, contact admin.",
+        "extract_pages_from_pdf",
+        lambda _: ["Reset password by opening Settings. For MFA issues, contact admin."],
     )
     monkeypatch.setattr(sop_agent, "_llm_answer", lambda *_: None)
 
@@ -35,11 +41,134 @@ def test_answer_sop_question_with_deterministic_fallback(monkeypatch):
 def test_answer_sop_question_with_gemini(monkeypatch):
     monkeypatch.setattr(
         sop_agent,
-        "extract_text_from_pdf",
-        lambda _: "Reset password by opening Settings. For MFA issues, contact admin.",
+        "extract_pages_from_pdf",
+        lambda _: ["Reset password by opening Settings. For MFA issues, contact admin."],
     )
     monkeypatch.setattr(sop_agent, "_llm_answer", lambda *_: "Go to Settings and use reset password.")
 
     result = sop_agent.answer_sop_question(b"pdf", "How do I reset password?")
     assert "Settings" in result["answer"]
     assert result["source"] == "gemini"
+
+
+def test_answer_sop_question_reuses_cached_document(monkeypatch):
+    calls = []
+
+    def fake_extract(file_bytes):
+        calls.append(file_bytes)
+        return ["Reset password by opening Settings. For MFA issues, contact admin."]
+
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", fake_extract)
+    monkeypatch.setattr(sop_agent, "_llm_answer", lambda *_: None)
+
+    first = sop_agent.answer_sop_question(b"same-pdf", "How do I reset password?")
+    second = sop_agent.answer_sop_question(b"same-pdf", "Who handles MFA issues?")
+    assert len(calls) == 1
+    assert first["citations"] != second["citations"]
+
+
+def test_answer_sop_question_by_id_after_ingest(monkeypatch):
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Escalation requires manager approval."])
+    monkeypatch.setattr(sop_agent, "_llm_answer", lambda *_: None)
+
+    ingested = sop_agent.ingest_document(b"manual")
+    assert ingested["chunks"] == 1
+
+    result = sop_agent.answer_sop_question_by_id(ingested["doc_id"], "Who approves escalation?")
+    assert result["source"] == "deterministic"
+    assert sop_agent.answer_sop_question_by_id("missing", "Who approves escalation?") is None
+
+
+def test_ingest_document_does_not_cache_errors(monkeypatch):
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", _unreadable_pdf)
+    result = sop_agent.ingest_document(b"broken")
+    assert result == {"error": "Error reading PDF: broken"}
+    assert len(sop_agent.DOCUMENT_CACHE) == 0
+
+
+def test_ingest_chunks_pages_as_they_are_extracted(monkeypatch):
+    def damaged_pdf(_):
+        yield "Refunds need a receipt."
+        raise ValueError("page 2 is damaged")
+
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", damaged_pdf)
+    result = sop_agent.ingest_document(b"damaged")
+    assert result == {"error": "Error reading PDF: page 2 is damaged"}
+    assert len(sop_agent.DOCUMENT_CACHE) == 0
+
+
+async def _no_stream(*_):
+    return
+    yield
+
+
+def _collect_events(stream):
+    async def collect():
+        return [event async for event in stream]
+
+    return asyncio.run(collect())
+
+
+def test_stream_sop_question_deterministic_uses_same_protocol(monkeypatch):
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Reset password by opening Settings."])
+    monkeypatch.setattr(sop_agent, "_llm_answer_stream", _no_stream)
+
+    events = _collect_events(sop_agent.stream_sop_question_async("How do I reset password?", file_bytes=b"pdf"))
+    assert [name for name, _ in events] == ["citations", "token", "done"]
+    assert events[0][1]["citations"] == ["Reset password by opening Settings."]
+    assert events[0][1]["locations"] == [{"page": 1, "start": 0, "end": 35}]
+    assert events[-1][1]["source"] == "deterministic"
+    assert events[1][1]["text"] == events[-1][1]["answer"]
+
+
+def test_stream_sop_question_forwards_llm_tokens(monkeypatch):
+    async def fake_stream(*_):
+        for text in ["Open ", "Settings."]:
+            yield text
+
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Reset password by opening Settings."])
+    monkeypatch.setattr(sop_agent, "_llm_answer_stream", fake_stream)
+
+    events = _collect_events(sop_agent.stream_sop_question_async("How do I reset password?", file_bytes=b"pdf"))
+    assert [data["text"] for name, data in events if name == "token"] == ["Open ", "Settings."]
+    assert events[-1] == ("done", {
+        "answer": "Open Settings.",
+        "citations": ["Reset password by opening Settings."],
+        "locations": [{"page": 1, "start": 0, "end": 35}],
+        "source": "gemini",
+    })
+
+
+def test_stream_sop_question_unknown_doc_id():
+    events = _collect_events(sop_agent.stream_sop_question_async("Anything?", doc_id="missing"))
+    assert events[0][0] == "error"
+
+
+def test_answer_cites_page_and_offsets(monkeypatch):
+    pages = [
+        "Onboarding requires account setup.",
+        "Intro text. Escalation requires manager approval.",
+    ]
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: list(pages))
+    monkeypatch.setattr(sop_agent, "generate_text", lambda *_, **__: None)
+
+    result = sop_agent.answer_sop_question(b"paged", "Who approves escalation?")
+    assert result["citations"] == ["Escalation requires manager approval."]
+    location = result["locations"][0]
+    assert location["page"] == 2
+    assert pages[1][location["start"]:location["end"]] == result["citations"][0]
+
+
+def test_stream_sop_question_falls_back_when_stream_breaks(monkeypatch):
+    async def broken_stream(*_):
+        yield "Open "
+        raise sop_agent.LLMStreamInterrupted("Open ", "timeout")
+
+    monkeypatch.setattr(sop_agent, "extract_pages_from_pdf", lambda _: ["Reset password by opening Settings."])
+    monkeypatch.setattr(sop_agent, "_llm_answer_stream", broken_stream)
+
+    events = _collect_events(sop_agent.stream_sop_question_async("How do I reset password?", file_bytes=b"pdf"))
+    assert [name for name, _ in events] == ["citations", "token", "done"]
+    done = events[-1][1]
+    assert done["source"] == "deterministic" and done["interrupted"] is True
+    assert "Reset password by opening Settings." in done["answer"]
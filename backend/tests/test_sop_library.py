@@ -0,0 +1,148 @@
+import pytest
+
+from agents import sop_library, sop_text
+from agents.chunker import iter_page_chunks
+from agents.retrieval import BM25Index
+from agents.sop_library import SOPLibrary
+
+# Each entry is one page with a single sentence, so it becomes exactly one chunk.
+REFUNDS = [
+    "Refunds above 500 dollars are approved by the finance lead.",
+    "Refund requests must include the original receipt.",
+]
+OUTAGES = [
+    "During an outage page the on-call engineer.",
+    "Post-incident reviews happen within two days of an outage.",
+    "Approved refunds are paid within ten days.",
+]
+
+
+def _unreadable_pdf(_):
+    raise ValueError("broken")
+
+
+def test_search_spans_documents_and_matches_a_combined_index(tmp_path):
+    library = SOPLibrary(str(tmp_path / "lib"))
+    library.add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))
+    library.add("outages", "Outages.pdf", iter_page_chunks(OUTAGES))
+
+    hits = library.search("Which refunds need the finance lead?", limit=3)
+    assert {hit["doc_id"] for hit in hits} == {"refunds", "outages"}
+    assert hits[0]["document"] == "Refunds.pdf"
+    assert hits[0]["text"] == REFUNDS[0]
+    assert (hits[0]["page"], hits[0]["start"], hits[0]["end"]) == (1, 0, len(REFUNDS[0]))
+
+    # Per-document segments must rank exactly like one index over the whole corpus.
+    corpus = REFUNDS + OUTAGES
+    combined = BM25Index(sop_text.tokenize(chunk) for chunk in corpus)
+    expected = combined.search(sop_text.tokenize("Which refunds need the finance lead?"), limit=3)
+    assert [hit["text"] for hit in hits] == [corpus[chunk_id] for _, chunk_id in expected]
+    assert [hit["score"] for hit in hits] == [round(score, 4) for score, _ in expected]
+
+
+def test_incremental_add_and_remove_are_seen_by_other_workers(tmp_path):
+    directory = str(tmp_path / "lib")
+    writer, reader = SOPLibrary(directory), SOPLibrary(directory)
+    info, added = writer.add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))
+    assert added and info["chunks"] == 2
+    assert writer.add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))[1] is False
+
+    assert reader.search("receipt")[0]["doc_id"] == "refunds"
+    writer.add("outages", "Outages.pdf", iter_page_chunks(OUTAGES))
+    assert reader.search("outage")[0]["doc_id"] == "outages"
+
+    assert writer.remove("refunds")
+    assert not writer.remove("refunds")
+    assert reader.search("receipt") == []
+    assert [doc["doc_id"] for doc in reader.documents()] == ["outages"]
+    assert not (tmp_path / "lib" / "refunds.seg").exists()
+    reader.close()
+
+    reopened = SOPLibrary(directory)
+    assert len(reopened) == 1 and reopened.search("outage")[0]["document"] == "Outages.pdf"
+
+
+def test_removal_does_not_break_searches_on_an_older_view(tmp_path):
+    directory = str(tmp_path / "lib")
+    writer, reader = SOPLibrary(directory), SOPLibrary(directory)
+    writer.add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))
+    old_view = reader._current_view()
+
+    writer.remove("refunds")
+    assert reader._current_view() == []
+    # A search that started before the refresh keeps reading its own view.
+    chunk_ids, _ = old_view[0][2].postings("receipt")
+    assert list(chunk_ids) == [1]
+    assert old_view[0][2].chunk_text(1) == REFUNDS[1]
+    reader.close()
+
+
+def test_answer_library_question_cites_each_document(monkeypatch):
+    monkeypatch.setattr(sop_library, "extract_pages_from_pdf", lambda _: [" ".join(REFUNDS)])
+    first = sop_library.add_library_document(b"%PDF refunds", "Refunds.pdf")
+    assert first["added"] is True
+    assert sop_library.add_library_document(b"%PDF refunds", "Refunds.pdf")["added"] is False
+
+    monkeypatch.setattr(sop_library, "extract_pages_from_pdf", _unreadable_pdf)
+    assert "error" in sop_library.add_library_document(b"%PDF other", "Broken.pdf")
+
+    monkeypatch.setattr(sop_library, "generate_text", lambda *_, **__: None)
+    result = sop_library.answer_library_question("Who approves refunds?")
+    assert result["source"] == "deterministic"
+    assert result["citations"][0]["document"] == "Refunds.pdf"
+    assert "[Refunds.pdf]" in result["answer"]
+
+    empty = sop_library.answer_library_question("zebra migration")
+    assert empty == {"answer": sop_library.LIBRARY_NOT_FOUND_ANSWER, "citations": []}
+
+
+@pytest.mark.parametrize("llm_reply, source", [("The finance lead.", "gemini"), (None, "deterministic")])
+def test_answer_library_question_async(monkeypatch, llm_reply, source):
+    import asyncio
+
+    sop_library.get_sop_library().add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))
+
+    async def fake_llm(*_, **__):
+        return llm_reply
+
+    monkeypatch.setattr(sop_library, "generate_text_async", fake_llm)
+    result = asyncio.run(sop_library.answer_library_question_async("Who approves refunds?"))
+    assert result["source"] == source
+    assert result["citations"][0]["doc_id"] == "refunds"
+
+
+def test_async_library_search_runs_off_the_event_loop(monkeypatch):
+    import asyncio
+    import threading
+
+    threads = []
+    matches = sop_library._library_matches
+
+    def recording_matches(question):
+        threads.append(threading.get_ident())
+        return matches(question)
+
+    async def run():
+        await sop_library.answer_library_question_async("zebra migration")
+        return threading.get_ident()
+
+    monkeypatch.setattr(sop_library, "_library_matches", recording_matches)
+    loop_thread = asyncio.run(run())
+    assert threads and loop_thread not in threads
+
+
+def test_unreadable_segments_are_reindexed_on_add(tmp_path):
+    directory = tmp_path / "lib"
+    library = SOPLibrary(str(directory))
+    library.add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))
+    (directory / "refunds.seg").write_bytes(b"not a segment")
+
+    reader = SOPLibrary(str(directory))
+    assert reader.search("receipt") == []
+    assert reader.indexed("refunds") is None
+
+    info, added = reader.add("refunds", "Refunds.pdf", iter_page_chunks(REFUNDS))
+    assert added and info["chunks"] == 2
+    assert [doc["doc_id"] for doc in reader.documents()] == ["refunds"]
+    assert reader.search("receipt")[0]["doc_id"] == "refunds"
+    reader.close()
@@ -0,0 +1,16 @@
+import threading
+
+from agents.sqlite_utils import ThreadLocalConnections
+
+
+def test_connections_are_per_thread_and_use_wal(tmp_path):
+    connections = ThreadLocalConnections(str(tmp_path / "data.db"))
+    conn = connections.get()
+    assert connections.get() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections.get()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+# Generous enough for slow CI machines; importing main currently takes well under half of this.
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "2.0"))
+
+HEAVY_MODULES = ["google.generativeai", "pypdf", "dotenv", "firebase_admin"]
+
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _import_main():
+    env = {**os.environ, "GEMINI_API_KEY": "", "GEMINI_API_KEY_2": ""}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_heavy_sdks_are_not_imported_at_startup():
+    loaded = _import_main()["loaded"]
+    # python-dotenv is only imported when there is a .env file to load.
+    if any((directory / ".env").is_file() for directory in [BACKEND_DIR / "agents", *(BACKEND_DIR / "agents").parents]):
+        loaded = [module for module in loaded if module != "dotenv"]
+    assert loaded == []
+
+
+def test_import_time_budget():
+    # Best of three so a single scheduling hiccup does not fail the run.
+    seconds = min(_import_main()["seconds"] for _ in range(3))
+    assert seconds < IMPORT_TIME_BUDGET_SECONDS, f"import main took {seconds:.2f}s"
+
+
+def test_warm_up_loads_pdf_support(tmp_path, monkeypatch):
+    from agents import lead_store, pdf_extract, session_store, warmup
+
+    monkeypatch.setattr(lead_store, "LEADS_DB_PATH", str(tmp_path / "leads.db"))
+    monkeypatch.setattr(lead_store, "LEADS_JSON_PATH", str(tmp_path / "leads_db.json"))
+    monkeypatch.setattr(session_store, "SALES_SESSION_BACKEND", "memory")
+    timings = warmup.warm_up()
+    assert set(timings) >= {"pypdf", "gemini_models", "invoice_cache", "lead_store"}
+    assert pdf_extract.PdfReader is not pdf_extract._NOT_LOADED
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+
+from agents import sop_agent, uploads
+
+
+class _FakeUploadFile:
+    def __init__(self, data, filename="doc.pdf", size=None):
+        self._buffer = io.BytesIO(data)
+        self.filename = filename
+        self.content_type = "application/pdf"
+        self.size = size
+        self.reads = 0
+
+    async def read(self, size=-1):
+        self.reads += 1
+        return self._buffer.read(size)
+
+
+def test_small_upload_stays_in_memory(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 4)
+    upload = asyncio.run(uploads.spool_upload(_FakeUploadFile(b"%PDF-1.4 tiny")))
+    assert upload.path is None
+    assert upload.source == b"%PDF-1.4 tiny"
+    assert upload.sha256 == hashlib.sha256(b"%PDF-1.4 tiny").hexdigest()
+    assert upload.head(4) == b"%PDF"
+
+
+def test_large_upload_spools_to_temp_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(uploads, "UPLOAD_MEMORY_MAX_BYTES", 2048)
+    monkeypatch.setattr(uploads, "UPLOAD_TMP_DIR", str(tmp_path))
+    data = os.urandom(10_000)
+
+    with asyncio.run(uploads.spool_upload(_FakeUploadFile(data))) as upload:
+        assert upload.path is not None and upload.source == upload.path
+        assert upload.size == len(data)
+        assert upload.sha256 == hashlib.sha256(data).hexdigest()
+        assert upload.read_bytes() == data
+        path = upload.path
+    assert not os.path.exists(path)
+
+
+def test_oversized_upload_is_rejected_early(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 100)
+    monkeypatch.setattr(uploads, "UPLOAD_MEMORY_MAX_BYTES", 100)
+    monkeypatch.setattr(uploads, "UPLOAD_TMP_DIR", str(tmp_path))
+
+    streamed = _FakeUploadFile(b"x" * 10_000)
+    with pytest.raises(uploads.UploadTooLarge):
+        asyncio.run(uploads.spool_upload(streamed, max_bytes=1000))
+    assert streamed.reads <= 11
+    assert os.listdir(tmp_path) == []
+
+    declared = _FakeUploadFile(b"x" * 10, size=10_000)
+    with pytest.raises(uploads.UploadTooLarge):
+        asyncio.run(uploads.spool_upload(declared, max_bytes=1000))
+    assert declared.reads == 0
+
+
+def test_sop_document_loads_from_spooled_file(monkeypatch, tmp_path, make_pdf):
+    monkeypatch.setattr(uploads, "UPLOAD_MEMORY_MAX_BYTES", 16)
+    monkeypatch.setattr(uploads, "UPLOAD_TMP_DIR", str(tmp_path))
+    pdf = make_pdf(["Badge requests go to facilities."])
+
+    with asyncio.run(uploads.spool_upload(_FakeUploadFile(pdf))) as upload:
+        result = sop_agent.ingest_document(upload)
+    assert result["doc_id"] == hashlib.sha256(pdf).hexdigest()
+    assert sop_agent.answer_sop_question_by_id(result["doc_id"], "badge requests")["citations"]
@@ -18,18 +18,28 @@ type Lead = {
   location: string;
   status: string;
   summary: string;
+  scoring_status?: "pending" | "scored" | "failed";
 };
 
+// Leads are scored in the background after capture; poll until the score lands.
+const SCORING_POLL_INTERVAL_MS = 1000;
+const SCORING_POLL_ATTEMPTS = 30;
+
 export default function SalesDemo() {
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
   const [leads, setLeads] = useState<Lead[]>([]); // Store the full list
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const mountedRef = useRef(true);
 
   // 1. Fetch the leads when the component loads
   useEffect(() => {
+    mountedRef.current = true;
     fetchLeads();
+    return () => {
+      mountedRef.current = false;
+    };
   }, []);
 
   const fetchLeads = async () => {
@@ -42,6 +52,24 @@ export default function SalesDemo() {
     }
   };
 
+  const waitForScore = async (leadId: number) => {
+    for (let attempt = 0; attempt < SCORING_POLL_ATTEMPTS; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, SCORING_POLL_INTERVAL_MS));
+      if (!mountedRef.current) return;
+      try {
+        const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/leads/${leadId}`);
+        if (!res.ok) return;
+        const lead: Lead = await res.json();
+        if (lead.scoring_status !== "pending") {
+          await fetchLeads();
+          return;
+        }
+      } catch {
+        return;
+      }
+    }
+  };
+
   // Auto-scroll chat
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -68,9 +96,12 @@ export default function SalesDemo() {
       const data = await res.json();
       setMessages((prev) => [...prev, { role: "assistant", content: data.response }]);
 
-      // 2. IF LEAD CAPTURED: Refresh the table instantly
+      // 2. IF LEAD CAPTURED: Refresh the table instantly, then again once scoring finishes
       if (data.lead_captured) {
         await fetchLeads(); // This pulls the new sorted list
+        if (data.data?.scoring_status === "pending") {
+          waitForScore(data.lead_id);
+        }
       }
 
     } catch (error) {
@@ -180,7 +211,7 @@ export default function SalesDemo() {
                                 lead.lead_score >= 50 ? "border-yellow-500 text-yellow-700 bg-yellow-50" : 
                                 "border-gray-300 text-gray-500"
                             }`}>
-                                {lead.lead_score}
+                                {lead.scoring_status === "pending" ? "…" : lead.lead_score}
                             </div>
                         </div>
 
@@ -188,7 +219,9 @@ export default function SalesDemo() {
                         <div className="col-span-3 flex flex-col justify-center">
                             <div className="flex justify-between items-start">
                                 <span className="font-bold text-sm text-gray-800 truncate">{lead.location || "Unknown"}</span>
-                                <span className="text-[10px] bg-blue-100 text-blue-700 px-1.5 py-0.5 rounded">{lead.status}</span>
+                                <span className="text-[10px] bg-blue-100 text-blue-700 px-1.5 py-0.5 rounded">
+                                    {lead.scoring_status === "pending" ? "Scoring…" : lead.status || "Unscored"}
+                                </span>
                             </div>
                             <div className="text-xs text-gray-500 mt-1">
                                 Budget: {lead.budget || "N/A"}